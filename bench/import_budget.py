@@ -0,0 +1,62 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Measures what importing the game costs before the window can open, using `python -X importtime`,
+# and fails when it goes over budget or pulls in a module that should only load on demand.
+
+BUDGET_MS = 400  # Allowed time for importing everything main.py needs.
+FORBIDDEN = ("pandas", "shapely", "geopandas")  # Only needed when map data is rebuilt.
+
+
+# Imports `module` in a fresh interpreter and returns {module: self ms} for every module it loaded.
+def measure_imports(module: str) -> dict:
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(own) / 1000
+    return timings
+
+
+# Adds up the time of every module per top level package, e.g. all of numpy.* under numpy.
+def group_by_package(timings: dict) -> dict:
+    packages = {}
+    for name, elapsed in timings.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + elapsed
+    return packages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time of the game against a budget.")
+    parser.add_argument("--module", default="src.game", help="module main.py starts from")
+    parser.add_argument("--budget", type=float, default=BUDGET_MS, help="allowed total import time in ms")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest packages to list")
+    parser.add_argument("--repeat", type=int, default=3, help="runs to take the fastest of, the first one warms the disk cache")
+    args = parser.parse_args()
+
+    runs = [measure_imports(args.module) for _ in range(args.repeat)]
+    timings = min(runs, key=lambda run: sum(run.values()))
+    total = sum(timings.values())
+    for name, elapsed in sorted(group_by_package(timings).items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40}{elapsed:9.1f} ms")
+    print(f"{'total':<40}{total:9.1f} ms (budget {args.budget:.0f} ms)")
+
+    failed = False
+    loaded = {name.split(".")[0] for run in runs for name in run}
+    for name in FORBIDDEN:
+        if name in loaded:
+            print(f"FAIL {name} is imported at startup")
+            failed = True
+    if total > args.budget:
+        print(f"FAIL import time {total:.1f} ms is over the {args.budget:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
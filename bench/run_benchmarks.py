@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+# The benchmarks run without a window, SDL's dummy drivers must be picked before pygame starts
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+from src.adjacency import build_adjacency
+from src.dice import Dice
+from src.game import Game
+from src.geo import World
+from src.rng import DiceStream
+
+BASELINE_PATH = "bench/baseline.json"  # Results the current run is compared against.
+
+
+# Runs `function` `repeat` times and returns its timings in milliseconds.
+def time_it(function, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": statistics.median(timings), "min_ms": min(timings), "runs": repeat}
+
+
+def run_benchmarks(repeat: int, hit_tests: int, battles: int) -> dict:
+    pygame.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((1600, 1200))
+    game = Game(screen, pygame.time.Clock(), pygame.Vector2(1600, 1200))
+    world = game.world
+    results = {}
+
+    def load_map():
+        loaded = World.__new__(World)
+        loaded.read_geo_data()
+        loaded.countries = loaded.create_countries()
+
+    results["load_map"] = time_it(load_map, repeat)
+    results["create_neighbours"] = time_it(world.create_neighbours, repeat)
+    results["build_adjacency_cold"] = time_it(lambda: build_adjacency(world.countries), max(1, repeat // 5))
+
+    # Hit-testing at random positions inside the map, with every country counted as on screen
+    rng = random.Random(0)
+    min_x = min(country.bbox[0] for country in world.countries.values())
+    min_y = min(country.bbox[1] for country in world.countries.values())
+    max_x = max(country.bbox[2] for country in world.countries.values())
+    max_y = max(country.bbox[3] for country in world.countries.values())
+    positions = [pygame.Vector2(rng.uniform(min_x, max_x), rng.uniform(min_y, max_y)) for _ in range(hit_tests)]
+    world.visible_countries = set(world.countries.values())
+
+    def hit_test():
+        for position in positions:
+            world.get_country_at_pos(position)
+
+    results[f"hit_test_x{hit_tests}"] = time_it(hit_test, repeat)
+
+    # A full frame: every visible tile rasterised again and blitted to the screen
+    def full_frame():
+        world.tiles.clear()
+        world.last_scroll = None
+        world.draw(screen)
+
+    # Panning over tiles that are already cached
+    def pan_frame():
+        world.scroll.x += 10
+        world.draw(screen)
+
+    results["world_draw_full"] = time_it(full_frame, repeat)
+    results["world_draw_pan"] = time_it(pan_frame, repeat)
+    results["world_draw_idle"] = time_it(lambda: world.draw(screen), repeat)
+    results["get_navigable_countries"] = time_it(game.player.get_navigable_countries, repeat)
+
+    attackers = np.random.default_rng(0).integers(2, 30, battles)
+    defenders = np.random.default_rng(1).integers(1, 30, battles)
+    results[f"dice_battles_x{battles}"] = time_it(lambda: Dice.battles(attackers, defenders), repeat)
+
+    # The same battles one at a time, the way blitzes and searches fight them, on a seeded stream
+    stream = DiceStream(0)
+    battle_pairs = list(zip(attackers.tolist(), defenders.tolist()))
+    results[f"dice_battle_single_x{battles}"] = time_it(
+        lambda: [Dice.battle(attacking, defending, stream) for attacking, defending in battle_pairs], repeat
+    )
+
+    world.close()
+    pygame.quit()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "countries": len(world.countries),
+        },
+        "benchmarks": results,
+    }
+
+
+# Returns the benchmarks that got slower than the baseline by more than `tolerance` (0.25 = 25%).
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if previous is None or previous["median_ms"] <= 0:
+            continue
+        ratio = result["median_ms"] / previous["median_ms"]
+        if ratio > 1 + tolerance:
+            regressions.append((name, previous["median_ms"], result["median_ms"], ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the load, hit-test, render and rules paths headlessly.")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per benchmark, the median is reported")
+    parser.add_argument("--hit-tests", type=int, default=1000, help="random mouse positions per hit-test run")
+    parser.add_argument("--battles", type=int, default=10000, help="battles per Dice.battles run")
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeat, args.hit_tests, args.battles)
+    for name, result in results["benchmarks"].items():
+        print(f"{name:<28}{result['median_ms']:10.3f} ms  (min {result['min_ms']:.3f})")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        sys.exit(0)
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for name, before, after, ratio in regressions:
+        print(f"REGRESSION {name}: {before:.3f} ms -> {after:.3f} ms ({ratio:.2f}x)")
+    sys.exit(1 if regressions else 0)
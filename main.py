@@ -1,31 +1,83 @@
+import argparse
+import logging
 import pygame as pygame
 import sys
+from src.ai import STRATEGIES
+from src.client import ThreadedClient
 from src.game import Game
+from src.profiler import FrameProfiler
 
-# Initialize the pygame modules
-pygame.init()
-pygame.mixer.init()
-pygame.font.init()
+# Everything runs under the main guard: mcts opponents search in spawned worker processes,
+# which import this module again
+if __name__ == "__main__":
+    # Read the command line options
+    parser = argparse.ArgumentParser(description="Risk")
+    parser.add_argument("--profile", action="store_true", help="show per-frame timings in an overlay")
+    parser.add_argument("--profile-out", help="write the recorded frame timings to this .csv or .json file on exit")
+    parser.add_argument("--ai", type=int, default=0, help="number of computer opponents")
+    parser.add_argument("--ai-strategy", default="greedy", choices=sorted(STRATEGIES), help="how the computer opponents play")
+    parser.add_argument("--ai-workers", type=int, default=1, help="processes every mcts opponent searches with")
+    parser.add_argument("--humans", type=int, default=1, help="number of human players sharing the mouse")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the starting units, dice and computer players")
+    parser.add_argument("--log", help="record the game to this file, replay it with python -m src.gamelog")
+    parser.add_argument("--serve", metavar="HOST:PORT", help="host online matches instead of playing, see src/server.py")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="play an online match on this server")
+    parser.add_argument("--match", default="risk", help="name of the online match to join or create")
+    parser.add_argument("--players", type=int, default=2, help="players of an online match created by joining it")
+    parser.add_argument("--name", default="player", help="your name in online matches")
+    parser.add_argument("--log-level", default="WARNING", help="logging level, e.g. DEBUG or INFO")
+    args = parser.parse_args()
 
-# Define the dimensions of the window
-WIDTH = 1600
-HEIGHT = 1200
-window_size = pygame.Vector2(WIDTH, HEIGHT)
+    # Debug output goes through logging so it costs almost nothing unless it is switched on
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
 
-# Create the screen surface
-screen = pygame.display.set_mode((WIDTH, HEIGHT))  # window_size should be a tuple here
-# Initialize the clock
-clock = pygame.time.Clock()
+    # A server needs no window, it runs until interrupted
+    if args.serve:
+        from src.geo import World
+        from src.server import run_server
 
-# Set the caption of the window
-pygame.display.set_caption("Risk")
+        host, port = args.serve.rsplit(":", 1)
+        run_server(host, int(port), World.ADJACENCY_PATH, seed=args.seed)
+        sys.exit()
 
-# Now that everything is initialized, create a Game object
-game = Game(screen, clock, window_size)
+    # Initialize the pygame modules
+    pygame.init()
+    pygame.mixer.init()
+    pygame.font.init()
 
-# Run the game loop
-game.run()
+    # Define the dimensions of the window
+    WIDTH = 1600
+    HEIGHT = 1200
+    window_size = pygame.Vector2(WIDTH, HEIGHT)
 
-# Quit the game and exit
-pygame.quit()
-sys.exit()
+    # Create the screen surface
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))  # window_size should be a tuple here
+    # Initialize the clock
+    clock = pygame.time.Clock()
+
+    # Set the caption of the window
+    pygame.display.set_caption("Risk")
+
+    # Now that everything is initialized, create a Game object
+    profiler = FrameProfiler(enabled=args.profile or args.profile_out is not None, show_overlay=args.profile)
+    client = None
+    if args.connect:
+        host, port = args.connect.rsplit(":", 1)
+        client = ThreadedClient(host, int(port), args.match, args.players, args.name)
+    game = Game(
+        screen, clock, window_size, profiler,
+        num_ai=args.ai, ai_strategy=args.ai_strategy, ai_workers=args.ai_workers, num_humans=args.humans,
+        seed=args.seed, log_path=args.log, client=client,
+    )
+
+    # Run the game loop
+    game.run()
+    game.close()  # Stops the background tile rendering and computer players before pygame shuts down.
+
+    # Save the frame timings if they were asked for
+    if args.profile_out:
+        profiler.dump(args.profile_out)
+
+    # Quit the game and exit
+    pygame.quit()
+    sys.exit()
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+
+# Bump this when the way borders are computed changes so old cache files get rebuilt.
+ADJACENCY_VERSION = 1
+
+# Hand-coded sea and strait links between countries whose polygons do not touch.
+# Links are made symmetric when the graph is built, and names missing from the map are skipped.
+SEA_LINKS = {
+    "United States of America": ["Canada", "Mexico"],
+    "Canada": ["United States of America"],
+    "Mexico": ["United States of America", "Belize", "Guatemala"],
+    "Belize": ["Mexico", "Guatemala"],
+    "Guatemala": ["Mexico", "Belize", "Honduras", "El Salvador"],
+    "Honduras": ["Guatemala", "El Salvador", "Nicaragua"],
+    "El Salvador": ["Guatemala", "Honduras"],
+    "Nicaragua": ["Honduras", "Costa Rica"],
+    "Costa Rica": ["Nicaragua", "Panama"],
+    "Panama": ["Costa Rica"],
+    "Cuba": ["Haiti", "Jamaica", "The Bahamas"],
+    "Haiti": ["Dominican Republic", "Cuba"],
+    "Dominican Republic": ["Haiti"],
+    "Jamaica": ["Cuba"],
+    "The Bahamas": ["Cuba"],
+    "Puerto Rico": ["Dominican Republic", "United States Virgin Islands"],
+    "United States Virgin Islands": ["Puerto Rico", "British Virgin Islands"],
+    "British Virgin Islands": ["United States Virgin Islands", "Anguilla"],
+    "Anguilla": ["British Virgin Islands", "Saint Martin"],
+    "Saint Martin": ["Sint Maarten", "Anguilla", "Saint Barthelemy"],
+    "Sint Maarten": ["Saint Martin"],
+    "Saint Barthelemy": ["Saint Martin"],
+    "Antigua and Barbuda": ["Saint Kitts and Nevis", "Montserrat"],
+    "Montserrat": ["Antigua and Barbuda"],
+    "Saint Kitts and Nevis": ["Antigua and Barbuda"],
+    "Dominica": ["Guadeloupe", "Martinique"],
+    "Saint Lucia": ["Martinique", "Saint Vincent and the Grenadines"],
+    "Saint Vincent and the Grenadines": ["Saint Lucia", "Barbados"],
+    "Barbados": ["Saint Vincent and the Grenadines"],
+    "Grenada": ["Trinidad and Tobago"],
+    "Trinidad and Tobago": ["Grenada"],
+    "Aruba": ["Curaçao"],
+    "Curaçao": ["Aruba"],
+    "Greenland": ["Canada"],
+    "Cayman Islands": ["Jamaica"],
+    "Turks and Caicos Islands": ["The Bahamas"],
+    "Saint Pierre and Miquelon": ["Canada"],
+}
+
+
+# Returns a hash of the map data hash plus everything else that changes the graph.
+def get_source_hash(map_hash: str) -> str:
+    digest = hashlib.sha1(map_hash.encode("utf-8"))
+    digest.update(json.dumps(SEA_LINKS, sort_keys=True).encode("utf-8"))
+    digest.update(str(ADJACENCY_VERSION).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Finds every pair of countries whose polygons share a border and merges in the sea links.
+# `countries` maps a name to an object with a shapely `polygon` and a (min_x, min_y, max_x, max_y) `bbox`.
+def build_adjacency(countries: dict) -> dict:
+    names = list(countries)
+    neighbours = {name: set() for name in names}
+
+    # Sweep over the countries sorted by their left edge so only boxes that overlap on x are compared.
+    by_left_edge = sorted(names, key=lambda name: countries[name].bbox[0])
+    for i, name in enumerate(by_left_edge):
+        min_x, min_y, max_x, max_y = countries[name].bbox
+        for other in by_left_edge[i + 1:]:
+            o_min_x, o_min_y, o_max_x, o_max_y = countries[other].bbox
+            if o_min_x > max_x:
+                break
+            if o_min_y > max_y or o_max_y < min_y:
+                continue
+            if countries[name].polygon.intersects(countries[other].polygon):
+                neighbours[name].add(other)
+                neighbours[other].add(name)
+
+    for name, linked in SEA_LINKS.items():
+        if name not in neighbours:
+            continue
+        for other in linked:
+            if other in neighbours and other != name:
+                neighbours[name].add(other)
+                neighbours[other].add(name)
+    return neighbours
+
+
+# Writes the graph as a list of names plus neighbour index lists, keyed by the source hash.
+def save_adjacency(cache_path: str, source_hash: str, neighbours: dict) -> None:
+    names = sorted(neighbours)
+    index = {name: i for i, name in enumerate(names)}
+    data = {
+        "source_hash": source_hash,
+        "names": names,
+        "neighbours": [sorted(index[other] for other in neighbours[name]) for name in names],
+    }
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, cache_path)
+
+
+# Helper turning the stored name/index lists back into a name -> set of names mapping.
+def unpack_adjacency(data: dict) -> dict:
+    names = data["names"]
+    return {name: {names[i] for i in linked} for name, linked in zip(names, data["neighbours"])}
+
+
+# Reads a cached graph without checking which map it was built from, e.g. for headless games.
+def read_adjacency(cache_path: str) -> dict:
+    with open(cache_path, "r") as f:
+        return unpack_adjacency(json.load(f))
+
+
+# Reads a cached graph, returns None when it is missing or was built from different map data.
+def load_adjacency(cache_path: str, source_hash: str):
+    try:
+        with open(cache_path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("source_hash") != source_hash:
+        return None
+    return unpack_adjacency(data)
+
+
+# Loads the graph from the cache, building and saving it first if the map data changed.
+def load_or_build_adjacency(map_hash: str, cache_path: str, countries: dict) -> dict:
+    source_hash = get_source_hash(map_hash)
+    neighbours = load_adjacency(cache_path, source_hash)
+    if neighbours is None or set(neighbours) != set(countries):
+        neighbours = build_adjacency(countries)
+        save_adjacency(cache_path, source_hash, neighbours)
+    return neighbours
@@ -0,0 +1,404 @@
+import logging
+import math
+import multiprocessing
+import queue
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from src.odds import get_odds_table
+from src.rng import DiceStream
+from src.rules import MOVE, PLACE, Blitz, EndPhase, Move, Place
+
+# Computer players. A Strategy picks one action at a time for the current player of a GameState,
+# the AIWorker runs strategies on a background thread so the render loop never waits on them.
+
+logger = logging.getLogger(__name__)
+
+
+class Strategy:
+    # Base class of the computer players. Strategies that search should return their best action
+    # so far once time.perf_counter() passes `deadline` or `cancelled` is set.
+    name = "strategy"
+
+    def choose_action(self, state, deadline: float, cancelled: threading.Event):
+        raise NotImplementedError
+
+    # Releases worker processes and the like, called once the strategy won't be asked again.
+    def close(self) -> None:
+        pass
+
+
+class RandomStrategy(Strategy):
+    # Picks any legal action, ending the phase now and then so turns don't go on forever.
+    name = "random"
+
+    def __init__(self, rng=None, end_phase_chance: float = 0.2) -> None:
+        self.rng = rng if rng is not None else random.Random()
+        self.end_phase_chance = end_phase_chance  # Chance of ending the phase whenever that is legal.
+
+    def choose_action(self, state, deadline: float, cancelled: threading.Event):
+        actions = state.get_legal_actions()
+        if EndPhase() in actions and (len(actions) == 1 or self.rng.random() < self.end_phase_chance):
+            return EndPhase()
+        return self.rng.choice([action for action in actions if action != EndPhase()])
+
+
+class GreedyStrategy(Strategy):
+    # Reinforces the border, pulls idle units towards it and only attacks with good odds.
+    name = "greedy"
+
+    def __init__(self, min_win_probability: float = 0.6) -> None:
+        self.min_win_probability = min_win_probability  # Least chance of conquering worth a blitz.
+
+    def choose_action(self, state, deadline: float, cancelled: threading.Event):
+        if state.phase == PLACE:
+            return self.choose_placement(state)
+        if state.phase == MOVE:
+            return self.choose_move(state)
+        return self.choose_attack(state)
+
+    # Helper method returning the enemy territories next to one of ours.
+    def get_enemy_neighbours(self, state, territory: int) -> list:
+        player = state.current_player
+        return [other for other in state.board.neighbours[territory] if state.owners[other] != player]
+
+    # Puts the unit on our strongest border territory, so it can attack next.
+    def choose_placement(self, state):
+        if state.reinforcements == 0:
+            return EndPhase()
+        territories = state.get_territories(state.current_player)
+        border = [territory for territory in territories if self.get_enemy_neighbours(state, territory)]
+        return Place(max(border or territories, key=lambda territory: state.units[territory]))
+
+    # Moves the units of an interior territory to a neighbour on the border, if there is one.
+    def choose_move(self, state):
+        player = state.current_player
+        if state.moves_left > 0:
+            for source in state.get_territories(player):
+                if state.units[source] < 2 or self.get_enemy_neighbours(state, source):
+                    continue
+                for target in state.board.neighbours[source]:
+                    if state.owners[target] == player and self.get_enemy_neighbours(state, target):
+                        return Move(source, target, state.units[source] - 1)
+        return EndPhase()
+
+    # Blitzes the neighbour we are most likely to conquer, or ends the turn if no battle is worth it.
+    def choose_attack(self, state):
+        odds = get_odds_table()
+        best_action, best_probability = EndPhase(), self.min_win_probability
+        for source in state.get_territories(state.current_player):
+            if state.units[source] < 2:
+                continue
+            for target in self.get_enemy_neighbours(state, source):
+                probability = odds.get_win_probability(state.units[source], state.units[target])
+                if probability >= best_probability:
+                    best_action, best_probability = Blitz(source, target), probability
+        return best_action
+
+
+class MCTSNode:
+    # A position in the search tree. Positions are identified by their Zobrist hash, so the same
+    # position reached twice (or again next turn) shares one node. Every candidate action is an
+    # edge with its own visit count and total reward for the player to move here; an edge can lead
+    # to several children because blitzes have random outcomes.
+    __slots__ = ("player", "visits", "actions", "edge_visits", "edge_rewards", "children")
+
+    def __init__(self, state, actions: list) -> None:
+        self.player = state.current_player  # Player choosing between the actions here.
+        self.visits = 0  # Iterations that passed through this node.
+        self.actions = actions  # Candidate actions in this position.
+        self.edge_visits = [0] * len(actions)
+        self.edge_rewards = [0.0] * len(actions)
+        self.children = [{} for _ in actions]  # Per action: position hash -> node it led to.
+
+
+class MCTSStrategy(Strategy):
+    # Monte Carlo tree search over the place/move/attack phases. Each iteration walks the tree from
+    # the current position picking actions with UCB1, sampling fresh dice for every blitz, adds one
+    # new position, plays a short greedy rollout and scores it by territory and unit share.
+    # The search stops at `iterations` or the deadline, whichever comes first. With `workers` > 1
+    # independent searches run in worker processes and their root statistics are summed.
+    name = "mcts"
+    EXPLORATION = 1.0  # UCB1 exploration constant, rewards are in [0, 1].
+    PRIOR_WEIGHT = 3.0  # Bonus of the greedy action, worth this many visits' worth of reward at first.
+    ROLLOUT_TURNS = 2  # Turns played greedily past the tree before the position is scored.
+    MAX_TREE_DEPTH = 60  # Longest walk down the tree, guards against positions that repeat.
+    MAX_NODES = 200000  # The node table is cleared when it grows past this.
+    PLACE_CANDIDATES = 4  # Strongest border territories considered for every reinforcement.
+    MIN_WIN_PROBABILITY = 0.3  # Blitzes less likely to conquer than this aren't searched.
+    CANCEL_POLL_SECONDS = 0.01  # How often a parallel search checks whether it was cancelled.
+
+    def __init__(self, iterations: int = None, workers: int = 1, rng=None) -> None:
+        self.iterations = iterations  # Most iterations per decision, None for only the deadline.
+        self.workers = workers  # Processes searching in parallel for every decision.
+        self.rng = rng if rng is not None else random.Random()
+        self.dice = DiceStream(self.rng.getrandbits(64))  # Simulated battles never use up the game's own dice.
+        self.nodes = {}  # Position hash -> node, kept between decisions so the tree is reused.
+        self.rollout_strategy = GreedyStrategy()
+        self.pool = None  # Worker processes, started on the first parallel search.
+        self.futures = []  # Searches of the current parallel decision, cancelled by close.
+        self.stop_workers = None  # Event shared with the worker processes, set to end their searches early.
+
+    def choose_action(self, state, deadline: float, cancelled: threading.Event):
+        if self.workers > 1:
+            return self.choose_action_parallel(state, deadline, cancelled)
+        root = self.search(state, deadline, cancelled)
+        return root.actions[max(range(len(root.actions)), key=lambda i: root.edge_visits[i])]
+
+    # Runs iterations from `state` until the budget is used up and returns the root node.
+    def search(self, state, deadline: float, cancelled: threading.Event = None) -> MCTSNode:
+        if len(self.nodes) > self.MAX_NODES:
+            self.nodes.clear()
+        root = self.get_node(state)
+        state = state.copy()
+        state.dice = self.dice
+        iteration = 0
+        while self.iterations is None or iteration < self.iterations:
+            # Check the clock every few iterations only, it is cheap but not free
+            if iteration % 8 == 0 and (time.perf_counter() >= deadline or (cancelled is not None and cancelled.is_set())):
+                break
+            self.run_iteration(state.copy(), root)
+            iteration += 1
+        return root
+
+    def get_node(self, state) -> MCTSNode:
+        key = state.get_hash()
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = MCTSNode(state, self.get_candidate_actions(state))
+        return node
+
+    def run_iteration(self, state, root: MCTSNode) -> None:
+        path = []
+        node = root
+        for _ in range(self.MAX_TREE_DEPTH):
+            if state.get_winner() is not None:
+                break
+            index = self.select(node)
+            state.apply(node.actions[index])
+            path.append((node, index))
+            key = state.get_hash()
+            child = node.children[index].get(key)
+            if child is None:
+                # First time this outcome was seen from here: add it and stop descending
+                known = key in self.nodes
+                child = node.children[index][key] = self.get_node(state)
+                if not known:
+                    break
+            node = child
+        rewards = self.rollout(state)
+        for node, index in path:
+            node.visits += 1
+            node.edge_visits[index] += 1
+            node.edge_rewards[index] += rewards[node.player]
+
+    # UCB1: tries every action once, then balances average reward against how rarely it was tried.
+    # The greedy action, always first in the list, gets a bonus that fades as it is visited, so a
+    # short search plays like GreedyStrategy and a long one only deviates when it finds better.
+    def select(self, node: MCTSNode) -> int:
+        best_index, best_score = 0, -1.0
+        log_visits = math.log(node.visits + 1)
+        for index, visits in enumerate(node.edge_visits):
+            if visits == 0:
+                score = 2.0 + self.rng.random()  # Unvisited actions go first, in random order.
+            else:
+                score = node.edge_rewards[index] / visits + self.EXPLORATION * math.sqrt(log_visits / visits)
+            if index == 0:
+                score += self.PRIOR_WEIGHT / (visits + 1)
+            if score > best_score:
+                best_index, best_score = index, score
+        return best_index
+
+    # Plays greedily for a couple of turns and returns a reward per player.
+    def rollout(self, state) -> list:
+        last_turn = state.turn + self.ROLLOUT_TURNS
+        while state.get_winner() is None and state.turn < last_turn:
+            state.apply(self.rollout_strategy.choose_action(state, 0.0, None))
+        return self.evaluate(state)
+
+    # Scores a position: the winner gets 1, otherwise a mix of territory and unit share.
+    def evaluate(self, state) -> list:
+        winner = state.get_winner()
+        if winner is not None:
+            return [1.0 if player == winner else 0.0 for player in range(state.num_players)]
+        territories = [0] * state.num_players
+        units = [0] * state.num_players
+        for owner, count in zip(state.owners, state.units):
+            if owner >= 0:
+                territories[owner] += 1
+                units[owner] += count
+        total_territories = max(1, sum(territories))
+        total_units = max(1, sum(units))
+        return [
+            0.7 * territories[player] / total_territories + 0.3 * units[player] / total_units
+            for player in range(state.num_players)
+        ]
+
+    # The actions the search considers, far fewer than get_legal_actions: reinforcements only go to
+    # the strongest border territories, blitzes only start from the strongest neighbour and need a
+    # fair chance of winning, and moves only feed the border. The greedy choice comes first.
+    def get_candidate_actions(self, state) -> list:
+        greedy_action = self.rollout_strategy.choose_action(state, 0.0, None)
+        actions = [greedy_action]
+        actions.extend(action for action in self.get_search_actions(state) if action != greedy_action)
+        return actions
+
+    def get_search_actions(self, state) -> list:
+        player = state.current_player
+        greedy = self.rollout_strategy
+        if state.phase == PLACE:
+            if state.reinforcements == 0:
+                return [EndPhase()]
+            territories = state.get_territories(player)
+            border = [territory for territory in territories if greedy.get_enemy_neighbours(state, territory)]
+            candidates = sorted(border or territories, key=lambda territory: -state.units[territory])
+            return [Place(territory) for territory in candidates[:self.PLACE_CANDIDATES]]
+        actions = [EndPhase()]
+        if state.phase == MOVE:
+            move = greedy.choose_move(state)
+            if move != EndPhase():
+                actions.append(move)
+            return actions
+        strongest = {}  # Target -> our strongest territory next to it.
+        for source in state.get_territories(player):
+            if state.units[source] < 2:
+                continue
+            for target in greedy.get_enemy_neighbours(state, source):
+                if target not in strongest or state.units[source] > state.units[strongest[target]]:
+                    strongest[target] = source
+        odds = get_odds_table()
+        actions.extend(
+            Blitz(source, target) for target, source in strongest.items()
+            if odds.get_win_probability(state.units[source], state.units[target]) >= self.MIN_WIN_PROBABILITY
+        )
+        return actions
+
+    # Root parallel search: every worker process searches the same position with its own dice and
+    # tree, the visit counts of the root actions are added up and the most visited action wins.
+    # The workers can't see `cancelled`, so it is polled here and passed on through stop_workers;
+    # they then stop within a few iterations and the best action found so far is returned.
+    def choose_action_parallel(self, state, deadline: float, cancelled: threading.Event = None):
+        if self.pool is None:
+            context = multiprocessing.get_context("spawn")
+            self.stop_workers = context.Event()
+            self.pool = ProcessPoolExecutor(
+                self.workers, mp_context=context,
+                initializer=init_search_worker, initargs=(state.board, self.iterations, self.stop_workers),
+            )
+        self.stop_workers.clear()
+        detached = state.copy()
+        detached.board = None  # Every worker already has the board.
+        detached.dice = None  # and rolls its own dice.
+        budget = max(0.0, deadline - time.perf_counter())
+        futures = self.futures = [
+            self.pool.submit(search_in_worker, detached, budget, self.rng.getrandbits(32)) for _ in range(self.workers)
+        ]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=self.CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            if pending and cancelled is not None and cancelled.is_set():
+                self.stop_workers.set()
+                wait(pending)
+                break
+        visits = {}
+        for future in futures:
+            for action, count in future.result():
+                visits[action] = visits.get(action, 0) + count
+        return max(visits, key=visits.get)
+
+    def close(self) -> None:
+        # Python 3.8 has no shutdown(cancel_futures=True), so queued searches are cancelled here and
+        # running ones are told to stop
+        if self.pool is not None:
+            self.stop_workers.set()
+            for future in self.futures:
+                future.cancel()
+            self.pool.shutdown()
+            self.pool = None
+            self.futures = []
+
+
+_search_board = None  # Board of a search worker process.
+_search_strategy = None  # Search of a worker process, its node table is reused between decisions.
+_search_stop = None  # Event the parent process sets to end the current search early.
+
+
+def init_search_worker(board, iterations, stop) -> None:
+    global _search_board, _search_strategy, _search_stop
+    _search_board = board
+    _search_strategy = MCTSStrategy(iterations)
+    _search_stop = stop
+
+
+# Runs one search in a worker process and returns (action, visits) for every root action.
+def search_in_worker(state, budget: float, seed: int) -> list:
+    state.board = _search_board
+    _search_strategy.rng.seed(seed)
+    _search_strategy.dice = DiceStream(seed)
+    root = _search_strategy.search(state, time.perf_counter() + budget, _search_stop)
+    return list(zip(root.actions, root.edge_visits))
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (RandomStrategy, GreedyStrategy, MCTSStrategy)}  # Strategy classes by name.
+
+
+# Creates a strategy by name, strategies that make random choices draw from `rng`.
+def create_strategy(name: str, rng: random.Random = None, workers: int = 1):
+    if name == RandomStrategy.name:
+        return RandomStrategy(rng)
+    if name == MCTSStrategy.name:
+        return MCTSStrategy(workers=workers, rng=rng)
+    return STRATEGIES[name]()
+
+
+class AIWorker:
+    # Background thread running one strategy decision at a time. Jobs get a copy of the state,
+    # a deadline and their own cancel flag; results come back through a thread-safe queue as
+    # (job id, action, seconds spent). Results of cancelled or superseded jobs can be dropped by id.
+    def __init__(self) -> None:
+        self.requests = queue.Queue()  # Jobs waiting for the thread, None stops it.
+        self.results = queue.Queue()  # Finished jobs.
+        self.job_id = 0  # Id of the last job that was requested.
+        self.cancel_event = threading.Event()  # Cancel flag of the last job.
+        self.thread = threading.Thread(target=self.run, name="ai-worker", daemon=True)
+        self.thread.start()
+
+    # Queues a decision for the current player of `state` and returns the job id.
+    def request(self, strategy: Strategy, state, budget: float) -> int:
+        self.cancel()
+        self.job_id += 1
+        self.cancel_event = threading.Event()
+        self.requests.put((self.job_id, strategy, state.copy(), time.perf_counter() + budget, self.cancel_event))
+        return self.job_id
+
+    # Asks the running job to stop early, it still posts the best action it found.
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    # Returns the next finished (job id, action, seconds) or None, never blocks.
+    def poll(self):
+        try:
+            return self.results.get_nowait()
+        except queue.Empty:
+            return None
+
+    def stop(self) -> None:
+        self.cancel()
+        self.requests.put(None)
+        self.thread.join()
+
+    def run(self) -> None:
+        while True:
+            job = self.requests.get()
+            if job is None:
+                return
+            job_id, strategy, state, deadline, cancelled = job
+            start = time.perf_counter()
+            try:
+                action = strategy.choose_action(state, deadline, cancelled)
+            except Exception:
+                logger.exception("%s strategy failed", strategy.name)
+                action = None
+            self.results.put((job_id, action, time.perf_counter() - start))
@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+from src.ai import STRATEGIES, create_strategy
+from src.protocol import apply_delta, create_state, decode_message, encode_action, encode_message
+from src.rules import Board
+
+# Clients of src/server.py: GameClient speaks the protocol on an asyncio loop, ThreadedClient runs
+# one on a background thread for the pygame game, and run_bot plays a match with a computer strategy
+# (python -m src.client starts a whole set of them, e.g. to try the server out on localhost).
+
+logger = logging.getLogger(__name__)
+
+BOT_THINK_SECONDS = 0.05  # Time budget of a bot per action.
+NEVER_CANCELLED = threading.Event()
+
+
+class GameClient:
+    def __init__(self) -> None:
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, host: str, port: int) -> None:
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    def send(self, message: dict) -> None:
+        self.writer.write(encode_message(message))
+
+    def send_action(self, action) -> None:
+        self.send({"type": "action", "action": encode_action(action)})
+
+    async def join(self, match: str, players: int, name: str) -> dict:
+        self.send({"type": "join", "match": match, "players": players, "name": name})
+        return await self.receive("welcome")
+
+    # Returns the next message, or None once the server closed the connection. With `expected` set
+    # any other message type raises, errors included.
+    async def receive(self, expected: str = None):
+        line = await self.reader.readline()
+        if not line:
+            return None
+        message = decode_message(line)
+        if expected is not None and message["type"] != expected:
+            raise ConnectionError(message.get("message") or f"expected {expected}, got {message['type']}")
+        return message
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ThreadedClient:
+    # Runs a GameClient on its own thread and event loop, so the pygame loop never blocks on the
+    # network: it sends actions with send_action and picks up received messages with poll.
+    # `on_message` is called on the network thread after each message, e.g. to wake the game up.
+    def __init__(self, host: str, port: int, match: str, players: int, name: str, on_message=None) -> None:
+        self.address = (host, port)
+        self.join_request = (match, players, name)
+        self.on_message = on_message
+        self.messages = queue.Queue()  # Received messages, the welcome first.
+        self.client = GameClient()
+        self.loop = None
+        self.thread = threading.Thread(target=self.run, name="network", daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        asyncio.run(self.main())
+
+    async def main(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        try:
+            await self.client.connect(*self.address)
+            self.put(await self.client.join(*self.join_request))
+            while True:
+                message = await self.client.receive()
+                if message is None:
+                    break
+                self.put(message)
+        except (OSError, ValueError) as error:
+            self.put({"type": "error", "message": f"connection failed: {error}"})
+        self.put({"type": "closed"})
+
+    def put(self, message: dict) -> None:
+        self.messages.put(message)
+        if self.on_message is not None:
+            self.on_message()
+
+    # Waits for a message of one type, e.g. for the start of the match. Raises ConnectionError when
+    # the connection fails or closes first, or on timeout.
+    def wait_for(self, message_type: str, timeout: float = None) -> dict:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                message = self.messages.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise ConnectionError(f"no {message_type} message from the server in time") from None
+            if message["type"] == message_type:
+                return message
+            if message["type"] in ("closed", "error"):
+                raise ConnectionError(message.get("message", "the server closed the connection"))
+
+    # Returns every message received since the last call.
+    def poll(self) -> list:
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def send_action(self, action) -> None:
+        self.loop.call_soon_threadsafe(self.client.send_action, action)
+
+    def close(self) -> None:
+        if self.loop is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.client.close)
+        self.thread.join(timeout=1.0)
+
+
+# Plays one seat of a match with a computer strategy until the match is over or the connection
+# closes. Returns the winner, None if there is none.
+async def run_bot(host: str, port: int, match: str, players: int, strategy_name: str, name: str = "bot"):
+    strategy = create_strategy(strategy_name)
+    client = GameClient()
+    await client.connect(host, port)
+    try:
+        seat = (await client.join(match, players, name))["player"]
+        start = await client.receive("start")
+        state = create_state(Board.from_dict(start["board"]), start)
+        waiting = False  # True while an action is on its way and its result hasn't come back.
+        while True:
+            if state.get_winner() is not None:
+                return state.get_winner()
+            if state.current_player == seat and not waiting:
+                action = strategy.choose_action(state, time.perf_counter() + BOT_THINK_SECONDS, NEVER_CANCELLED)
+                client.send_action(action)
+                waiting = True
+            message = await client.receive()
+            if message is None:
+                return None
+            if message["type"] == "delta":
+                apply_delta(state, message)
+                waiting = False
+            elif message["type"] == "error":
+                # Our copy of the state is out of step with the server's, leave the match
+                logger.warning("%s: %s", name, message["message"])
+                return None
+    finally:
+        strategy.close()
+        client.close()
+
+
+async def run_bots(host: str, port: int, matches: int, players: int, strategy_names: list) -> list:
+    bots = [
+        run_bot(host, port, f"bots-{match}", players, strategy_names[seat % len(strategy_names)], f"bot {match}.{seat}")
+        for match in range(matches) for seat in range(players)
+    ]
+    return await asyncio.gather(*bots)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play matches on a game server with computer strategies.")
+    parser.add_argument("strategies", nargs="*", default=["greedy"], choices=sorted(STRATEGIES), help="strategies, one per seat in turn")
+    parser.add_argument("--host", default="127.0.0.1", help="server address")
+    parser.add_argument("--port", type=int, default=7777, help="server port")
+    parser.add_argument("--matches", type=int, default=1, help="matches played at the same time")
+    parser.add_argument("--players", type=int, default=2, help="players per match")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    winners = asyncio.run(run_bots(args.host, args.port, args.matches, args.players, args.strategies))
+    elapsed = time.perf_counter() - start
+    finished = sum(winner is not None for winner in winners) // args.players
+    print(f"{finished} of {args.matches} matches finished in {elapsed:.1f}s")
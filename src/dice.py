@@ -1,11 +1,70 @@
-import random
+import numpy as np
+
+from src.rng import DiceStream
+
+default_dice = DiceStream()  # Used when no stream is passed in, games pass their own to be reproducible.
+
 
 class Dice:
 
-    def attacker_dice_roll(num_dice):
+    @staticmethod
+    def attacker_dice_roll(num_dice, stream: DiceStream = None):
     # Attacker rolls up to 3 dice
-        return sorted([random.randint(1, 6) for _ in range(num_dice)], reverse=True)
+        return sorted((stream or default_dice).roll(num_dice), reverse=True)
 
-    def defender_dice_roll(num_dice):
+    @staticmethod
+    def defender_dice_roll(num_dice, stream: DiceStream = None):
     # Defender rolls up to 2 dice
-         return sorted([random.randint(1, 6) for _ in range(num_dice)], reverse=True)
+        return sorted((stream or default_dice).roll(num_dice), reverse=True)
+
+    @staticmethod
+    def fight_round(attackers: int, defenders: int, stream: DiceStream = None) -> tuple:
+    # Rolls one round with as many dice as each side may use and compares the highest pairs, ties go to
+    # the defender. Returns (attacker dice, defender dice, attacker losses, defender losses).
+        attacker_dice = Dice.attacker_dice_roll(min(3, attackers - 1), stream)
+        defender_dice = Dice.defender_dice_roll(min(2, defenders), stream)
+        attacker_losses = defender_losses = 0
+        for attacker_roll, defender_roll in zip(attacker_dice, defender_dice):
+            if attacker_roll > defender_roll:
+                defender_losses += 1
+            else:
+                attacker_losses += 1
+        return attacker_dice, defender_dice, attacker_losses, defender_losses
+
+    @staticmethod
+    def battles(attackers, defenders, rng=None) -> tuple:
+    # Fights any number of independent battles at once, each one until the defender is wiped out
+    # or the attacker is down to the single unit that has to stay behind.
+    # `attackers` and `defenders` are the units on each side, returns the survivors of both as arrays.
+        rng = rng if rng is not None else np.random.default_rng()
+        attackers = np.array(attackers, dtype=np.int64, ndmin=1)
+        defenders = np.array(defenders, dtype=np.int64, ndmin=1)
+        active = np.flatnonzero((attackers > 1) & (defenders > 0))
+        while len(active):
+            # Every battle still going rolls one round, all of them in the same numpy calls
+            num_attacker_dice = np.minimum(3, attackers[active] - 1)
+            num_defender_dice = np.minimum(2, defenders[active])
+            attacker_dice = rng.integers(1, 7, size=(len(active), 3))
+            defender_dice = rng.integers(1, 7, size=(len(active), 2))
+            # Dice a side isn't allowed to roll count as 0 so they sort to the end
+            attacker_dice[np.arange(3) >= num_attacker_dice[:, None]] = 0
+            defender_dice[np.arange(2) >= num_defender_dice[:, None]] = 0
+            attacker_dice = -np.sort(-attacker_dice, axis=1)[:, :2]
+            defender_dice = -np.sort(-defender_dice, axis=1)
+            # Highest dice are compared pairwise, ties go to the defender
+            compared = np.arange(2) < np.minimum(num_attacker_dice, num_defender_dice)[:, None]
+            attacker_wins = attacker_dice > defender_dice
+            defenders[active] -= (compared & attacker_wins).sum(axis=1)
+            attackers[active] -= (compared & ~attacker_wins).sum(axis=1)
+            active = active[(attackers[active] > 1) & (defenders[active] > 0)]
+        return attackers, defenders
+
+    @staticmethod
+    def battle(attackers: int, defenders: int, stream: DiceStream = None) -> tuple:
+    # Fights a single battle to the end, returns the (attacker, defender) survivors. One battle is only
+    # a handful of rounds, so pre-drawn dice in plain Python beat setting up the numpy arrays of battles.
+        while attackers > 1 and defenders > 0:
+            _, _, attacker_losses, defender_losses = Dice.fight_round(attackers, defenders, stream)
+            attackers -= attacker_losses
+            defenders -= defender_losses
+        return attackers, defenders
@@ -0,0 +1,42 @@
+import pygame
+
+
+class Widget:
+    # A clickable area of the screen. `is_active` decides whether it currently takes clicks,
+    # e.g. the hover panel buttons only exist while a country is hovered.
+    def __init__(self, rect: pygame.Rect, on_click, is_active=None) -> None:
+        self.rect = rect  # Screen area of the widget.
+        self.on_click = on_click  # Called with the mouse button that was pressed.
+        self.is_active = is_active  # Called without arguments, None means always active.
+
+    def accepts(self, pos: tuple) -> bool:
+        return (self.is_active is None or self.is_active()) and self.rect.collidepoint(pos)
+
+
+class EventDispatcher:
+    # Routes each mouse click exactly once: to the first active widget under the cursor, or to
+    # the map when no widget is there. Widgets registered first sit on top of later ones.
+    def __init__(self, on_map_click) -> None:
+        self.widgets = []
+        self.on_map_click = on_map_click  # Called with the screen position and button of clicks on the map.
+
+    def add_widget(self, rect: pygame.Rect, on_click, is_active=None) -> Widget:
+        widget = Widget(rect, on_click, is_active)
+        self.widgets.append(widget)
+        return widget
+
+    # Returns the widget that would take a click at a screen position, or None over the map.
+    def get_widget_at(self, pos: tuple):
+        for widget in self.widgets:
+            if widget.accepts(pos):
+                return widget
+        return None
+
+    def dispatch(self, event: pygame.event.Event) -> None:
+        if event.type != pygame.MOUSEBUTTONDOWN or event.button not in (1, 2, 3):
+            return
+        widget = self.get_widget_at(event.pos)
+        if widget is not None:
+            widget.on_click(event.button)
+        else:
+            self.on_map_click(event.pos, event.button)
@@ -1,83 +1,304 @@
+import logging  # Imports logging so debug output can be switched off at no cost.
+import time  # Imports time for the fixed simulation timestep.
+
 import pygame  # Imports the pygame library for game development.
 
 from src.geo import World  # Imports the World class from the geo module within the src package.
 from src.player import Player  # Imports the Player class from the player module within the src package.
-from src.utils import draw_text  # Imports the draw_text function from the utils module within the src package.
+from src.utils import draw_text, get_font, render_text  # Imports the text helpers from the utils module within the src package.
 from src.dice import Dice  # Imports the Dice class from the dice module within the src package.
+from src.rules import PHASES, NEUTRAL, Board, EndPhase, GameState  # Imports the headless rules engine.
+from src.profiler import FrameProfiler  # Imports the opt-in frame profiler.
+from src.events import EventDispatcher  # Imports the dispatcher routing clicks to widgets and the map.
+from src.ai import AIWorker, create_strategy  # Imports the computer player strategies and the worker they think on.
+from src.rng import GameRandom  # Imports the seeded random streams of a game.
+from src.gamelog import GameLogWriter  # Imports the append-only action log.
+from src.protocol import apply_delta, set_turn_info  # Imports the state sync of online matches.
+
+logger = logging.getLogger(__name__)  # Logger for this module, silent unless main.py enables it.
 
 
 class Game:  # Defines a new class named Game.
+    IDLE_WAIT_MS = 1000  # Longest the loop sleeps waiting for input while nothing on screen changes.
+    TICK_SECONDS = 1 / 60  # Length of one simulation step, independent of how fast frames are drawn.
+    MAX_TICKS_PER_FRAME = 5  # Simulation steps caught up at most per frame, after a stall time is dropped.
+    AI_THINK_SECONDS = 0.5  # Longest a computer player may think about one action.
+    AI_TURN_SECONDS = 5.0  # Longest a computer player may think in total during one turn.
+    AI_ACTION_DELAY = 0.15  # Pause between computer actions so they can be followed on screen.
 
-    def __init__(self, screen: pygame.Surface, clock: pygame.time.Clock, window_size: pygame.Vector2) -> None:
+    def __init__(
+        self, screen: pygame.Surface, clock: pygame.time.Clock, window_size: pygame.Vector2, profiler: FrameProfiler = None,
+        num_ai: int = 0, ai_strategy: str = "greedy", ai_workers: int = 1, num_humans: int = 1, seed: int = None,
+        log_path: str = None, client=None,
+    ) -> None:
         # The constructor for the Game class, which initializes the game state and attributes.
+        self.profiler = profiler if profiler is not None else FrameProfiler()  # Disabled unless one is passed in.
+        self.random = GameRandom(seed)  # Starting units, starting countries, dice and computer players, all from one seed.
         self.error_message = None  # A variable to store the current error message, if any.
         self.error_message_time = 0  # A variable to keep track of the time for which an error message has been displayed.
         self.screen = screen  # The pygame Surface where the game will be drawn.
         self.clock = clock  # The pygame Clock used to control the game's frame rate.
         self.window_size = window_size  # A pygame Vector2 representing the size of the game window.
-        self.font = pygame.font.SysFont(None, 24)  # Initializes the font used for drawing text.
+        self.font = get_font(None, 24)  # Gets the shared font used for drawing text.
         # The x and y coordinates for the "+" button (to be replaced with actual values).
         # self.plus_button_pos = (0, 0)
         # self.minus_button_pos = (0, 0)  # The x and y coordinates for the "-" button.
         self.playing = True  # A boolean indicating whether the game is currently being played.
         # A list of the different phases of gameplay.
-        self.phases = ["place_units", "move_units", "attack_country"]
+        self.phases = list(PHASES)
         self.phase_idx = 0  # The index of the current phase in the phases list.
         self.phase = self.phases[self.phase_idx]  # The current phase of gameplay.
-        self.phase_timer = pygame.time.get_ticks()  # Stores the current time for phase timing.
         self.world = World(self)  # Creates a new World instance associated with this game.
+        self.client = client  # src.client.ThreadedClient of an online match, None when every player is local.
+        self.seat = None  # Our player id in an online match.
+        self.action_in_flight = False  # Online, True from sending an action until the server answers it.
+        if client is not None:
+            self.join_match(client)
+        else:
+            self.create_local_game(num_ai, ai_strategy, ai_workers, num_humans)
+        # Records every action for replay, online matches are recorded by the server (src/server.py --log-dir)
+        self.log = GameLogWriter(log_path, self.state) if log_path and client is None else None
+        logger.debug("creating phase ui")  # Logs that the phase UI is being created.
+        self.create_phase_ui()  # Calls the method to create the phase UI elements.
+        # Every click is routed once, to the phase UI, the hover panel or else the country under the cursor
+        self.dispatcher = EventDispatcher(self.on_map_click)
+        self.dispatcher.add_widget(self.finish_phase_button, self.on_finish_phase_click)
+        self.dispatcher.add_widget(self.roll_dice_button, self.on_roll_dice_click)
+        self.dispatcher.add_widget(self.current_phase_rect, lambda button: None)
+        self.world.register_widgets(self.dispatcher)
+        self.redraw_needed = True  # Set whenever something on screen may have changed since the last frame.
+
+        # Computer players think on a worker thread, the simulation tick starts their decisions and applies the results
+        self.ai_worker = AIWorker() if any(player.is_ai() for player in self.players) else None
+        self.ai_job = None  # Id of the decision the worker is busy with, None when none is pending.
+        self.ai_ready_time = 0.0  # Time after which the next computer action may start.
+        self.ai_turn = None  # Turn number the per-turn thinking budget belongs to.
+        self.ai_turn_deadline = 0.0  # Time the current computer turn runs out of thinking budget.
+        self.last_tick_time = time.perf_counter()  # Time the simulation has been advanced to.
+        self.tick_time_left = 0.0  # Time not yet simulated, less than one tick.
+
+    def create_local_game(self, num_ai: int, ai_strategy: str, ai_workers: int, num_humans: int) -> None:
+        # Every player sits at this computer: the humans share the mouse and the computer players think here
+        # Maps built for other continents have no USA, the first player then starts on a random country
+        start_country = self.world.countries.get("United States of America")
+        if start_country is None:
+            start_country = self.random.sample(list(self.world.countries.values()), 1)[0]
         self.player = Player(
             name="Player 1",  # Sets the player's name. Can be replaced with any desired name.
-            country=self.world.countries.get("United States of America"),  # Sets the player's starting country.
+            country=start_country,  # Sets the player's starting country.
             world=self.world,  # References the World instance.
             color=(0, 0, 255),  # Sets the player's color to blue.
             game=self  # Provides a reference to the current game instance.
         )
-        print("creating phase ui")  # Outputs a message indicating that the phase UI is being created.
-        self.create_phase_ui()  # Calls the method to create the phase UI elements.
+        self.world.players.append(self.player)  # The first human player starts in the USA when the map has it.
+        # More human players share the mouse (hot seat), computer players follow them
+        self.world.create_players(
+            [None] * (num_humans - 1) + [create_strategy(ai_strategy, self.random.get_player_random(), ai_workers) for _ in range(num_ai)]
+        )
+        self.players = self.world.players  # Players in turn order, their position is their id in the rules engine.
+        # The rules engine holds the real game state, the world and players display it and feed it actions.
+        self.board = Board(list(self.world.countries), self.world.neighbours)
+        self.state = GameState(
+            self.board,
+            len(self.players),
+            [self.players.index(country.owner) if country.owner in self.players else NEUTRAL
+             for country in self.world.countries.values()],
+            [country.units for country in self.world.countries.values()],
+            self.random.dice,
+        )
+
+    def join_match(self, client) -> None:
+        # Sets up an online match from the server's start message. The server numbers territories by
+        # name, so ids are translated both ways; every player but us is only shown, the server runs the game
+        self.seat = client.wait_for("welcome", timeout=30)["player"]
+        logger.info("joined as player %d, waiting for the other players", self.seat + 1)
+        start = client.wait_for("start")
+        self.board = Board(list(self.world.countries), self.world.neighbours)
+        missing = [name for name in start["board"]["names"] if name not in self.board.index]
+        if missing:
+            raise ValueError(f"the server's map has countries this map doesn't: {missing[:5]}")
+        self.local_ids = [self.board.index[name] for name in start["board"]["names"]]  # Our id of every server id.
+        self.server_ids = {local: server for server, local in enumerate(self.local_ids)}  # Server id of every id of ours.
+        owners = [NEUTRAL] * len(self.board)
+        units = [0] * len(self.board)
+        for server_id, local_id in enumerate(self.local_ids):
+            owners[local_id] = start["owners"][server_id]
+            units[local_id] = start["units"][server_id]
+        self.state = GameState(self.board, start["players"], owners, units)
+        set_turn_info(self.state, start)
+        for seat in range(start["players"]):
+            country = self.world.countries[self.board.names[owners.index(seat)]]
+            self.world.players.append(Player(
+                game=self,
+                name="You" if seat == self.seat else f"Player {seat + 1}",
+                country=country,
+                world=self.world,
+                color=(0, 0, 255) if seat == self.seat else self.world.PLAYER_COLORS[seat % len(self.world.PLAYER_COLORS)],
+            ))
+        self.players = self.world.players
+        self.player = self.players[self.seat]
+        for territory in range(len(self.board)):
+            self.sync_country(territory)
+        self.phase_idx = self.state.phase
+        self.phase = self.phases[self.phase_idx]
+        # Messages arriving while the loop sleeps wake it up
+        self.network_event = pygame.event.custom_type()
+        client.on_message = lambda: pygame.event.post(pygame.event.Event(self.network_event))
+
+    def update_network(self) -> None:
+        # Mirrors the server's changes onto our state and the map
+        for message in self.client.poll():
+            if message["type"] in ("delta", "error"):
+                self.action_in_flight = False
+            if message["type"] == "delta":
+                message["territories"] = [[self.local_ids[territory], owner, units] for territory, owner, units in message["territories"]]
+                for territory in apply_delta(self.state, message):
+                    self.sync_country(territory)
+                self.phase_idx = self.state.phase
+                self.phase = self.phases[self.phase_idx]
+                self.redraw_needed = True
+            elif message["type"] == "error":
+                logger.warning("server: %s", message["message"])
+                self.error_message = message["message"]
+                self.error_message_time = pygame.time.get_ticks()
+            elif message["type"] == "closed":
+                logger.warning("lost the connection to the server")
+
+    def close(self) -> None:
+        # Stops the background threads and search processes, call before pygame is shut down
+        if self.ai_worker is not None:
+            self.ai_worker.stop()
+        for player in self.players:
+            if player.is_ai():
+                player.strategy.close()
+        if self.client is not None:
+            self.client.close()
+        if self.log is not None:
+            self.log.close()
+        self.world.close()
+
+    def get_current_player(self) -> Player:
+        # The player whose turn it is, human or computer
+        return self.players[self.state.current_player]
 
     def run(self) -> None:
         # This method contains the game loop where the game is run.
         while self.playing:  # Loops as long as the game is being played.
-            self.clock.tick(60)  # Caps the frame rate at 60 frames per second.
-            self.screen.fill((245, 245, 220))  # Fills the screen with a beige color.
-            self.events()  # Calls the method to handle user inputs and events.
+            events = pygame.event.get()
+            if not events and self.is_idle():
+                # Nothing is moving or waiting to be drawn, sleep until the next input arrives
+                event = pygame.event.wait(self.IDLE_WAIT_MS)
+                events = [event] if event.type != pygame.NOEVENT else []
+                # Nothing was simulated while asleep, so there is nothing to catch up on
+                self.last_tick_time = time.perf_counter()
+            if not events and self.is_idle():
+                continue
+            self.profiler.begin_frame()  # Starts timing the frame, does nothing unless profiling is on.
+            with self.profiler.section("events"):
+                self.events(events)  # Calls the method to handle user inputs and events.
+            with self.profiler.section("simulation"):
+                self.simulate()  # Advances the simulation by whole ticks.
             self.update()  # Calls the method to update the game state.
             self.draw()  # Calls the method to draw the game state to the screen.
-            pygame.display.update()  # Updates the display to show the new frame.
+            pygame.display.update(self.dirty_rects)  # Only pushes the parts of the screen that changed.
+            self.redraw_needed = False
+            self.profiler.end_frame()
+            self.clock.tick(60)  # Caps the frame rate at 60 frames per second.
 
+    # Returns True when a frame would look exactly like the last one
+    def is_idle(self) -> bool:
+        return not (
+            self.redraw_needed or self.world.dirty_countries or self.world.is_camera_moving() or self.is_ai_turn()
+            or (self.client is not None and not self.client.messages.empty())
+        )
+
+    def simulate(self) -> None:
+        # Runs the simulation in fixed steps for the time since the last frame, however long drawing took
+        now = time.perf_counter()
+        self.tick_time_left += now - self.last_tick_time
+        self.last_tick_time = now
+        ticks = 0
+        while self.tick_time_left >= self.TICK_SECONDS and ticks < self.MAX_TICKS_PER_FRAME:
+            self.tick()
+            self.tick_time_left -= self.TICK_SECONDS
+            ticks += 1
+        if ticks == self.MAX_TICKS_PER_FRAME:
+            self.tick_time_left = 0.0
+
+    def tick(self) -> None:
+        # One simulation step: moves the camera, picks up the server's changes and lets the computer players act
+        self.world.update_camera()
+        if self.client is not None:
+            self.update_network()
+        if self.is_ai_turn():
+            self.update_ai()
+
+    def is_ai_turn(self) -> bool:
+        return self.state.get_winner() is None and self.players[self.state.current_player].is_ai()
 
-    def events(self) -> None:
-        # This method handles user inputs and events.
+    def update_ai(self) -> None:
+        # Applies the action a computer player decided on, or asks the worker for the next one
+        now = time.perf_counter()
+        if self.ai_turn != self.state.turn:
+            self.ai_turn = self.state.turn
+            self.ai_turn_deadline = now + self.AI_TURN_SECONDS
+        result = self.ai_worker.poll()
+        while result is not None:
+            job_id, action, elapsed = result
+            if job_id == self.ai_job:
+                self.ai_job = None
+                logger.debug("%s chose %s in %.3fs", self.players[self.state.current_player].name, action, elapsed)
+                # Fall back to ending the phase if the strategy failed or its action is no longer legal
+                if action is None or not self.apply_action(action):
+                    self.apply_action(EndPhase())
+                self.ai_ready_time = now + self.AI_ACTION_DELAY
+            result = self.ai_worker.poll()
+        if self.ai_job is None and now >= self.ai_ready_time and self.is_ai_turn():
+            # Every decision gets its own budget but together they stay within the turn's budget
+            budget = max(0.01, min(self.AI_THINK_SECONDS, self.ai_turn_deadline - now))
+            player = self.players[self.state.current_player]
+            self.ai_job = self.ai_worker.request(player.strategy, self.state, budget)
+
+
+    def events(self, events: list = None) -> None:
+        # This method handles user inputs and events, by default the ones waiting in the queue.
         current_time = pygame.time.get_ticks()  # Gets the current time.
         # Loops over all the events in the event queue.
-        for event in pygame.event.get():
+        for event in events if events is not None else pygame.event.get():
             if event.type == pygame.QUIT:  # Checks if the quit event has been triggered.
                 self.playing = False  # Ends the game loop.
             elif event.type == pygame.KEYDOWN:  # Checks if a key has been pressed.
                 if event.key == pygame.K_ESCAPE:  # Checks if the key pressed is the escape key.
                     self.playing = False  # Ends the game loop.
-            elif event.type == pygame.MOUSEMOTION:  # Checks if the mouse has been moved.
-                # Changes the hover state of the roll dice button based on the mouse position.
-                if self.roll_dice_button.collidepoint(pygame.mouse.get_pos()):
-                    self.roll_dice_button_hovered = True
-                elif not self.roll_dice_button.collidepoint(pygame.mouse.get_pos()):
-                    self.roll_dice_button_hovered = False
-            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:  # Checks for a left mouse click.
-                if self.roll_dice_button.collidepoint(pygame.mouse.get_pos()):  # Checks if the roll dice button was clicked.
-                    self.player.roll_dice()  # Calls the method to roll the dice for the player.
+                elif event.key in (pygame.K_EQUALS, pygame.K_PLUS, pygame.K_KP_PLUS):  # Zooms in around the screen center.
+                    self.world.zoom_in(self.window_size / 2)
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):  # Zooms out around the screen center.
+                    self.world.zoom_out(self.window_size / 2)
+            elif event.type == pygame.MOUSEWHEEL:  # Zooms around the mouse, one step per wheel notch.
+                for _ in range(abs(event.y)):
+                    if event.y > 0:
+                        self.world.zoom_in(pygame.mouse.get_pos())
+                    else:
+                        self.world.zoom_out(pygame.mouse.get_pos())
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):  # The window was uncovered, redraw all of it.
+                self.world.last_scroll = None
+            elif event.type == pygame.MOUSEBUTTONDOWN:  # Routes the click to the widget or country under the cursor.
+                self.dispatcher.dispatch(event)
                 # elif self.plus_button.collidepoint(pygame.mouse.get_pos()):  # Checks if the "+" button was clicked.
                 #     self.player.change_unit_amount(1)  # Increases the number of units.
                 # elif self.minus_button.collidepoint(pygame.mouse.get_pos()):  # Checks if the "-" button was clicked.
                 #     self.player.change_unit_amount(-1)  # Decreases the number of units.
 
+        # Any input can change hover states, button colors or the map, so the next frame is drawn
+        self.redraw_needed = self.redraw_needed or bool(events)
+
         if current_time - self.error_message_time > 5000:  # Checks if 5 seconds have passed since the error message was shown.
             self.error_message = None  # Clears the error message.
 
     def display_error_message(self, screen: pygame.Surface) -> None:
         # Check if there's an error message to display
         if self.error_message:
-            error_surface = self.font.render(self.error_message, True, (255, 0, 0))  # Red text for error
+            error_surface = render_text(self.font, self.error_message, (255, 0, 0))  # Red text for error
             error_rect = error_surface.get_rect(center=(screen.get_width() // 2, screen.get_height() // 2 + 50))  # Position it under the roll dice button
             screen.blit(error_surface, error_rect)
 
@@ -85,37 +306,83 @@ class Game:  # Defines a new class named Game.
             pygame.time.set_timer(pygame.USEREVENT, 2000)
 
 
+    def apply_action(self, action) -> bool:
+        # Feeds an action to the rules engine and mirrors the countries it changed onto the map
+        if not self.state.is_legal(action):
+            return False
+        if self.client is not None:
+            # Online only the server applies actions, what changed comes back with its next delta.
+            # One action at a time, the next one may depend on how this one turned out
+            if self.state.current_player != self.seat or self.action_in_flight:
+                return False
+            self.action_in_flight = True
+            self.client.send_action(type(action)(*(
+                value if field == "units" else self.server_ids[value] for field, value in zip(action._fields, action)
+            )))
+            return True
+        changed = self.state.apply(action)
+        if self.log is not None:
+            self.log.write_action(action)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s changed %s, dice %s", action, [(self.board.names[t], self.state.units[t]) for t in changed], self.state.last_dice)
+        for territory in changed:
+            self.sync_country(territory)
+        self.phase_idx = self.state.phase
+        self.phase = self.phases[self.phase_idx]
+        self.redraw_needed = True  # The phase label or the hover panel may show something else now.
+        return True
+
+    def sync_country(self, territory: int) -> None:
+        # Copies the owner and units of one territory from the rules engine onto its country
+        country = self.world.countries[self.board.names[territory]]
+        owner = self.state.owners[territory]
+        if owner != NEUTRAL and country.owner is not self.players[owner]:
+            self.players[owner].transfer_ownership(country)
+        country.units = self.state.units[territory]
+
     def update(self) -> None:
-    # Record the current time to manage button press delay
-        now = pygame.time.get_ticks()
-        # Update the state of the world and player based on the current game phase
-        self.world.update()
-        self.player.update(self.phase)
+        # Update the state of the world once per frame, clicks were already handled when their events arrived
+        with self.profiler.section("world.update"):
+            self.world.update()
 
-        # Reset hover state for the finish phase button
-        self.finish_phase_button_hovered = False
-        # Check if the mouse is over the finish phase button
-        if self.finish_phase_button.collidepoint(pygame.mouse.get_pos()):
-            self.finish_phase_button_hovered = True
+        # Highlight the buttons under the mouse
+        mouse_pos = pygame.mouse.get_pos()
+        self.finish_phase_button_hovered = self.finish_phase_button.collidepoint(mouse_pos)
+        self.roll_dice_button_hovered = self.roll_dice_button.collidepoint(mouse_pos)
 
-        # If the finish phase button is hovered, check for mouse click and phase change timer
-        if self.finish_phase_button_hovered:
-            # Check if left mouse button is clicked and enough time has passed since the last phase change
-            if pygame.mouse.get_pressed()[0] and (now - self.phase_timer > 500):
-                # Reset the phase timer to the current time
-                self.phase_timer = now
-                # Move to the next phase, wrapping around if necessary
-                self.phase_idx = (self.phase_idx + 1) % len(self.phases)
-                # Update the current phase based on the new phase index
-                self.phase = self.phases[self.phase_idx]
+    def on_map_click(self, pos: tuple, button: int) -> None:
+        # Hands a click on a country to the player whose turn it is
+        country = self.world.get_country_at_screen_pos(pos)
+        if country is not None and not self.is_ai_turn():
+            with self.profiler.section("player.update"):
+                self.get_current_player().on_country_click(country, button, self.phase)
+
+    def on_finish_phase_click(self, button: int) -> None:
+        # Ask the rules engine to move to the next phase, it refuses while reinforcements are left
+        if button == 1 and not self.is_ai_turn():
+            self.apply_action(EndPhase())
+
+    def on_roll_dice_click(self, button: int) -> None:
+        # Rolls another round of the last attack
+        if button == 1 and not self.is_ai_turn() and self.phase == "attack_country":
+            self.get_current_player().roll_dice()
 
     def draw(self) -> None:
-        # Draw the world and phase UI onto the screen
-        self.world.draw(self.screen)
-        self.draw_phase_ui()
+        # Draw the world, it returns the parts of the screen it changed
+        with self.profiler.section("world.draw"):
+            self.dirty_rects = self.world.draw(self.screen)
+        # The phase UI and FPS counter sit on top of the map, restore the map under them and draw them again
+        self.world.restore(self.screen, self.ui_rect)
+        self.dirty_rects.append(self.ui_rect)
+        with self.profiler.section("draw_phase_ui"):
+            self.draw_phase_ui()
+        # The profiler overlay, only drawn when profiling is on
+        overlay_rect = self.profiler.draw_overlay(self.screen, self.font)
+        if overlay_rect is not None:
+            self.dirty_rects.append(overlay_rect)
         # Render the FPS count on the screen
-        text_surface = self.font.render(
-            f"FPS: {int(self.clock.get_fps())}", False, (255, 255, 255)
+        text_surface = render_text(
+            self.font, f"FPS: {int(self.clock.get_fps())}", (255, 255, 255), False
         )
         # Display the FPS on the screen at position (10, 10)
         self.screen.blit(text_surface, (10, 10))
@@ -141,6 +408,10 @@ class Game:  # Defines a new class named Game.
         self.roll_dice_button = self.roll_dice_image.get_rect(topleft=(10, 130))
         self.roll_dice_button_hovered = False
 
+        # Screen area covered by all the phase UI elements, redrawn every frame
+        self.ui_rect = self.current_phase_rect.unionall([self.finish_phase_button, self.roll_dice_button])
+        self.dirty_rects = []  # Screen rectangles changed by the last draw call
+
     def draw_phase_ui(self) -> None:
         #draw the phase UI elements on the screen
         self.screen.blit(self.current_phase_image, self.current_phase_rect)
@@ -148,7 +419,7 @@ class Game:  # Defines a new class named Game.
             draw_text(
                 self.screen,
                 self.font,
-                "Place",
+                f"Place ({self.state.reinforcements})",
                 (255, 255, 255),
                 self.current_phase_rect.centerx,
                 self.current_phase_rect.centery,
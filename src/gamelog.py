@@ -0,0 +1,245 @@
+import argparse
+import bisect
+import json
+import math
+import struct
+import time
+
+from src.rules import PHASES, PLACE, Attack, Blitz, Board, EndPhase, GameState, Move, Place
+
+# Append-only binary log of a game: every action with the dice it rolled, plus a snapshot of the
+# whole board every few turns. Replaying feeds the recorded dice back to the rules engine, so the
+# game plays out exactly as it did, and seeking to a turn starts from the nearest snapshot instead
+# of the first action.
+#
+# Layout, all little-endian:
+#   header   b"RISKLOG\0", u16 version, u32 length, JSON {"names": [...], "neighbours": [[ids]...]}
+#   records  u8 kind followed by the fields of that kind, see the RECORD_* formats below.
+# Only whole records are ever appended, a log cut short by a crash reads up to its last full record.
+
+MAGIC = b"RISKLOG\0"
+LOG_VERSION = 1
+SNAPSHOT_TURNS = 10  # A snapshot is written at the start of every this many turns.
+
+HEADER = struct.Struct("<8sHI")
+PLACE_RECORD, MOVE_RECORD, ATTACK_RECORD, BLITZ_RECORD, END_PHASE_RECORD, SNAPSHOT_RECORD = range(1, 7)
+RECORD_PLACE = struct.Struct("<H")  # territory
+RECORD_MOVE = struct.Struct("<HHI")  # source, target, units
+RECORD_ATTACK = struct.Struct("<HHI")  # source, target, number of dice that follow as bytes
+RECORD_END_PHASE = struct.Struct("<BBI")  # phase (index into PHASES and Game.phases), current player, turn
+RECORD_SNAPSHOT = struct.Struct("<IBBBIBH")  # turn, phase, current player, players, reinforcements, moves left, territories
+# A snapshot is followed by one owner byte (signed) and one i32 unit count per territory.
+
+
+class RecordingDice:
+    # Wraps the dice stream of a logged game and keeps every die rolled since the last take().
+    __slots__ = ("stream", "rolled")
+
+    def __init__(self, stream) -> None:
+        self.stream = stream
+        self.rolled = []
+
+    def roll(self, count: int) -> list:
+        dice = self.stream.roll(count)
+        self.rolled.extend(dice)
+        return dice
+
+    def take(self) -> list:
+        rolled, self.rolled = self.rolled, []
+        return rolled
+
+
+class ReplayDice:
+    # Dice stream that hands out the dice recorded for one action.
+    __slots__ = ("dice", "position")
+
+    def __init__(self) -> None:
+        self.dice = b""
+        self.position = 0
+
+    def load(self, dice: bytes) -> None:
+        self.dice = dice
+        self.position = 0
+
+    def roll(self, count: int) -> list:
+        position = self.position
+        if position + count > len(self.dice):
+            raise ValueError("the log holds fewer dice than the action rolls, it doesn't match the rules")
+        self.position = position + count
+        return list(self.dice[position:position + count])
+
+
+def encode_board(board: Board) -> bytes:
+    return json.dumps(board.to_dict(), separators=(",", ":")).encode()
+
+
+def encode_snapshot(state: GameState) -> bytes:
+    territories = len(state.owners)
+    return (
+        bytes((SNAPSHOT_RECORD,))
+        + RECORD_SNAPSHOT.pack(
+            state.turn, state.phase, state.current_player, state.num_players,
+            state.reinforcements, state.moves_left, territories,
+        )
+        + struct.pack(f"<{territories}b{territories}i", *state.owners, *state.units)
+    )
+
+
+class GameLogWriter:
+    # Appends the actions of one game to `path` as they are applied. Create it before the first
+    # action: it writes the header and a first snapshot, and from then on records the dice of
+    # `state` (its dice stream is wrapped, so the game must keep using the same state object).
+    def __init__(self, path: str, state: GameState, snapshot_turns: int = SNAPSHOT_TURNS) -> None:
+        self.snapshot_turns = snapshot_turns
+        self.state = state
+        self.dice = state.dice = RecordingDice(state.dice)
+        self.file = open(path, "wb")
+        board = encode_board(state.board)
+        self.file.write(HEADER.pack(MAGIC, LOG_VERSION, len(board)) + board)
+        self.file.write(encode_snapshot(state))
+
+    # Records an action right after state.apply(action) returned.
+    def write_action(self, action) -> None:
+        dice = self.dice.take()
+        if isinstance(action, Place):
+            record = bytes((PLACE_RECORD,)) + RECORD_PLACE.pack(action.territory)
+        elif isinstance(action, Move):
+            record = bytes((MOVE_RECORD,)) + RECORD_MOVE.pack(action.source, action.target, action.units)
+        elif isinstance(action, (Attack, Blitz)):
+            kind = ATTACK_RECORD if isinstance(action, Attack) else BLITZ_RECORD
+            record = bytes((kind,)) + RECORD_ATTACK.pack(action.source, action.target, len(dice)) + bytes(dice)
+        else:
+            state = self.state
+            record = bytes((END_PHASE_RECORD,)) + RECORD_END_PHASE.pack(state.phase, state.current_player, state.turn)
+            # A new turn has started: snapshot it now and then, and make the finished turn durable
+            if state.phase == PLACE and state.turn % self.snapshot_turns == 0:
+                record += encode_snapshot(state)
+        self.file.write(record)
+        if isinstance(action, EndPhase) and self.state.phase == PLACE:
+            self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class GameLog:
+    # A recorded game opened for replay. The whole file is read once and indexed by its snapshots,
+    # state_at then only replays the actions after the snapshot closest to the wanted turn.
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self.data = f.read()
+        magic, version, board_length = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a game log")
+        if version != LOG_VERSION:
+            raise ValueError(f"{path} is a version {version} game log, version {LOG_VERSION} is supported")
+        self.board = Board.from_dict(json.loads(self.data[HEADER.size:HEADER.size + board_length]))
+        self.records_offset = HEADER.size + board_length
+        self.snapshot_turns = []  # Turn of every snapshot, in file order.
+        self.snapshot_offsets = []  # Offset of every snapshot record.
+        self.end = self.records_offset  # End of the last whole record.
+        self.actions = 0  # Number of action records.
+        self.index_records()
+        if not self.snapshot_offsets:
+            raise ValueError(f"{path} was cut short before its first snapshot, it holds no game")
+
+    # Walks the records once, noting where the snapshots are and where the last whole record ends.
+    def index_records(self) -> None:
+        data = self.data
+        offset = self.records_offset
+        while offset < len(data):
+            record_end = self.get_record_end(offset)
+            if record_end > len(data):
+                break  # Cut short while it was written.
+            if data[offset] == SNAPSHOT_RECORD:
+                self.snapshot_turns.append(RECORD_SNAPSHOT.unpack_from(data, offset + 1)[0])
+                self.snapshot_offsets.append(offset)
+            else:
+                self.actions += 1
+            offset = self.end = record_end
+
+    def get_record_end(self, offset: int) -> int:
+        data = self.data
+        kind = data[offset]
+        offset += 1
+        if kind == PLACE_RECORD:
+            return offset + RECORD_PLACE.size
+        if kind == MOVE_RECORD:
+            return offset + RECORD_MOVE.size
+        if kind in (ATTACK_RECORD, BLITZ_RECORD):
+            if offset + RECORD_ATTACK.size > len(data):
+                return offset + RECORD_ATTACK.size
+            return offset + RECORD_ATTACK.size + RECORD_ATTACK.unpack_from(data, offset)[2]
+        if kind == END_PHASE_RECORD:
+            return offset + RECORD_END_PHASE.size
+        if kind == SNAPSHOT_RECORD:
+            if offset + RECORD_SNAPSHOT.size > len(data):
+                return offset + RECORD_SNAPSHOT.size
+            territories = RECORD_SNAPSHOT.unpack_from(data, offset)[6]
+            return offset + RECORD_SNAPSHOT.size + territories * 5
+        raise ValueError(f"unknown record kind {kind} at offset {offset - 1}")
+
+    def read_snapshot(self, offset: int) -> GameState:
+        turn, phase, player, num_players, reinforcements, moves_left, territories = RECORD_SNAPSHOT.unpack_from(self.data, offset + 1)
+        values = struct.unpack_from(f"<{territories}b{territories}i", self.data, offset + 1 + RECORD_SNAPSHOT.size)
+        state = GameState(self.board, num_players, values[:territories], values[territories:], ReplayDice())
+        state.turn, state.phase, state.current_player = turn, phase, player
+        state.reinforcements, state.moves_left = reinforcements, moves_left
+        return state
+
+    # Yields (offset, action, dice) for every action record from `offset` on, snapshots are skipped.
+    def iter_actions(self, offset: int = None):
+        data = self.data
+        offset = self.records_offset if offset is None else offset
+        while offset < self.end:
+            kind = data[offset]
+            record_end = self.get_record_end(offset)
+            if kind == PLACE_RECORD:
+                yield offset, Place(*RECORD_PLACE.unpack_from(data, offset + 1)), b""
+            elif kind == MOVE_RECORD:
+                yield offset, Move(*RECORD_MOVE.unpack_from(data, offset + 1)), b""
+            elif kind in (ATTACK_RECORD, BLITZ_RECORD):
+                source, target, _ = RECORD_ATTACK.unpack_from(data, offset + 1)
+                action = Attack(source, target) if kind == ATTACK_RECORD else Blitz(source, target)
+                yield offset, action, data[offset + 1 + RECORD_ATTACK.size:record_end]
+            elif kind == END_PHASE_RECORD:
+                yield offset, EndPhase(), b""
+            offset = record_end
+
+    # The state at the start of `turn`, or at the end of the log if it stops earlier.
+    def state_at(self, turn: float = math.inf) -> GameState:
+        index = max(0, bisect.bisect_right(self.snapshot_turns, turn) - 1)
+        state = self.read_snapshot(self.snapshot_offsets[index])
+        if state.turn >= turn:
+            return state
+        self.replay(state, self.snapshot_offsets[index], turn)
+        return state
+
+    # Applies the logged actions after `offset` to `state` until `turn` starts.
+    def replay(self, state: GameState, offset: int, turn: int) -> None:
+        dice = state.dice
+        for _, action, rolled in self.iter_actions(offset):
+            dice.load(rolled)
+            state.apply(action)
+            if state.turn >= turn:
+                break
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show a recorded game at any turn.")
+    parser.add_argument("log", help="game log written with --log")
+    parser.add_argument("--turn", type=int, default=None, help="turn to jump to, the end of the game by default")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    log = GameLog(args.log)
+    opened = time.perf_counter()
+    state = log.state_at(args.turn if args.turn is not None else math.inf)
+    elapsed = time.perf_counter() - opened
+    print(f"{args.log}: {log.actions} actions, {len(log.snapshot_turns)} snapshots, indexed in {(opened - start) * 1000:.1f}ms")
+    print(f"turn {state.turn}, {PHASES[state.phase]} of player {state.current_player}, reached in {elapsed * 1000:.1f}ms")
+    for player in range(state.num_players):
+        territories = state.get_territories(player)
+        print(f"  player {player}: {len(territories)} territories, {sum(state.units[t] for t in territories)} units")
+    winner = state.get_winner()
+    if winner is not None:
+        print(f"  won by player {winner}")
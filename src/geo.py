@@ -1,147 +1,518 @@
-import json
+import os
+
+import numpy as np
 import pygame
-import random
-from pandas import Series
-from shapely.geometry import Point, Polygon
 
-from src.utils import draw_text, draw_multiline_text
+from src.adjacency import load_or_build_adjacency
+from src.mapfile import load_or_compile_map
+from src.odds import get_odds_table
+from src.tiles import TileCache
+from src.utils import draw_text, draw_multiline_text, get_font, render_text
 
 
 class Country:
-    # Constructor for the Country class: Initializes a country with its name, coordinates, and other properties.
-    def __init__(self, name: str, coords: list) -> None:
+    DEFAULT_COLOR = (72, 126, 176)  # Color of countries that no player owns.
+    LABEL_HALF_SIZE = (30, 15)  # Half the width and height reserved around the center for the unit count text.
+
+    MIN_OUTLINE_SIZE = 3  # Parts smaller than this many pixels across are only filled, an outline would hide them.
+
+    # Constructor for the Country class: Initializes a country with its name, outline parts, and other properties.
+    # `parts` are (N, 2) views into the map's shared vertex buffer, largest first; an island nation or
+    # a country with exclaves has several of them.
+    def __init__(self, name: str, parts: list, index: int = 0, lods: list = None, units: int = 1, part_bboxes: list = None) -> None:
+        self.on_change = None  # Called with the country whenever something that is drawn on the map changes.
         self.name = name  # Name of the country.
+        self.index = index  # Position of the country in the map file, used to keep the drawing order stable.
         self.attack_armies = 1  # The initial number of attacking armies is set to 1.
-        self.coords = coords  # Coordinates defining the country's polygon on the map.
-        self.font = pygame.font.SysFont(None, 24)  # Font for rendering text.
-        self.polygon = Polygon(self.coords)  # Create a polygon from the coordinates.
+        self.parts = parts  # (N, 2) arrays of projected coordinates, one closed ring per part of the country.
+        self.coords = parts[0]  # Outline of the largest part, the one the label goes on.
+        self.lods = lods if lods else [parts]  # The parts at every level of detail, exact first, coarser later.
+        self.font = get_font(None, 24)  # Shared font for rendering text.
+        self._polygon = None  # Shapely polygon, only built when map geometry needs it (see the polygon property).
+        self.part_bboxes = part_bboxes if part_bboxes else [self.get_bbox(coords) for coords in parts]  # Box of each part.
+        self.part_bbox_array = np.array(self.part_bboxes, dtype=np.float64)  # The part boxes as a (P, 4) array, to cull them in one go.
+        self.bbox = self.get_union_bbox()  # Bounding box used to cheaply reject points before the polygon test.
         self.center = self.get_center()  # Calculate the geometric center of the country.
-        self.units = random.randint(1, 3)  # Randomly assign 1-3 units to the country.
-        self.color = (72, 126, 176)  # Default color for the country.
-        self.hovered = False  # State to track if the mouse is hovering over the country.
+        self.units = units  # Starting units, rolled by the game's GameRandom.
+        self.color = self.DEFAULT_COLOR  # Default color for the country.
         self.neighbours = None  # Neighboring countries, not initialized here.
-
-    # Method to update the country's state based on the mouse position.
-    def update(self, mouse_pos: pygame.Vector2) -> None:
-        self.hovered = False  # Reset the hovered state.
-        # Check if the mouse position is within the country's polygon area.
-        if Point(mouse_pos.x, mouse_pos.y).within(self.polygon):
-            self.hovered = True  # Set hovered to true if the mouse is over the country.
+        self.owner = None  # Player owning the country, None while it is neutral.
+
+    # Shapely polygon of the country, a MultiPolygon when it has several parts. Shapely is slow to import
+    # and only needed when the adjacency graph has to be rebuilt, so it is imported and the polygon created on first use.
+    @property
+    def polygon(self):
+        if self._polygon is None:
+            from shapely import prepare
+            from shapely.geometry import MultiPolygon, Polygon
+
+            if len(self.parts) == 1:
+                self._polygon = Polygon(self.coords)
+            else:
+                self._polygon = MultiPolygon([Polygon(coords) for coords in self.parts])
+            prepare(self._polygon)
+        return self._polygon
+
+    # Number of units on the country, changing it asks the world to redraw the country.
+    @property
+    def units(self) -> int:
+        return self._units
+
+    @units.setter
+    def units(self, value: int) -> None:
+        self._units = value
+        if self.on_change is not None:
+            self.on_change(self)
+
+    # Fill color of the country, changing it asks the world to redraw the country.
+    @property
+    def color(self) -> tuple:
+        return self._color
+
+    @color.setter
+    def color(self, value: tuple) -> None:
+        self._color = value
+        if self.on_change is not None:
+            self.on_change(self)
+
+    # Method to check whether a point in world coordinates lies inside the country.
+    def contains(self, pos: pygame.Vector2) -> bool:
+        min_x, min_y, max_x, max_y = self.bbox
+        # Most points are rejected by the bounding box before touching the polygon.
+        if not (min_x <= pos[0] <= max_x and min_y <= pos[1] <= max_y):
+            return False
+        return any(self.part_contains(part, pos) for part in range(len(self.parts)))
+
+    # Method to check whether a point lies inside one part, only that part's vertices are tested.
+    def part_contains(self, part: int, pos: pygame.Vector2) -> bool:
+        min_x, min_y, max_x, max_y = self.part_bboxes[part]
+        if not (min_x <= pos[0] <= max_x and min_y <= pos[1] <= max_y):
+            return False
+        # Even-odd rule: count the edges a ray going right from the point crosses.
+        x, y = pos[0], pos[1]
+        coords = self.parts[part]
+        xs, ys = coords[:, 0], coords[:, 1]
+        next_xs, next_ys = np.roll(xs, -1), np.roll(ys, -1)
+        straddles = (ys > y) != (next_ys > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing_xs = xs + (y - ys) * (next_xs - xs) / (next_ys - ys)
+        return bool(np.count_nonzero(straddles & (x < crossing_xs)) % 2)
 
     # Method to draw the country on the screen, including its armies count.
-    def draw(self, screen: pygame.Surface, scroll: pygame.Vector2) -> None:
-        # Draw the country's polygon. If hovered, the color changes to red.
-        pygame.draw.polygon(
-            screen,
-            (255, 0, 0) if self.hovered else self.color,
-            [(x - scroll.x, y - scroll.y) for x, y in self.coords],
-        )
-        # Draw the polygon's outline in white.
-        pygame.draw.polygon(
-            screen,
-            (255, 255, 255),
-            [(x - scroll.x, y - scroll.y) for x, y in self.coords],
-            width=1,
+    def draw(self, screen: pygame.Surface, scroll: pygame.Vector2, hovered: bool = False, zoom: float = 1, level: int = 0) -> None:
+        self.draw_shape(screen, scroll, hovered, zoom, level)
+        self.draw_label(screen, scroll, zoom)
+
+    # Method to draw the filled parts and their outlines, using the outlines simplified to `level`.
+    # Only the parts inside the surface's clip area are drawn, e.g. the one island of a tile.
+    def draw_shape(self, screen: pygame.Surface, scroll: pygame.Vector2, hovered: bool = False, zoom: float = 1, level: int = 0) -> None:
+        clip = screen.get_clip()
+        parts = self.lods[min(level, len(self.lods) - 1)]
+        # If hovered, the color changes to red.
+        color = (255, 0, 0) if hovered else self.color
+        # Screen boxes of every part at once, then only the parts overlapping the clip area are drawn
+        boxes = self.part_bbox_array * zoom - (scroll.x, scroll.y, scroll.x, scroll.y)
+        visible = np.flatnonzero(
+            (boxes[:, 0] <= clip.right) & (boxes[:, 1] <= clip.bottom) & (boxes[:, 2] >= clip.left) & (boxes[:, 3] >= clip.top)
         )
+        for part in visible.tolist():
+            # Scale and translate the part's vertices into screen space in one go.
+            points = (parts[part] * zoom - (scroll.x, scroll.y)).tolist()
+            pygame.draw.polygon(screen, color, points)
+            # Draw the part's outline in white.
+            min_x, min_y, max_x, max_y = boxes[part]
+            if max_x - min_x >= self.MIN_OUTLINE_SIZE or max_y - min_y >= self.MIN_OUTLINE_SIZE:
+                pygame.draw.polygon(screen, (255, 255, 255), points, width=1)
+
+    # Method to draw the number of units on the country.
+    def draw_label(self, screen: pygame.Surface, scroll: pygame.Vector2, zoom: float = 1) -> None:
         # Render the text showing the number of units on the country, centered.
         draw_text(
             screen,
             self.font,
             str(self.units),
             (255, 255, 255),
-            self.center.x - scroll.x,
-            self.center.y - scroll.y,
+            self.center.x * zoom - scroll.x,
+            self.center.y * zoom - scroll.y,
             True,
         )
-    # Helper method to calculate the geometric center of the country's polygon.
+
+    # Helper method returning the parts of the map that have to be redrawn when the country changes: the box of
+    # every part, the first one grown to hold the label. The label keeps its size on screen, so at lower zoom it
+    # covers more of the map. Separate boxes keep far away islands from dragging the whole ocean in between along.
+    def get_dirty_bboxes(self, zoom: float = 1) -> list:
+        min_x, min_y, max_x, max_y = self.part_bboxes[0]
+        half_width, half_height = self.LABEL_HALF_SIZE[0] / zoom, self.LABEL_HALF_SIZE[1] / zoom
+        label_bbox = (
+            min(min_x, self.center.x - half_width),
+            min(min_y, self.center.y - half_height),
+            max(max_x, self.center.x + half_width),
+            max(max_y, self.center.y + half_height),
+        )
+        return [label_bbox] + self.part_bboxes[1:]
+
+    # Helper method to calculate the (min_x, min_y, max_x, max_y) bounding box of an outline.
+    def get_bbox(self, coords: np.ndarray) -> tuple:
+        min_x, min_y = coords.min(axis=0)
+        max_x, max_y = coords.max(axis=0)
+        return (float(min_x), float(min_y), float(max_x), float(max_y))
+
+    # Helper method returning the bounding box around every part.
+    def get_union_bbox(self) -> tuple:
+        return (
+            min(bbox[0] for bbox in self.part_bboxes), min(bbox[1] for bbox in self.part_bboxes),
+            max(bbox[2] for bbox in self.part_bboxes), max(bbox[3] for bbox in self.part_bboxes),
+        )
+
+    # Helper method to calculate the geometric center of the country's largest part.
     def get_center(self) -> pygame.Vector2:
-        # Use pandas Series to calculate the mean of x and y coordinates.
-        return pygame.Vector2(
-            Series([x for x, y in self.coords]).mean(),
-            Series([y for x, y in self.coords]).mean(),
+        # Mean of the x and y coordinates, straight from the vertex array.
+        center_x, center_y = self.coords.mean(axis=0, dtype=np.float64)
+        return pygame.Vector2(float(center_x), float(center_y))
+
+
+class SpatialIndex:
+    # Uniform grid over the map used for hit-testing. Every cell keeps the (country, part) pairs whose
+    # part's bounding box overlaps it, so a point query only tests the few parts in one cell, and a
+    # country spread over an ocean (islands, exclaves) only shows up in the cells its parts cover.
+    def __init__(self, countries, cell_size: int = 128) -> None:
+        self.cell_size = cell_size  # Width and height of a grid cell in world units.
+        self.cells = {}  # Maps (column, row) to the list of (country, part) pairs overlapping that cell.
+        for country in countries:
+            for part, bbox in enumerate(country.part_bboxes):
+                for cell in self.get_cells(bbox):
+                    self.cells.setdefault(cell, []).append((country, part))
+
+    # Helper method returning the (first_col, first_row, last_col, last_row) cells covered by a box.
+    def get_cell_range(self, bbox: tuple) -> tuple:
+        min_x, min_y, max_x, max_y = bbox
+        return (
+            int(min_x // self.cell_size), int(min_y // self.cell_size),
+            int(max_x // self.cell_size), int(max_y // self.cell_size),
         )
 
+    # Helper method to list the grid cells covered by a (min_x, min_y, max_x, max_y) box.
+    def get_cells(self, bbox: tuple) -> list:
+        first_col, first_row, last_col, last_row = self.get_cell_range(bbox)
+        return [
+            (col, row)
+            for col in range(first_col, last_col + 1)
+            for row in range(first_row, last_row + 1)
+        ]
+
+    # Returns the (country, part) pairs whose bounding box may contain the point.
+    def query_point(self, x: float, y: float) -> list:
+        return self.cells.get((int(x // self.cell_size), int(y // self.cell_size)), [])
+
+    # Returns every country with a part listed in a (first_col, first_row, last_col, last_row) range of cells.
+    def query_cells(self, cell_range: tuple) -> set:
+        first_col, first_row, last_col, last_row = cell_range
+        found = set()
+        for col in range(first_col, last_col + 1):
+            for row in range(first_row, last_row + 1):
+                found.update(country for country, _ in self.cells.get((col, row), ()))
+        return found
+
+    # Returns the countries with a part whose bounding box overlaps the given box.
+    def query_rect(self, bbox: tuple) -> set:
+        min_x, min_y, max_x, max_y = bbox
+        found = set()
+        for cell in self.get_cells(bbox):
+            for country, part in self.cells.get(cell, []):
+                if country in found:
+                    continue
+                c_min_x, c_min_y, c_max_x, c_max_y = country.part_bboxes[part]
+                if c_min_x <= max_x and c_max_x >= min_x and c_min_y <= max_y and c_max_y >= min_y:
+                    found.add(country)
+        return found
+
 
 class World:
     # Class-level constants defining the size of the game world map.
     MAP_WIDTH = 2.05 * 4000 * 0.6  # The width of the map, calculated using a base width and a scaling factor.
     MAP_HEIGHT = 1.0 * 4000 * 0.6  # The height of the map, calculated similarly to the width.
     SCALE_FACTOR = 1  # A scaling factor used for coordinate scaling; currently set to 1, so it has no effect.
+    BACKGROUND_COLOR = (245, 245, 220)  # Beige color of the sea around the countries.
+    TILE_SIZE = 512  # Width and height of a pre-rendered map tile in screen pixels.
+    TILE_CACHE_BYTES = 96 * 1024 * 1024  # Most pixel memory the map tiles may take.
+    GEO_PARTS_PATH = "./data/country_parts.json"  # Every part of every country, written by src/geobuild.py.
+    GEO_DATA_PATH = "./data/country_coords.json"  # Legacy outlines, one ring per country, used when there is no parts pack.
+    MAP_PATH = "./data/country_coords.map"  # Projected outlines compiled from get_geo_data_path(), see src/mapfile.py.
+    ADJACENCY_PATH = "./data/country_adjacency.json"  # Cached neighbour graph, rebuilt when the outlines change.
+    ZOOM_STEP = 1.25  # Zoom factor of one mouse wheel notch or key press.
+    MIN_ZOOM_STEP = -3  # Furthest the map can be zoomed out, in steps: 1.25 ** -3, about 0.5.
+    MAX_ZOOM_STEP = 3  # Furthest the map can be zoomed in, about 2.0.
+    MIN_ZOOM = ZOOM_STEP ** MIN_ZOOM_STEP
+    MAX_ZOOM = ZOOM_STEP ** MAX_ZOOM_STEP
+    PLAYER_COLORS = [(200, 40, 40), (40, 160, 60), (230, 160, 20), (140, 60, 170), (20, 160, 170)]  # Colors of added players.
 
     # Constructor for the World class.
     def __init__(self, game) -> None:
         self.game = game  # A reference to the main game object.
         self.read_geo_data()  # Method call to read geographical data, not defined in this snippet.
-        self.countries = self.create_countries()  # Creates country objects, method not defined in this snippet.
+        # Creates country objects with 1-3 starting units each, drawn from the game's seeded setup stream.
+        self.countries = self.create_countries(self.game.random.roll_starting_units(len(self.geo_data.names)))
+        self.spatial_index = SpatialIndex(self.countries.values())  # Grid used to find the country under a point.
         self.create_neighbours()  # Sets up neighboring countries, method not defined in this snippet.
         self.players = []  # A list to hold player objects.
-        self.scroll = pygame.Vector2(2000, 500)  # Initial scrolling offset for the map view.
-        self.font = pygame.font.SysFont(None, 24)  # Font for rendering text on the UI.
+        self.scroll = pygame.Vector2(2000, 500)  # Initial scrolling offset for the map view, in zoomed pixels.
+        self.zoom_step = 0  # Number of zoom steps in (positive) or out (negative), tiles are cached per step.
+        self.zoom = 1.0  # Screen pixels per map unit, always ZOOM_STEP ** zoom_step.
+        self.lod_level = self.geo_data.get_lod_level(self.zoom)  # Level of detail the outlines are drawn with.
+        self.font = get_font(None, 24)  # Shared font for rendering text on the UI.
 
         # Initializes a UI element that appears when a country is hovered over.
         self.hovered_country = None  # The country object that is currently being hovered by the mouse.
         self.hover_surface = pygame.Surface((300, 100), pygame.SRCALPHA)  # A surface for the hovering UI panel.
         self.hover_surface.fill((25, 42, 86, 155))  # Fills the hover surface with a semi-transparent color.
+        self.hover_rect = self.hover_surface.get_rect(topleft=(1280 - 310, 720 - 110))  # Screen area of the panel.
+        self.plus_button_rect = pygame.Rect((1280 - 310 + 200, 720 - 90), (30, 30))  # "+" button on the panel.
+        self.minus_button_rect = pygame.Rect((1280 - 310 + 150, 720 - 90), (30, 30))  # "-" button on the panel.
+
+        # The map is rasterised into tiles on demand, afterwards only changed countries are redrawn into them.
+        self.dirty_countries = set()  # Countries whose color, hover state or units changed since the last draw.
+        self.last_scroll = None  # Scroll offset of the last full redraw of the screen, None forces one.
+        self.tiles = TileCache(self.render_tile, self.TILE_SIZE, self.TILE_CACHE_BYTES, self.ZOOM_STEP)
+        self.tiles.start()  # Renders the tiles around the camera in the background.
+
+        # Only countries inside the camera are hit-tested or have their tiles patched in place when they change.
+        self.visible_cells = None  # Range of spatial index cells covered by the camera at the last update.
+        self.visible_countries = set()  # Countries overlapping those cells.
+        self.update_visible_countries()
+        for country in self.countries.values():
+            country.on_change = self.mark_dirty
 
     def read_geo_data(self) -> None:
-        #loads the geo data from the JSON file
-        with open("./data/country_coords.json", "r") as f:
-            self.geo_data = json.load(f)
+        #memory-maps the compiled map, compiling it from the JSON file first if it is missing or stale
+        self.geo_data = load_or_compile_map(
+            self.get_geo_data_path(), self.MAP_PATH, self.MAP_WIDTH, self.MAP_HEIGHT, self.SCALE_FACTOR, self.get_zooms()
+        )
+
+    @classmethod
+    def get_zooms(cls) -> tuple:
+        #every zoom the map can be drawn at, the compiled map keeps one level of detail per zoom
+        return tuple(cls.ZOOM_STEP ** step for step in range(cls.MIN_ZOOM_STEP, cls.MAX_ZOOM_STEP + 1))
+
+    @classmethod
+    def get_geo_data_path(cls) -> str:
+        #the parts pack when one was built, the legacy one-ring-per-country file otherwise
+        return cls.GEO_PARTS_PATH if os.path.exists(cls.GEO_PARTS_PATH) else cls.GEO_DATA_PATH
 
-    def create_countries(self) -> dict:
-        #Porcesses the go data to create country objects
+    def create_countries(self, starting_units: list = None) -> dict:
+        #Porcesses the go data to create country objects, each part of each one is a view into the shared vertex buffer
         countries = {}
-        for name, coords in self.geo_data.items():
-            xy_coords = []
-            for coord in coords:
-                x = ((self.MAP_WIDTH / 360) * (180 + coord[0])) * self.SCALE_FACTOR
-                y = ((self.MAP_HEIGHT / 180) * (90 - coord[1])) * self.SCALE_FACTOR
-                xy_coords.append(pygame.Vector2(x, y))
-            countries[name] = Country(name, xy_coords)
+        for index, (name, parts) in enumerate(self.geo_data.items()):
+            units = starting_units[index] if starting_units is not None else 1
+            countries[name] = Country(name, parts, index, self.geo_data.get_lods(index), units, self.geo_data.get_part_bboxes(index))
         return countries
     
-    def create_players(self, num_players):
-        #initializes player objects for the game
+    def create_players(self, strategies: list) -> list:
+        #creates one player per entry of strategies on a random neutral country, None entries are human players
+        #and src.ai strategies are computer players. Returns the new players, they are also added to self.players
         from src.player import Player
-        for i in range(num_players):
-            player_name = f"Player (i+1)"
-            new_player = Player(player_name)
+        neutral = [country for country in self.countries.values() if country.owner is None]
+        new_players = []
+        for strategy, country in zip(strategies, self.game.random.sample(neutral, min(len(strategies), len(neutral)))):
+            number = len(self.players) + 1
+            new_player = Player(
+                game=self.game,
+                name=f"Player {number}" if strategy is None else f"Computer {number} ({strategy.name})",
+                country=country,
+                world=self,
+                color=self.PLAYER_COLORS[len(new_players) % len(self.PLAYER_COLORS)],
+                strategy=strategy,
+            )
             self.players.append(new_player)
-
-    def draw(self, screen: pygame.Surface) -> None:
-        #draws the world and countries on screen
-        for country in self.countries.values():
-            country.draw(screen, self.scroll)
+            new_players.append(new_player)
+        return new_players
+
+    def close(self) -> None:
+        #stops the tile prefetch thread, call before pygame is shut down
+        self.tiles.stop()
+
+    def set_zoom_step(self, zoom_step: int, anchor: tuple) -> None:
+        #zooms the map to a whole number of steps keeping the map point under `anchor` (a screen position) in place.
+        #the zoom is worked out from the step each time, repeated multiplying would drift to slightly different
+        #zooms that each get their own set of tiles
+        zoom_step = min(self.MAX_ZOOM_STEP, max(self.MIN_ZOOM_STEP, zoom_step))
+        if zoom_step == self.zoom_step:
+            return
+        zoom = self.ZOOM_STEP ** zoom_step
+        anchor_x = (anchor[0] + self.scroll.x) / self.zoom
+        anchor_y = (anchor[1] + self.scroll.y) / self.zoom
+        self.zoom_step = zoom_step
+        self.zoom = zoom
+        self.lod_level = self.geo_data.get_lod_level(zoom)
+        self.scroll = pygame.Vector2(anchor_x * zoom - anchor[0], anchor_y * zoom - anchor[1])
+        # Tiles are kept per zoom, so only the screen has to be redrawn
+        self.last_scroll = None
+        self.visible_cells = None
+        self.update_visible_countries()
+
+    def zoom_in(self, anchor: tuple) -> None:
+        self.set_zoom_step(self.zoom_step + 1, anchor)
+
+    def zoom_out(self, anchor: tuple) -> None:
+        self.set_zoom_step(self.zoom_step - 1, anchor)
+
+    def mark_dirty(self, country: Country) -> None:
+        #queues a country to be redrawn into the map layer on the next draw
+        self.dirty_countries.add(country)
+
+    def render_tile(self, key: tuple) -> pygame.Surface:
+        #rasterises one map tile, everything it needs comes from the key so it can run on the prefetch thread
+        zoom = self.tiles.get_zoom(key)
+        tile = pygame.Surface((self.TILE_SIZE, self.TILE_SIZE))
+        self.redraw_region(tile, self.tiles.get_tile_rect(key), tile.get_rect(), zoom)
+        return tile
+
+    def redraw_region(self, surface: pygame.Surface, surface_rect: pygame.Rect, area: pygame.Rect, zoom: float) -> None:
+        #redraws every country touching `area` of a surface covering `surface_rect` of the zoomed map
+        # Labels can stick out of their country, so also pick up countries whose label reaches into the area
+        half_width, half_height = Country.LABEL_HALF_SIZE
+        countries = sorted(
+            self.spatial_index.query_rect((
+                (surface_rect.x + area.left - half_width) / zoom, (surface_rect.y + area.top - half_height) / zoom,
+                (surface_rect.x + area.right + half_width) / zoom, (surface_rect.y + area.bottom + half_height) / zoom,
+            )),
+            key=lambda country: country.index,
+        )
+        origin = pygame.Vector2(surface_rect.topleft)
+        level = self.geo_data.get_lod_level(zoom)
+        surface.set_clip(area)
+        surface.fill(self.BACKGROUND_COLOR, area)
+        # Shapes first and labels on top, so a partial redraw gives the same pixels as a full one
+        for country in countries:
+            country.draw_shape(surface, origin, country is self.hovered_country, zoom, level)
+        for country in countries:
+            country.draw_label(surface, origin, zoom)
+        surface.set_clip(None)
+
+    def redraw_country(self, country: Country) -> list:
+        #brings the cached tiles under a changed country up to date, returns the zoomed map rects that changed
+        # The boxes of a country's parts (islands, exclaves) are merged per tile, so each tile is redrawn once
+        tile_areas = {}
+        # Labels cover the most map at the smallest zoom, those boxes hold the country at every zoom
+        for (min_x, min_y, max_x, max_y), outer_bbox in zip(country.get_dirty_bboxes(self.zoom), country.get_dirty_bboxes(self.MIN_ZOOM)):
+            for key in self.tiles.get_cached_keys(outer_bbox):
+                if key[0] != self.zoom_step or country not in self.visible_countries:
+                    # Not on screen, render it again when it is needed
+                    self.tiles.invalidate(key)
+                    continue
+                tile_rect = self.tiles.get_tile_rect(key)
+                area = pygame.Rect(
+                    int(min_x * self.zoom) - tile_rect.x, int(min_y * self.zoom) - tile_rect.y,
+                    int((max_x - min_x) * self.zoom) + 2, int((max_y - min_y) * self.zoom) + 2,
+                ).clip(self.tiles.peek(key).get_rect())
+                if area.width and area.height:
+                    tile_areas[key] = tile_areas[key].union(area) if key in tile_areas else area
+        changed_areas = []
+        for key, area in tile_areas.items():
+            tile_rect = self.tiles.get_tile_rect(key)
+            self.redraw_region(self.tiles.peek(key), tile_rect, area, self.zoom)
+            changed_areas.append(area.move(tile_rect.topleft))
+        return changed_areas
+
+    def restore(self, screen: pygame.Surface, rect: pygame.Rect) -> None:
+        #copies the map tiles back onto an area of the screen, e.g. before drawing UI on top of it again
+        view = rect.move(self.scroll.x, self.scroll.y)
+        screen.set_clip(rect)
+        for key in self.tiles.get_keys(self.zoom_step, view):
+            tile_rect = self.tiles.get_tile_rect(key)
+            screen.blit(self.tiles.get(key), (tile_rect.x - self.scroll.x, tile_rect.y - self.scroll.y))
+        screen.set_clip(None)
+
+    def draw(self, screen: pygame.Surface) -> list:
+        #draws the world and countries on screen, returns the screen rectangles that changed
+        screen_rect = screen.get_rect()
+        view = screen_rect.move(self.scroll.x, self.scroll.y)
+        # The prefetch thread reads the countries too, keep it out until the tiles are up to date
+        with self.tiles.lock:
+            changed_areas = []
+            for country in self.dirty_countries:
+                changed_areas.extend(self.redraw_country(country))
+            self.dirty_countries.clear()
+
+            if self.scroll != self.last_scroll:
+                # The camera moved, so every pixel on screen changed
+                self.last_scroll = pygame.Vector2(self.scroll)
+                self.restore(screen, screen_rect)
+                dirty_rects = [screen_rect]
+            else:
+                dirty_rects = []
+                for area in changed_areas:
+                    rect = area.move(-self.scroll.x, -self.scroll.y).clip(screen_rect)
+                    if rect.width and rect.height:
+                        self.restore(screen, rect)
+                        dirty_rects.append(rect)
+        # Get the ring of tiles around the camera ready before it scrolls into view
+        self.tiles.prefetch(self.tiles.get_keys(self.zoom_step, view, 1))
+
+        # The hover panel is see-through, restore the map under it before drawing it again
+        self.restore(screen, self.hover_rect)
+        dirty_rects.append(self.hover_rect)
         if self.hovered_country is not None:
             self.draw_hovered_country(screen)
         # if self.game.error_message:
         #     self.game.display_error_message(screen)
+        return dirty_rects
+
+    def register_widgets(self, dispatcher) -> None:
+        #routes clicks on the hover panel to its buttons, and keeps clicks on the rest of the panel off the map
+        has_panel = lambda: self.hovered_country is not None
+        dispatcher.add_widget(self.plus_button_rect, lambda button: self.increment_armies(), has_panel)
+        dispatcher.add_widget(self.minus_button_rect, lambda button: self.decrement_armies(), has_panel)
+        dispatcher.add_widget(self.hover_rect, lambda button: None, has_panel)
+
+    # Returns True while the camera keys are held, the map then has to be redrawn every frame
+    def is_camera_moving(self) -> bool:
+        keys = pygame.key.get_pressed()
+        return keys[pygame.K_a] or keys[pygame.K_d] or keys[pygame.K_w] or keys[pygame.K_s]
 
     def update(self) -> None:
-        #Handles the logic for updating the state of the world, movement and mouse
-        self.update_camera()
+        #Handles the logic for updating the state of the world and mouse, the game moves the camera every simulation tick
+        self.update_visible_countries()
         mouse_pos = pygame.mouse.get_pos()
-        # self.hovered_country = None
-        for country in self.countries.values():
-            country.update(
-                pygame.Vector2(mouse_pos[0] + self.scroll.x, mouse_pos[1] + self.scroll.y)
-            )
-            if country.hovered:
-                self.hovered_country = country
-        clicked = pygame.mouse.get_pressed()[0]
-        # if not clicked:
-                # self.hovered_country = None
-        for country in self.countries.values():
-                country.update(
-                    pygame.Vector2(mouse_pos[0] + self.scroll.x, mouse_pos[1] + self.scroll.y)
-                )
-                if country.hovered:
-                    if clicked:
-                        # if self.hovered_country is None:
-                        #     pass
-                        # else:
-                        #     self.hovered_country = country
-                        self.hovered_country = country
+        # The hover panel sits on top of the map, keep the current country while the mouse is on its buttons
+        if self.hovered_country is not None and self.hover_rect.collidepoint(mouse_pos):
+            return
+        hovered_country = self.get_country_at_screen_pos(mouse_pos)
+        if hovered_country is not self.hovered_country:
+            # Both the old and the new country change color
+            if self.hovered_country is not None:
+                self.mark_dirty(self.hovered_country)
+            if hovered_country is not None:
+                self.mark_dirty(hovered_country)
+            self.hovered_country = hovered_country
+
+    # Returns the country under a screen position, or None over the sea
+    def get_country_at_screen_pos(self, pos: tuple):
+        return self.get_country_at_pos(
+            pygame.Vector2((pos[0] + self.scroll.x) / self.zoom, (pos[1] + self.scroll.y) / self.zoom)
+        )
+
+    # Returns the country containing a point in world coordinates, or None over the sea
+    def get_country_at_pos(self, pos: pygame.Vector2):
+        for country, part in self.spatial_index.query_point(pos[0], pos[1]):
+            if country in self.visible_countries and country.part_contains(part, pos):
+                return country
+        return None
+
+    def update_visible_countries(self) -> None:
+        #recomputes the countries under the camera, only when the camera crossed into different grid cells
+        half_width, half_height = Country.LABEL_HALF_SIZE
+        camera_bbox = (
+            (self.scroll.x - half_width) / self.zoom,
+            (self.scroll.y - half_height) / self.zoom,
+            (self.scroll.x + self.game.window_size.x + half_width) / self.zoom,
+            (self.scroll.y + self.game.window_size.y + half_height) / self.zoom,
+        )
+        cells = self.spatial_index.get_cell_range(camera_bbox)
+        if cells == self.visible_cells:
+            return
+        self.visible_cells = cells
+        self.visible_countries = self.spatial_index.query_cells(cells)
+
     #sets up user camera controls and keys for movement and movement speed 
     def update_camera(self) -> None:
         keys = pygame.key.get_pressed()
@@ -157,17 +528,15 @@ class World:
             self.scroll.y += 10
 
         if keys[pygame.K_SPACE]:
-            self.scroll = pygame.Vector2(3650, 395)
+            self.scroll = pygame.Vector2(3650, 395) * self.zoom
 
     def draw_hovered_country(self, screen: pygame.Surface) -> None:
         #drawes the UI elements related to the country the mouse is hovering over
         screen.blit(self.hover_surface, (1280 - 310, 720 - 110))
 
-        plus_button_pos = (1280 - 310 + 200, 720- 90)
-        minus_button_pos = (1280 - 310 + 150, 720-90)
-        #draws interactive buttons on the screen
-        self.draw_button(screen, "+", plus_button_pos, self.increment_armies)
-        self.draw_button(screen, "-", minus_button_pos, self.decrement_armies)
+        #draws the buttons, clicks on them are routed by the game's EventDispatcher
+        self.draw_button(screen, "+", self.plus_button_rect.topleft)
+        self.draw_button(screen, "-", self.minus_button_rect.topleft)
     # def draw_hovered_country(self, screen: pygame.Surface) -> None:
     # Draw the UI elements related to the country the mouse is hovering over
         # screen.blit(self.hover_surface, (1280 - 310, 720 - 110))
@@ -215,10 +584,17 @@ class World:
             24,
         )
         #creates a box for hovered countries and displayes Armies and a "+" and "-" button to add or subtract armies
+        lines = [f"Armies: {str(self.hovered_country.units)}"]
+        # While attacking, show the exact chance to conquer the country from our strongest country next to it
+        if self.game.phase == "attack_country":
+            attacking_country = self.game.get_current_player().get_attacking_country(self.hovered_country)
+            if attacking_country is not None:
+                win_probability = get_odds_table().get_win_probability(attacking_country.units, self.hovered_country.units)
+                lines.append(f"Win odds: {win_probability:.0%}")
         draw_multiline_text(
             screen,
             self.font,
-            [f"Armies: {str(self.hovered_country.units)}"],
+            lines,
             (255, 255, 255),
             1280 - 310 + 5,
             720 - 90 + 5,
@@ -237,12 +613,12 @@ class World:
     #     if button_rect.collidepoint(pygame.mouse.get_pos()):
     #         if pygame.mouse.get_pressed()[0]:
     #             on_click()
-    def draw_button(self, screen: pygame.Surface, text: str, position: tuple, on_click) -> None:
+    def draw_button(self, screen: pygame.Surface, text: str, position: tuple) -> None:
         button_rect = pygame.Rect(position, (30, 30))  # Button size of 30x30
         pygame.draw.rect(screen, (255, 255, 255), button_rect)  # Draw the button with white color
 
         # Get the size of the text to be rendered
-        text_surface = self.font.render(text, True, (0, 0, 0))
+        text_surface = render_text(self.font, text, (0, 0, 0))
         text_size = text_surface.get_size()
 
         # Calculate the position to center the text
@@ -252,11 +628,6 @@ class World:
         # Draw the button text, now with black color, centered in the button
         screen.blit(text_surface, (text_x, text_y))
 
-        # Check for click events
-        if button_rect.collidepoint(pygame.mouse.get_pos()):
-            if pygame.mouse.get_pressed()[0]:
-                on_click()
-
 # This draw_text function must be defined elsewhere in your code
 # It should be responsible for rendering text on the screen
 
@@ -273,89 +644,15 @@ class World:
             self.hovered_country.attack_armies -= 1
 
     def create_neighbours(self) -> None:
+        #loads the adjacency graph from its cache (building it only when the map data changed)
+        self.neighbours = load_or_build_adjacency(self.geo_data.source_hash, self.ADJACENCY_PATH, self.countries)
         for k, v in self.countries.items():
-            v.neighbours = self.get_country_neighbours(k)
-
-    def get_country_neighbours(self, country: str) -> list:
-        #retrieves a list of neighboring countries for a given country
-        neighbours = []
-        country_poly = self.countries[country].polygon
-        for other_country_key, other_country_value in self.countries.items():
-            if country != other_country_key:
-                if country_poly.intersects(other_country_value.polygon):
-                    neighbours.append(other_country_key)
-            if country == "United States of America":
-                neighbours += ["Canada", "Mexico"]
-            elif country == "Canada":
-                neighbours += ["United States of America"]
-            elif country == "Mexico":
-                neighbours += ["United States of America", "Belize", "Guatemala"]
-            elif country == "Belize":
-                neighbours += ["Mexico", "Guatemala"]
-            elif country == "Guatemala":
-                neighbours += ["Mexico", "Belize", "Honduras", "El Salvador"]
-            elif country == "Honduras":
-                neighbours += ["Guatemala", "El Salvador", "Nicaragua"]
-            elif country == "El Salvador":
-                neighbours += ["Guatemala", "Honduras"]
-            elif country == "Nicaragua":
-                neighbours += ["Honduras", "Costa Rica"]
-            elif country == "Costa Rica":
-                neighbours += ["Nicaragua", "Panama"]
-            elif country == "Panama":
-                neighbours += ["Costa Rica"]
-            elif country == "Cuba":
-                neighbours += ["Haiti", "Jamaica", "Bahamas"]
-            elif country == "Haiti":
-                neighbours += ["Dominican Republic", "Cuba"]
-            elif country == "Dominican Republic":
-                neighbours += ["Haiti"]
-            elif country == "Jamaica":
-                neighbours += ["Cuba"]
-            elif country == "The Bahamas":
-                neighbours += ["Cuba"]
-            elif country == "Puerto Rico":
-                neighbours += ["Dominican Republic", "Virgin Islands (US)"]
-            elif country == "US Virgin Islands":
-                neighbours += ["Puerto Rico", "British Virgin Islands"]
-            elif country == "British Virgin Islands":
-                neighbours += ["US Virgin Islands", "Anguilla"]
-            elif country == "Anguilla":
-                neighbours += ["British Virgin Islands", "Saint Martin"]
-            elif country == "Saint Martin":
-                neighbours += ["Sint Maarten", "Anguilla", "Saint Barthelemy"]
-            elif country == "Sint Maarten":
-                neighbours += ["Saint Martin"]
-            elif country == "Saint Barthelemy":
-                neighbours += ["Saint Martin"]
-            elif country == "Antigua and Barbuda":
-                neighbours += ["Saint Kitts and Nevis", "Montserrat"]
-            elif country == "Montserrat":
-                neighbours += ["Antigua and Barbuda"]
-            elif country == "Saint Kitts and Nevis":
-                neighbours += ["Antigua and Barbuda"]
-            elif country == "Dominica":
-                neighbours += ["Guadeloupe", "Martinique"]
-            elif country == "Saint Lucia":
-                neighbours += ["Martinique", "Saint Vincent and the Grenadines"]
-            elif country == "Saint Vincent and the Grenadines":
-                neighbours += ["Saint Lucia", "Barbados"]
-            elif country == "Barbados":
-                neighbours += ["Saint Vincent and the Grenadines"]
-            elif country == "Grenada":
-                neighbours += ["Trinidad and Tobago"]
-            elif country == "Trinidad and Tobago":
-                neighbours += ["Grenada"]
-            elif country == "Aruba":
-                neighbours += ["Curaçao"]
-            elif country == "Curaçao":
-                neighbours += ["Aruba"]
-            elif country == "Greenland":
-                neighbours += ["Canada"]
-            elif country == "Cayman Islands":
-                neighbours += ["Jamaica"]
-            elif country == "Turks and Caicos Islands":
-                neighbours += ["Bahamas"]
-            elif country == "Saint Pierre and Miquelon":
-                neighbours += ["Canada"]
-            return neighbours
\ No newline at end of file
+            v.neighbours = self.neighbours[k]
+
+    def get_country_neighbours(self, country: str) -> set:
+        #retrieves the set of neighboring countries for a given country
+        return self.countries[country].neighbours
+
+    def are_neighbours(self, country: str, other_country: str) -> bool:
+        #checks whether two countries share a border or a sea link
+        return other_country in self.countries[country].neighbours
@@ -0,0 +1,364 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from src.mapfile import project
+
+# Builds the map data from Natural Earth style country shapes, replacing the hand-run notebook.
+# Every country goes through the same stages:
+#   clean     repair invalid geometry and keep only its polygons (lon/lat)
+#   project   onto the flat map, in map units
+#   simplify  Douglas-Peucker with topology preserved, then drop islets below a minimum area
+#   validate  check every part is a usable ring
+# Each stage's output is cached per country under a key hashing the stage, its parameters and the
+# key of its input, so rebuilding after editing one country (or one stage's setting) only redoes
+# the countries and stages that actually changed.
+#
+# Outputs, both written next to each other in --out:
+#   country_parts.json  every part of every country in map units, largest part first
+#   country_coords.json the legacy one-ring-per-country file World compiles, see to_legacy_coords
+#
+#   python -m src.geobuild ne_50m_admin_0_countries.geojson --preset world --tolerance 1.0
+
+PIPELINE_VERSION = 1  # Bump when a stage changes its output, so every cache entry is rebuilt.
+PARTS_FILE_VERSION = 1
+PARTS_FILENAME = "country_parts.json"
+LEGACY_FILENAME = "country_coords.json"
+CACHE_PATH = "./data/geo_cache"  # Default directory of the stage cache.
+MERCATOR_MAX_LATITUDE = 85.0  # Mercator stretches to infinity at the poles, latitudes are clamped to this.
+
+# Country selections. A preset lists the continents to keep (None keeps all) and countries to leave out.
+PRESETS = {
+    "north-america": {
+        "continents": ["North America"],
+        # Small islands the North America map has always left out
+        "exclude": [
+            "Anguilla", "United States Virgin Islands", "Cayman Islands", "Bermuda", "Grenada",
+            "Turks and Caicos Islands", "Montserrat", "Saint Vincent and the Grenadines", "Saint Lucia",
+            "Saint Kitts and Nevis", "Saint Pierre and Miquelon", "Saint Martin", "Dominica", "Barbados",
+            "Curaçao", "Aruba", "The Bahamas", "Saint Barthelemy", "Antigua and Barbuda", "Sint Maarten",
+        ],
+    },
+    "south-america": {"continents": ["South America"], "exclude": []},
+    "europe": {"continents": ["Europe"], "exclude": []},
+    "africa": {"continents": ["Africa"], "exclude": []},
+    "asia": {"continents": ["Asia"], "exclude": []},
+    "oceania": {"continents": ["Oceania"], "exclude": []},
+    "world": {"continents": None, "exclude": ["Antarctica"]},
+}
+
+
+# Reads (name, continent, shapely geometry) for every feature. GeoJSON is read directly, anything
+# else (e.g. the Natural Earth shapefile) through geopandas, which is only needed for that.
+def read_features(path: str, name_field: str = "ADMIN", continent_field: str = "CONTINENT") -> list:
+    from shapely.geometry import shape
+
+    if path.endswith((".json", ".geojson")):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return [
+            (feature["properties"][name_field], feature["properties"].get(continent_field), shape(feature["geometry"]))
+            for feature in data["features"]
+            if feature.get("geometry")
+        ]
+    try:
+        import geopandas
+    except ImportError:
+        raise ImportError(f"reading {path} needs geopandas, or convert it to GeoJSON first") from None
+    frame = geopandas.read_file(path)
+    return [
+        (row[name_field], row.get(continent_field), row["geometry"])
+        for _, row in frame.iterrows()
+        if row["geometry"] is not None
+    ]
+
+
+# Keeps the features of a preset, plus or minus extra names. Returns {name: geometry}, sorted by
+# name so the output doesn't depend on the order of the source file.
+def select_countries(features: list, continents=None, exclude=(), include=()) -> dict:
+    exclude, include = set(exclude), set(include)
+    selected = {}
+    for name, continent, geometry in features:
+        if name in include or ((continents is None or continent in continents) and name not in exclude):
+            if name in selected:
+                # Some sources split a country over several features
+                geometry = selected[name].union(geometry)
+            selected[name] = geometry
+    return dict(sorted(selected.items()))
+
+
+# Helper returning the polygons of any geometry as a list, dropping points and lines.
+def get_polygons(geometry) -> list:
+    if geometry.is_empty:
+        return []
+    if geometry.geom_type == "Polygon":
+        return [geometry]
+    if geometry.geom_type in ("MultiPolygon", "GeometryCollection"):
+        return [polygon for part in geometry.geoms for polygon in get_polygons(part)]
+    return []
+
+
+def to_multipolygon(polygons: list):
+    from shapely.geometry import MultiPolygon
+
+    return MultiPolygon(polygons)
+
+
+# Stage 1: makes the geometry valid (self-intersections, duplicate points...) and keeps its polygons.
+# Broken parts are repaired one by one and overlapping parts merged with a union, which is much
+# faster than make_valid on a whole archipelago and keeps overlapping islands as one piece of land.
+def clean_geometry(geometry, params: dict):
+    from shapely import make_valid, union_all
+
+    polygons = []
+    for polygon in get_polygons(geometry):
+        polygons.extend(get_polygons(make_valid(polygon)) if not polygon.is_valid else [polygon])
+    geometry = to_multipolygon(polygons)
+    if not geometry.is_valid:
+        geometry = to_multipolygon(get_polygons(union_all(polygons)))
+    return geometry
+
+
+# Projects (longitude, latitude) pairs with a named projection. "equirectangular" is what the
+# game has always used (src/mapfile.project); "mercator" keeps shapes but stretches the poles.
+def project_points(lon_lat: np.ndarray, projection: str, map_width: float, map_height: float, scale_factor: float) -> np.ndarray:
+    if projection == "equirectangular":
+        return project(lon_lat, map_width, map_height, scale_factor)
+    if projection == "mercator":
+        latitudes = np.radians(np.clip(lon_lat[:, 1], -MERCATOR_MAX_LATITUDE, MERCATOR_MAX_LATITUDE))
+        stretched = np.column_stack((lon_lat[:, 0], np.degrees(np.log(np.tan(np.pi / 4 + latitudes / 2)))))
+        # Mercator latitudes reach about +-170 degrees, fit twice the range into the map height
+        return project(stretched * (1, 0.5), map_width, map_height, scale_factor)
+    raise ValueError(f"unknown projection {projection}")
+
+
+# Stage 2: projects every vertex onto the flat map.
+def project_geometry(geometry, params: dict):
+    from shapely import transform
+
+    return transform(
+        geometry,
+        lambda lon_lat: project_points(lon_lat, params["projection"], params["map_width"], params["map_height"], params["scale_factor"]),
+    )
+
+
+# Stage 3: simplifies the outlines and drops parts too small to see or click. Holes are dropped
+# too, the map draws and hit-tests filled rings only, so enclaves have to be countries of their own.
+def simplify_geometry(geometry, params: dict):
+    from shapely import simplify
+    from shapely.geometry import Polygon
+
+    polygons = []
+    for polygon in get_polygons(geometry):
+        polygon = Polygon(polygon.exterior)
+        if params["tolerance"] > 0:
+            polygon = simplify(polygon, params["tolerance"], preserve_topology=True)
+        polygons.extend(part for part in get_polygons(polygon) if part.area >= params["min_area"])
+    return to_multipolygon(polygons)
+
+
+# Stage 4: checks every part is a valid ring with an area, repairing the rare part the
+# simplification broke. Raises ValueError when nothing usable is left.
+def validate_geometry(geometry, params: dict):
+    from shapely import make_valid
+    from shapely.geometry import Polygon
+
+    polygons = []
+    for polygon in get_polygons(geometry):
+        if not polygon.is_valid:
+            polygons.extend(Polygon(part.exterior) for part in get_polygons(make_valid(polygon)))
+        else:
+            polygons.append(polygon)
+    polygons = [polygon for polygon in polygons if len(polygon.exterior.coords) >= 4 and polygon.area > 0]
+    if not polygons:
+        raise ValueError("no part is left after simplification, lower --min-area or --tolerance")
+    # Largest part first, that's the one the legacy file keeps and the label goes on
+    polygons.sort(key=lambda polygon: -polygon.area)
+    return to_multipolygon(polygons)
+
+
+STAGES = (
+    ("clean", clean_geometry),
+    ("project", project_geometry),
+    ("simplify", simplify_geometry),
+    ("validate", validate_geometry),
+)
+
+
+class StageCache:
+    # Stage outputs stored as WKB files named after their key, one directory per stage. Entries are
+    # only ever added, so interrupted builds leave nothing half-written (files are renamed in place).
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.hits = 0  # Stage outputs read from the cache.
+        self.misses = 0  # Stage outputs computed.
+
+    def get_path(self, stage: str, key: str) -> str:
+        return os.path.join(self.path, stage, key + ".wkb")
+
+    def has(self, stage: str, key: str) -> bool:
+        return os.path.exists(self.get_path(stage, key))
+
+    def load(self, stage: str, key: str):
+        from shapely import from_wkb
+
+        with open(self.get_path(stage, key), "rb") as f:
+            geometry = from_wkb(f.read())
+        self.hits += 1
+        return geometry
+
+    def save(self, stage: str, key: str, geometry) -> None:
+        from shapely import to_wkb
+
+        path = self.get_path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(to_wkb(geometry))
+        os.replace(tmp_path, path)
+        self.misses += 1
+
+
+# Helper returning the content hash of a source geometry, the key of its first stage's input.
+def get_geometry_key(geometry) -> str:
+    from shapely import normalize, to_wkb
+
+    return hashlib.sha1(to_wkb(normalize(geometry))).hexdigest()
+
+
+# Helper chaining a stage's key from its input key and parameters.
+def get_stage_key(stage: str, params: dict, input_key: str) -> str:
+    digest = hashlib.sha1(json.dumps([PIPELINE_VERSION, stage, params, input_key], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Runs one country through the stages. The keys only depend on the source and the parameters, so
+# they are worked out first and the pipeline resumes after the last stage that is cached.
+def build_country(geometry, stage_params: dict, cache: StageCache):
+    keys = []
+    key = get_geometry_key(geometry)
+    for stage, _ in STAGES:
+        key = get_stage_key(stage, stage_params[stage], key)
+        keys.append(key)
+    start = 0
+    for i in range(len(STAGES) - 1, -1, -1):
+        if cache.has(STAGES[i][0], keys[i]):
+            geometry = cache.load(STAGES[i][0], keys[i])
+            start = i + 1
+            break
+    for i in range(start, len(STAGES)):
+        stage, run_stage = STAGES[i]
+        geometry = run_stage(geometry, stage_params[stage])
+        cache.save(stage, keys[i], geometry)
+    return geometry
+
+
+# Helper returning the rings of a built country as lists of [x, y], rounded so the output files
+# are small and byte-for-byte reproducible.
+def get_rings(geometry, digits: int = 3) -> list:
+    return [np.round(np.asarray(polygon.exterior.coords), digits).tolist() for polygon in geometry.geoms]
+
+
+# The legacy country_coords.json holds one ring per country in degrees, which World projects
+# equirectangularly. The largest part is turned back into those degrees, so whatever projection
+# the pack was built with, the game draws the same outline from either file.
+def to_legacy_coords(ring: list, map_width: float, map_height: float, scale_factor: float) -> list:
+    xy = np.asarray(ring, dtype=np.float64)
+    lon = xy[:, 0] / (scale_factor * map_width / 360) - 180
+    lat = 90 - xy[:, 1] / (scale_factor * map_height / 180)
+    return np.round(np.column_stack((lon, lat)), 6).tolist()
+
+
+def write_json(path: str, data) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# Builds every selected country and writes the parts pack and the legacy file into out_dir.
+# Returns the build stats. Countries that fail validation are reported and left out.
+def build_map(countries: dict, out_dir: str, stage_params: dict, cache: StageCache) -> dict:
+    projection = stage_params["project"]
+    parts, legacy, failed = {}, {}, {}
+    for name, geometry in countries.items():
+        try:
+            built = build_country(geometry, stage_params, cache)
+        except ValueError as error:
+            failed[name] = str(error)
+            continue
+        parts[name] = get_rings(built)
+        legacy[name] = to_legacy_coords(parts[name][0], projection["map_width"], projection["map_height"], projection["scale_factor"])
+
+    os.makedirs(out_dir, exist_ok=True)
+    write_json(os.path.join(out_dir, PARTS_FILENAME), {
+        "version": PARTS_FILE_VERSION,
+        "projection": [projection["projection"], projection["map_width"], projection["map_height"], projection["scale_factor"]],
+        "countries": parts,
+    })
+    write_json(os.path.join(out_dir, LEGACY_FILENAME), legacy)
+    return {
+        "countries": len(parts),
+        "parts": sum(len(rings) for rings in parts.values()),
+        "vertices": sum(len(ring) for rings in parts.values() for ring in rings),
+        "failed": failed,
+    }
+
+
+# Helper collecting the parameters of every stage from the command line options.
+def get_stage_params(args) -> dict:
+    return {
+        "clean": {},
+        "project": {
+            "projection": args.projection,
+            "map_width": args.map_width,
+            "map_height": args.map_height,
+            "scale_factor": args.scale_factor,
+        },
+        "simplify": {"tolerance": args.tolerance, "min_area": args.min_area},
+        "validate": {},
+    }
+
+
+if __name__ == "__main__":
+    from src.geo import World
+
+    parser = argparse.ArgumentParser(description="Build the map data from Natural Earth country shapes.")
+    parser.add_argument("source", help="country shapes, GeoJSON or anything geopandas reads (e.g. ne_50m_admin_0_countries.shp)")
+    parser.add_argument("--preset", default="north-america", choices=sorted(PRESETS), help="continents and countries to keep")
+    parser.add_argument("--exclude", action="append", default=[], help="also leave out this country, can be repeated")
+    parser.add_argument("--include", action="append", default=[], help="keep this country whatever its continent, can be repeated")
+    parser.add_argument("--name-field", default="ADMIN", help="property holding the country name")
+    parser.add_argument("--continent-field", default="CONTINENT", help="property holding the continent")
+    parser.add_argument("--projection", default="equirectangular", choices=("equirectangular", "mercator"))
+    parser.add_argument("--map-width", type=float, default=World.MAP_WIDTH, help="width of the whole world in map units")
+    parser.add_argument("--map-height", type=float, default=World.MAP_HEIGHT, help="height of the whole world in map units")
+    parser.add_argument("--scale-factor", type=float, default=World.SCALE_FACTOR)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="simplification tolerance in map units, 0 keeps every vertex")
+    parser.add_argument("--min-area", type=float, default=4.0, help="drop parts smaller than this many square map units")
+    parser.add_argument("--out", default="./data", help=f"directory {PARTS_FILENAME} and {LEGACY_FILENAME} are written to")
+    parser.add_argument("--cache", default=CACHE_PATH, help="directory of the per-country stage cache")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    preset = PRESETS[args.preset]
+    features = read_features(args.source, args.name_field, args.continent_field)
+    countries = select_countries(features, preset["continents"], preset["exclude"] + args.exclude, args.include)
+    read = time.perf_counter()
+    cache = StageCache(args.cache)
+    stats = build_map(countries, args.out, get_stage_params(args), cache)
+    elapsed = time.perf_counter() - read
+
+    for name, error in stats["failed"].items():
+        print(f"  left out {name}: {error}")
+    print(
+        f"{stats['countries']} countries, {stats['parts']} parts, {stats['vertices']} vertices "
+        f"written to {args.out} in {elapsed * 1000:.0f}ms (source read in {(read - start) * 1000:.0f}ms)"
+    )
+    print(f"  stage cache: {cache.misses} computed, {cache.hits} reused")
+    if stats["failed"]:
+        raise SystemExit(1)
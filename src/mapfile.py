@@ -0,0 +1,269 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+# A compiled map is one file laid out as:
+#   MAGIC | uint32 header length | JSON header | padding to 8 bytes | float32 vertices (N x 2)
+# A country is made of one or more parts (islands, exclaves), each a closed ring. The header holds
+# the country names, where each country's parts start in the part table, and for every part an
+# offset/length into the vertex block plus its bounding box. A country's parts are stored back to
+# back, largest first. It also holds the hash of the JSON the map was compiled from and the
+# projection that was applied.
+# After the full outlines the block holds one simplified copy of every part per level of detail,
+# with its own offset/length table in the header.
+MAGIC = b"RISKMAP1"
+MAP_FILE_VERSION = 3
+MAX_PIXEL_ERROR = 0.5  # Largest on-screen error a level of detail may introduce.
+DEFAULT_ZOOMS = (1.0,)  # Zooms the map is drawn at when the caller doesn't list them.
+
+
+# Returns the sha1 of a file, read in chunks so large maps don't have to fit in memory twice.
+def file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Projects (longitude, latitude) pairs onto the flat map, the same formula World used per vertex.
+def project(lon_lat: np.ndarray, map_width: float, map_height: float, scale_factor: float = 1) -> np.ndarray:
+    xy = np.empty((len(lon_lat), 2), dtype=np.float64)
+    xy[:, 0] = (map_width / 360) * (180 + lon_lat[:, 0]) * scale_factor
+    xy[:, 1] = (map_height / 180) * (90 - lon_lat[:, 1]) * scale_factor
+    return xy
+
+
+# Douglas-Peucker: drops the vertices of a ring that are closer than `tolerance` to the simplified
+# outline. Iterative so huge outlines can't overflow the stack. Tiny rings are returned unchanged.
+def simplify_ring(ring: np.ndarray, tolerance: float) -> np.ndarray:
+    if len(ring) <= 4:
+        return ring
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = ring[start + 1:end]
+        direction = ring[end] - ring[start]
+        length = np.hypot(*direction)
+        offsets = inner - ring[start]
+        if length > 0:
+            distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        else:
+            # Closed rings start and end on the same point, measure the distance to that point instead
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    # A polygon needs at least three corners (four with the closing point). Islets smaller than the
+    # tolerance collapse below that, keep three evenly spaced corners rather than the full ring
+    if np.count_nonzero(keep) < 4:
+        keep[np.linspace(0, len(ring) - 1, 4).astype(int)] = True
+    return ring[keep]
+
+
+# Reads the parts of every country from either source format, in map units: the parts pack written
+# by src/geobuild.py is already projected, the legacy country_coords.json (one ring in degrees per
+# country) is projected here.
+def read_parts(geo_path: str, map_width: float, map_height: float, scale_factor: float = 1) -> dict:
+    with open(geo_path, "r", encoding="utf-8") as f:
+        geo_data = json.load(f)
+    if isinstance(geo_data.get("countries"), dict) and "projection" in geo_data:
+        return {
+            name: [np.asarray(ring, dtype=np.float64)[:, :2] for ring in rings]
+            for name, rings in geo_data["countries"].items()
+        }
+    return {
+        name: [project(np.asarray(coords, dtype=np.float64)[:, :2], map_width, map_height, scale_factor)]
+        for name, coords in geo_data.items()
+    }
+
+
+# Douglas-Peucker tolerances of LOD levels 1.. in map units, finest first: one level per zoom the map
+# is drawn at, simplified exactly as far as MAX_PIXEL_ERROR allows at that zoom. Level 0 stays exact,
+# it is what hit-testing and the adjacency graph use.
+def get_lod_tolerances(zooms) -> tuple:
+    return tuple(sorted({round(MAX_PIXEL_ERROR / zoom, 6) for zoom in zooms}))
+
+
+# Converts the country outlines into the compiled format, projecting every vertex once.
+def compile_map(geo_path: str, out_path: str, map_width: float, map_height: float, scale_factor: float = 1, zooms=DEFAULT_ZOOMS) -> None:
+    countries = read_parts(geo_path, map_width, map_height, scale_factor)
+
+    names, part_starts, offsets, lengths, bboxes, rings = [], [0], [], [], [], []
+    offset = 0
+    for name, parts in countries.items():
+        names.append(name)
+        for ring in parts:
+            offsets.append(offset)
+            lengths.append(len(ring))
+            bboxes.append([float(value) for value in (*ring.min(axis=0), *ring.max(axis=0))])
+            rings.append(ring)
+            offset += len(ring)
+        part_starts.append(len(rings))
+
+    # The levels of detail are appended after the full outlines, so level 0 keeps its layout
+    lods = []
+    for tolerance in get_lod_tolerances(zooms):
+        lod_offsets, lod_lengths = [], []
+        for ring in rings[:len(offsets)]:
+            simplified = simplify_ring(ring, tolerance)
+            lod_offsets.append(offset)
+            lod_lengths.append(len(simplified))
+            rings.append(simplified)
+            offset += len(simplified)
+        lods.append({"tolerance": tolerance, "offsets": lod_offsets, "lengths": lod_lengths})
+    vertices = np.concatenate(rings).astype(np.float32) if rings else np.empty((0, 2), dtype=np.float32)
+
+    header = json.dumps({
+        "version": MAP_FILE_VERSION,
+        "source_hash": file_hash(geo_path),
+        "projection": [map_width, map_height, scale_factor],
+        "names": names,
+        "part_starts": part_starts,
+        "offsets": offsets,
+        "lengths": lengths,
+        "bboxes": bboxes,
+        "lods": lods,
+        "vertex_count": len(vertices),
+    }).encode("utf-8")
+    data_offset = len(MAGIC) + 4 + len(header)
+    padding = -data_offset % 8
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(b"\0" * padding)
+        f.write(vertices.astype("<f4").tobytes())
+    os.replace(tmp_path, out_path)
+
+
+class CompiledMap:
+    # Read-only view of a compiled map. The vertex block is memory-mapped, so opening a map
+    # costs the same no matter how many countries or vertices it holds.
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a compiled map file")
+            (header_length,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_length).decode("utf-8"))
+        if header["version"] != MAP_FILE_VERSION:
+            raise ValueError(f"{path} was compiled with map file version {header['version']}")
+
+        data_offset = len(MAGIC) + 4 + header_length
+        data_offset += -data_offset % 8
+        self.path = path
+        self.source_hash = header["source_hash"]  # Hash of the JSON the map was compiled from.
+        self.projection = tuple(header["projection"])  # (map_width, map_height, scale_factor).
+        self.names = header["names"]  # Country names, in file order.
+        self.part_starts = header["part_starts"]  # Parts of country i are part_starts[i] to part_starts[i + 1] - 1.
+        self.offsets = header["offsets"]  # First vertex of each part in the vertex block.
+        self.lengths = header["lengths"]  # Number of vertices of each part.
+        self.bboxes = [tuple(bbox) for bbox in header["bboxes"]]  # (min_x, min_y, max_x, max_y) of each part.
+        self.lods = header["lods"]  # Tolerance and offset/length table of every simplified level, coarser last.
+        self.lod_tolerances = tuple(lod["tolerance"] for lod in self.lods)
+        if header["vertex_count"]:
+            # A plain ndarray view of the mapping: slicing and arithmetic on np.memmap objects cost about
+            # ten times more, which adds up with a view per part and level of detail
+            self.vertices = np.memmap(path, dtype="<f4", mode="r", offset=data_offset, shape=(header["vertex_count"], 2)).view(np.ndarray)
+        else:
+            self.vertices = np.empty((0, 2), dtype=np.float32)
+
+    # Returns the projected outline of one part as an (N, 2) view. Level 0 is the exact outline,
+    # higher levels are simplified with lod_tolerances.
+    def get_part_coords(self, part: int, level: int = 0) -> np.ndarray:
+        if level == 0:
+            offset, length = self.offsets[part], self.lengths[part]
+        else:
+            lod = self.lods[level - 1]
+            offset, length = lod["offsets"][part], lod["lengths"][part]
+        return self.vertices[offset:offset + length]
+
+    # Returns the parts of the country at position `index` as views, largest first.
+    def get_parts(self, index: int, level: int = 0) -> list:
+        return [self.get_part_coords(part, level) for part in range(self.part_starts[index], self.part_starts[index + 1])]
+
+    # Returns the outline of the country's largest part, e.g. to place its label.
+    def get_coords(self, index: int, level: int = 0) -> np.ndarray:
+        return self.get_part_coords(self.part_starts[index], level)
+
+    # Returns the parts of a country at every level of detail, exact first.
+    def get_lods(self, index: int) -> list:
+        return [self.get_parts(index, level) for level in range(len(self.lods) + 1)]
+
+    # Returns the bounding box of every part of a country.
+    def get_part_bboxes(self, index: int) -> list:
+        return self.bboxes[self.part_starts[index]:self.part_starts[index + 1]]
+
+    # Picks the coarsest level whose simplification stays under MAX_PIXEL_ERROR at this zoom. The
+    # tolerances are rounded when compiled, the small margin keeps the level meant for a zoom.
+    def get_lod_level(self, zoom: float) -> int:
+        level = 0
+        for i, tolerance in enumerate(self.lod_tolerances):
+            if tolerance * zoom <= MAX_PIXEL_ERROR * 1.000001:
+                level = i + 1
+        return level
+
+    # Returns the simplified levels none of the zooms would draw, they only cost disk and memory.
+    def get_unreachable_levels(self, zooms) -> list:
+        reached = {self.get_lod_level(zoom) for zoom in zooms}
+        return [level for level in range(1, len(self.lods) + 1) if level not in reached]
+
+    # Iterates over (name, parts) pairs in file order.
+    def items(self):
+        for index, name in enumerate(self.names):
+            yield name, self.get_parts(index)
+
+
+# Opens the compiled map, (re)compiling it first when the JSON, the projection or the zooms changed.
+# If only the compiled file is shipped (no JSON next to it) it is used as is.
+def load_or_compile_map(geo_path: str, map_path: str, map_width: float, map_height: float, scale_factor: float = 1, zooms=DEFAULT_ZOOMS) -> CompiledMap:
+    if os.path.exists(map_path):
+        try:
+            compiled = CompiledMap(map_path)
+        except ValueError:
+            # Written by an older version of this module, compile it again below
+            if not os.path.exists(geo_path):
+                raise
+            compiled = None
+        if compiled is not None and not os.path.exists(geo_path):
+            return compiled
+        if (
+            compiled is not None
+            and compiled.source_hash == file_hash(geo_path)
+            and compiled.projection == (map_width, map_height, scale_factor)
+            and compiled.lod_tolerances == get_lod_tolerances(zooms)
+        ):
+            return compiled
+    compile_map(geo_path, map_path, map_width, map_height, scale_factor, zooms)
+    compiled = CompiledMap(map_path)
+    unreachable = compiled.get_unreachable_levels(zooms)
+    if unreachable:
+        raise ValueError(f"levels of detail {unreachable} of {map_path} can't be reached at zooms {zooms}")
+    return compiled
+
+
+if __name__ == "__main__":
+    from src.geo import World
+
+    parser = argparse.ArgumentParser(description="Compile country outlines into the binary map format.")
+    parser.add_argument("geo_path", nargs="?", default=World.get_geo_data_path(), help="parts pack or legacy country_coords.json")
+    parser.add_argument("map_path", nargs="?", default=World.MAP_PATH)
+    args = parser.parse_args()
+    compile_map(args.geo_path, args.map_path, World.MAP_WIDTH, World.MAP_HEIGHT, World.SCALE_FACTOR, World.get_zooms())
+    compiled = CompiledMap(args.map_path)
+    print(f"Wrote {args.map_path}: {len(compiled.names)} countries, {len(compiled.offsets)} parts, {sum(compiled.lengths)} vertices")
+    for level, lod in enumerate(compiled.lods, 1):
+        print(f"  LOD {level} (tolerance {lod['tolerance']}): {sum(lod['lengths'])} vertices")
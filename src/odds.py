@@ -0,0 +1,117 @@
+import itertools
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# Exact battle odds. A battle is a Markov chain over (attacking units, defending units): every
+# round the attacker rolls up to 3 dice (keeping one unit at home) and the defender up to 2, and
+# each round moves the chain to a state with fewer units until the defender is wiped out or the
+# attacker is down to one unit. Unit counts mean the same as in Dice.battle.
+
+ODDS_TABLE_PATH = "./data/odds_table.npz"  # Precomputed tables, rebuilt if missing or too small.
+DEFAULT_CAP = 60  # Largest unit count on either side covered by the precomputed table.
+
+
+# Returns the possible (attacker losses, defender losses, probability) of one round, found by
+# enumerating every combination of dice. There are only six distinct dice counts, so this is cached.
+@lru_cache(maxsize=None)
+def get_round_outcomes(num_attacker_dice: int, num_defender_dice: int) -> tuple:
+    counts = {}
+    for roll in itertools.product(range(1, 7), repeat=num_attacker_dice + num_defender_dice):
+        attacker_dice = sorted(roll[:num_attacker_dice], reverse=True)
+        defender_dice = sorted(roll[num_attacker_dice:], reverse=True)
+        attacker_losses = defender_losses = 0
+        for attacker_roll, defender_roll in zip(attacker_dice, defender_dice):
+            if attacker_roll > defender_roll:
+                defender_losses += 1
+            else:
+                attacker_losses += 1
+        counts[(attacker_losses, defender_losses)] = counts.get((attacker_losses, defender_losses), 0) + 1
+    total = 6 ** (num_attacker_dice + num_defender_dice)
+    return tuple((losses[0], losses[1], count / total) for losses, count in sorted(counts.items()))
+
+
+# Fills (max_attackers + 1) x (max_defenders + 1) tables of win probability and expected losses.
+# Every round only leads to states with fewer units, so one pass in increasing order is enough.
+def build_tables(max_attackers: int, max_defenders: int) -> tuple:
+    win = np.zeros((max_attackers + 1, max_defenders + 1))
+    attacker_losses = np.zeros_like(win)
+    defender_losses = np.zeros_like(win)
+    win[:, 0] = 1.0
+    for attackers in range(2, max_attackers + 1):
+        for defenders in range(1, max_defenders + 1):
+            outcomes = get_round_outcomes(min(3, attackers - 1), min(2, defenders))
+            for lost_attackers, lost_defenders, probability in outcomes:
+                next_attackers, next_defenders = attackers - lost_attackers, defenders - lost_defenders
+                win[attackers, defenders] += probability * win[next_attackers, next_defenders]
+                attacker_losses[attackers, defenders] += probability * (
+                    lost_attackers + attacker_losses[next_attackers, next_defenders]
+                )
+                defender_losses[attackers, defenders] += probability * (
+                    lost_defenders + defender_losses[next_attackers, next_defenders]
+                )
+    return win, attacker_losses, defender_losses
+
+
+# Exact odds for a single battle bigger than any table, memoized per pair.
+@lru_cache(maxsize=4096)
+def compute_odds(attackers: int, defenders: int) -> tuple:
+    win, attacker_losses, defender_losses = build_tables(attackers, defenders)
+    return (
+        float(win[attackers, defenders]),
+        float(attacker_losses[attackers, defenders]),
+        float(defender_losses[attackers, defenders]),
+    )
+
+
+class OddsTable:
+    # Precomputed odds for every battle up to `cap` units on each side, answered in O(1).
+    def __init__(self, cap: int = DEFAULT_CAP, tables: tuple = None) -> None:
+        self.cap = cap
+        self.win, self.attacker_losses, self.defender_losses = tables if tables is not None else build_tables(cap, cap)
+
+    # Returns (chance the attacker conquers the territory, expected attacker losses, expected defender losses).
+    def get(self, attackers: int, defenders: int) -> tuple:
+        if attackers <= self.cap and defenders <= self.cap:
+            return (
+                float(self.win[attackers, defenders]),
+                float(self.attacker_losses[attackers, defenders]),
+                float(self.defender_losses[attackers, defenders]),
+            )
+        return compute_odds(attackers, defenders)
+
+    def get_win_probability(self, attackers: int, defenders: int) -> float:
+        return self.get(attackers, defenders)[0]
+
+    def save(self, path: str) -> None:
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, win=self.win, attacker_losses=self.attacker_losses, defender_losses=self.defender_losses)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "OddsTable":
+        with np.load(path) as data:
+            tables = (data["win"], data["attacker_losses"], data["defender_losses"])
+        return cls(tables[0].shape[0] - 1, tables)
+
+
+_odds_table = None
+
+
+# Returns the shared odds table, loading it from disk or computing and saving it the first time.
+def get_odds_table(cap: int = DEFAULT_CAP, path: str = ODDS_TABLE_PATH) -> OddsTable:
+    global _odds_table
+    if _odds_table is not None and _odds_table.cap >= cap:
+        return _odds_table
+    try:
+        _odds_table = OddsTable.load(path)
+    except (OSError, KeyError, ValueError):
+        _odds_table = None
+    if _odds_table is None or _odds_table.cap < cap:
+        _odds_table = OddsTable(cap)
+        try:
+            _odds_table.save(path)
+        except OSError:
+            pass
+    return _odds_table
@@ -1,12 +1,13 @@
 import pygame
 import random
 from src.geo import World, Country
-from src.dice import Dice
+from src.rules import Attack, Blitz, Place
 
 # Assuming the necessary classes are imported from their respective modules
 class Player:
-    def __init__(self, game, name, country: Country, world: World, color: tuple) -> None:
+    def __init__(self, game, name, country: Country, world: World, color: tuple, strategy=None) -> None:
         self.name = name #players name
+        self.strategy = strategy #src.ai Strategy choosing this player's actions, None for a human player
         self.game = game #reference to game instance
         self.country = country # the starting country for the player 
         self.countries = [] # list of countries owned by the player
@@ -14,50 +15,31 @@ class Player:
         self.plus_button_pos = (0, 0)  # coordinates for the + button
         self.minus_button_pos = (0, 0) # coordinates for the - button
         self.color = color #color assigned ot the player
-        self.mouse_get_pressed= pygame.mouse.get_pressed
         self.country.color = self.color #color of the countries
-        self.timer = pygame.time.get_ticks() # pygame timeer to contorl tick rate
-        self.controlled_countries = [self.country.name] #list of countries controlled by player, initialized with countries name
-        self.neighbours = self.get_neighbours() #neighboring countries of the player's controlled countries 
-
-    #update mehtod to handle different phases of the game
-    def update(self, phase: str) -> None:
-        if phase == "place_units":
-            self.place_units()
-        elif phase == "attack_country":
-            self.attack_country()
-
-    #place units method for placing new units on the player's countries
-    def place_units(self) -> None:
-        #get a list of countries the player can navigate to 
-        navigable_countries = self.get_navigable_countries()
-        now = pygame.time.get_ticks()
-        # loop through the navigable countries and place units on hovered country when clicked
-        for navigable_country in navigable_countries:
-            if navigable_country.hovered and pygame.mouse.get_pressed()[0] and (now - self.timer > 300):
-                self.timer = now
-                navigable_country.units += 1 #increase units by 1
-
-    def get_navigable_countries(self) -> list:
-        navigable_countries = []
-        print(f"\n>> CURRENT CONTROLLED COUNTRIES PRE-ITERATION: {self.controlled_countries}")
-        for name_of_country in self.controlled_countries:
-            controlled_country = self.world.countries.get(name_of_country)
-            print(f"\t>> CURRENT NAVIGABLE COUNTRIES PRE-ADDITION OF CONTROLLED COUNTRY: {navigable_countries}")
-            navigable_countries.append(controlled_country)
-            print(f"\t>> CURRENT NAVIGABLE COUNTRIES POST-ADDITION OF CONTROLLED COUNTRY: {navigable_countries}")
-            names_of_neighboring_countries = self.world.get_country_neighbours(name_of_country)
-            print(f"\t>> CURRENT NEIGHBORING COUNTRIES FOR COUNTRY={name_of_country}: {self.world.get_country_neighbours(name_of_country)}")
-            for name_of_neighbor in names_of_neighboring_countries:
-                neighboring_country= self.world.countries.get(name_of_neighbor)
-                navigable_countries.append(neighboring_country)
-
-        now = pg.time.get_ticks()      
-        for navigable_country in navigable_countries:
-            if navigable_country.hovered and pg.mouse.get_pressed()[0] and (now - self.timer > 300):
-                self.timer = now
-                navigable_country.units += 1 #increment code to add armies
-
+        self.country.owner = self #the player starts out owning its country
+        self.last_attack = None #(attacking, defending) countries of the last attack, repeated by roll_dice
+        # The sets below are kept up to date as countries are won and lost instead of being rebuilt every frame
+        self.controlled_countries = set() #names of the countries controlled by the player
+        self.neighbours = set() #names of the countries bordering the player's countries (the frontier)
+        self.navigable_countries = set() #country objects the player can interact with: its own and the frontier
+        self.add_country(self.country)
+
+    #True for computer players, the game asks their strategy for actions instead of waiting for clicks
+    def is_ai(self) -> bool:
+        return self.strategy is not None
+
+    #called by the game once for every click on a country, what it does depends on the phase
+    def on_country_click(self, country: Country, button: int, phase: str) -> None:
+        if phase == "place_units" and button == 1:
+            self.place_units(country)
+        elif phase == "attack_country" and button in (1, 3):
+            self.attack_country(country, blitz=button == 3)
+
+    #place units method for placing a new unit on a clicked country
+    def place_units(self, country: Country) -> None:
+        # only countries the player can navigate to, the rules engine checks it is ours and we have units left
+        if country in self.navigable_countries:
+            self.game.apply_action(Place(country.index))
 
                 ##### COMMENTED OUT CODE 
     # def place_units(self) -> None:
@@ -90,11 +72,6 @@ class Player:
 
 
 
-    # Helper function to determine if a button is clicked
-    def button_clicked(self, button_pos) -> bool:
-        button_rect = pygame.Rect(button_pos, (30, 30))
-        return button_rect.collidepoint(pygame.mouse.get_pos()) and pygame.mouse.get_pressed()[0]
-    
     # Increment units for a country
     def increment_units(self, country):
         country.units += 1
@@ -114,62 +91,73 @@ class Player:
     #             self.timer = now
     #             navigable_country.units += 1
 
-    def get_navigable_countries(self) -> list:
-        navigable_countries = []
-        print(f"\n>> CURRENT CONTROLLED COUNTRIES PRE-ITERATION: {self.controlled_countries}")
-        for name_of_country in self.controlled_countries:
-            controlled_country = self.world.countries.get(name_of_country)
-            print(f"\t>> CURRENT NAVIGABLE COUNTRIES PRE-ADDITION OF CONTROLLED COUNTRY: {navigable_countries}")
-            navigable_countries.append(controlled_country)
-            print(f"\t>> CURRENT NAVIGABLE COUNTRIES POST-ADDITION OF CONTROLLED COUNTRY: {navigable_countries}")
-            names_of_neighboring_countries = self.world.get_country_neighbours(name_of_country)
-            print(f"\t>> CURRENT NEIGHBORING COUNTRIES FOR COUNTRY={name_of_country}: {self.world.get_country_neighbours(name_of_country)}")
-            for name_of_neighbor in names_of_neighboring_countries:
-                neighboring_country = self.world.countries.get(name_of_neighbor)
-                if neighboring_country not in navigable_countries:
-                    print(f"\t\t>> CURRENT NAVIGABLE COUNTRIES PRE-ADDITION OF NEIGHBORING COUNTRY: {navigable_countries}")
-                    navigable_countries.append(neighboring_country)
-                    print(f"\t\t>> CURRENT NAVIGABLE COUNTRIES POST-ADDITION OF NEIGHBORING COUNTRY: {navigable_countries}")
-        print(f"\nFINAL NAVIGABLE COUNTRIES: {navigable_countries}\n")
-        return navigable_countries
-    #method to attack another country
-    def attack_country(self):
-        attacking_country = self.country #sets attacking_country to players current country
-        defending_country = None
-        for each_country in self.world.countries.values(): #iterates over all countries to find a country not in "attacking_country"
-            if each_country != attacking_country and each_country.hovered and pygame.mouse.get_pressed()[0]:
-                defending_country = each_country
-                break
-
-        if defending_country: #if a defending country is found, execute attack
-            self.execute_attack(attacking_country, defending_country)
-    
-    # An attack method using the roll dice method 
-    def execute_attack(self, attacking_country, defending_country):
-        attacker_dice = Dice.attacker_dice_roll(min(3, attacking_country.units - 1))
-        defender_dice = Dice.defender_dice_roll(min(2, defending_country.units))
-
-        for attacker_roll, defender_roll in zip(attacker_dice, defender_dice):
-            if attacker_roll > defender_roll:
-                defending_country.units -= 1
-                print(defending_country.units)
-            else:
-                attacking_country.units -= 1
-                print(attacking_country.units)
-
-        if defending_country.units <= 0:
-            self.transfer_ownership(attacking_country, defending_country)
-
-    def transfer_ownership(self, attacking_country, defending_country):
+    def get_navigable_countries(self) -> set:
+        return self.navigable_countries
+
+    #method to attack a clicked country from our strongest country next to it
+    def attack_country(self, defending_country: Country, blitz: bool = False):
+        attacking_country = self.get_attacking_country(defending_country)
+        if attacking_country is not None:
+            self.execute_attack(attacking_country, defending_country, blitz)
+
+    #rolls another round of dice for the last attack, used by the game's "Roll Dice" button
+    def roll_dice(self) -> bool:
+        if self.last_attack is None:
+            return False
+        attacking_country, defending_country = self.last_attack
+        return self.game.apply_action(Attack(attacking_country.index, defending_country.index))
+
+    # Returns our country with the most units next to defending_country, or None if we don't border it
+    def get_attacking_country(self, defending_country):
+        if defending_country.owner is self:
+            return None
+        attacking_countries = [self.world.countries[name] for name in defending_country.neighbours
+                               if name in self.controlled_countries]
+        return max(attacking_countries, key=lambda country: country.units, default=None)
+
+    # An attack method, the rules engine rolls the dice and updates both countries.
+    # A left click rolls a single round, a right click fights the whole battle at once.
+    def execute_attack(self, attacking_country, defending_country, blitz=False):
+        action = Blitz if blitz else Attack
+        self.last_attack = (attacking_country, defending_country)
+        self.game.apply_action(action(attacking_country.index, defending_country.index))
+
+    # Called by the game when the rules engine hands a conquered country to this player
+    def transfer_ownership(self, defending_country):
+        previous_owner = defending_country.owner
+        if previous_owner is not None and previous_owner is not self:
+            previous_owner.remove_country(defending_country)
         defending_country.owner = self
-        defending_country.units = attacking_country.units - 1
-        attacking_country.units -= 1
+        defending_country.color = self.color
+        self.add_country(defending_country)
+
+    # Adds a country to the controlled set and grows the frontier around it, O(neighbours of the country)
+    def add_country(self, country):
+        self.controlled_countries.add(country.name)
+        self.navigable_countries.add(country)
+        self.neighbours.discard(country.name)
+        for name in country.neighbours:
+            if name not in self.controlled_countries and name not in self.neighbours:
+                self.neighbours.add(name)
+                self.navigable_countries.add(self.world.countries[name])
+
+    # Removes a lost country and shrinks the frontier where nothing of ours borders it any more
+    def remove_country(self, country):
+        self.controlled_countries.discard(country.name)
+        self.navigable_countries.discard(country)
+        for name in list(country.neighbours) + [country.name]:
+            if name in self.controlled_countries:
+                continue
+            borders_us = any(other in self.controlled_countries for other in self.world.countries[name].neighbours)
+            if borders_us and name not in self.neighbours:
+                self.neighbours.add(name)
+                self.navigable_countries.add(self.world.countries[name])
+            elif not borders_us and name in self.neighbours:
+                self.neighbours.discard(name)
+                self.navigable_countries.discard(self.world.countries[name])
 
     def get_neighbours(self) -> set:
-        neighbours = {neighbour for country in self.controlled_countries
-                      for neighbour in self.world.countries[country].neighbours
-                      if neighbour not in self.controlled_countries}
-        return neighbours
+        return self.neighbours
     
         ### COMMENTED OUT CODE
   # def update_dice_display(self, attacker_dice, defender_dice):
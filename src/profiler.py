@@ -0,0 +1,134 @@
+import csv
+import json
+import logging
+import time
+from collections import deque
+
+import pygame
+
+from src.utils import draw_multiline_text
+
+logger = logging.getLogger(__name__)
+
+
+class NullSection:
+    # Stand-in used while profiling is off, entering and leaving it does nothing.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SECTION = NullSection()
+
+
+class Section:
+    # Times one named part of the frame and adds it to the profiler's current frame.
+    def __init__(self, profiler, name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed_ms = (time.perf_counter() - self.start) * 1000
+        self.profiler.current[self.name] = self.profiler.current.get(self.name, 0.0) + elapsed_ms
+        return False
+
+
+class FrameProfiler:
+    # Opt-in per-frame timings. Keeps the last `window` frames of every section to report rolling
+    # p50/p95/p99, can draw them as an overlay and dump every recorded frame to CSV or JSON.
+    SECTIONS = ("events", "simulation", "world.update", "player.update", "world.draw", "draw_phase_ui", "frame")
+
+    def __init__(self, enabled: bool = False, show_overlay: bool = True, window: int = 600, history: int = 100000) -> None:
+        self.enabled = enabled
+        self.show_overlay = show_overlay  # Whether draw_overlay puts the numbers on screen.
+        self.window = window  # Number of recent frames the percentiles are computed over.
+        self.samples = {name: deque(maxlen=window) for name in self.SECTIONS}  # Recent timings per section in ms.
+        self.frames = deque(maxlen=history)  # Every recorded frame as a dict, for dumping.
+        self.current = {}  # Timings of the frame being recorded.
+        self.sections = {name: Section(self, name) for name in self.SECTIONS}
+        self.frame_start = 0.0
+        self.frame_count = 0
+        self.overlay_lines = []  # Text of the overlay, refreshed a few times per second.
+        self.overlay_rect = pygame.Rect(0, 0, 360, 20 * (len(self.SECTIONS) + 1))  # Placed top right when drawn.
+
+    # Returns a context manager timing a section of the frame, or a shared no-op one when disabled.
+    def section(self, name: str):
+        if not self.enabled:
+            return NULL_SECTION
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(self, name)
+            self.samples[name] = deque(maxlen=self.window)
+        return section
+
+    def begin_frame(self) -> None:
+        if self.enabled:
+            self.current = {}
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self) -> None:
+        if not self.enabled:
+            return
+        self.current["frame"] = (time.perf_counter() - self.frame_start) * 1000
+        for name, elapsed_ms in self.current.items():
+            self.samples[name].append(elapsed_ms)
+        self.frames.append(dict(self.current, index=self.frame_count))
+        self.frame_count += 1
+
+    # Returns the (p50, p95, p99) of a section over the rolling window, in milliseconds.
+    def get_percentiles(self, name: str) -> tuple:
+        samples = sorted(self.samples[name])
+        if not samples:
+            return (0.0, 0.0, 0.0)
+        last = len(samples) - 1
+        return tuple(samples[round(last * q)] for q in (0.50, 0.95, 0.99))
+
+    def get_report(self) -> dict:
+        return {
+            name: dict(zip(("p50", "p95", "p99"), self.get_percentiles(name)))
+            for name in self.samples
+            if self.samples[name]
+        }
+
+    # Draws the percentiles on screen and returns the rect it covered, or None when disabled.
+    # The text is only recomputed every 30 frames so the overlay itself stays cheap.
+    def draw_overlay(self, screen: pygame.Surface, font: pygame.font.Font):
+        if not (self.enabled and self.show_overlay):
+            return None
+        if self.frame_count % 30 == 0 or not self.overlay_lines:
+            self.overlay_lines = ["section          p50    p95    p99 (ms)"]
+            for name in self.samples:
+                if self.samples[name]:
+                    p50, p95, p99 = self.get_percentiles(name)
+                    self.overlay_lines.append(f"{name:<15}{p50:6.2f} {p95:6.2f} {p99:6.2f}")
+        self.overlay_rect.topright = (screen.get_width() - 10, 10)
+        screen.fill((0, 0, 0), self.overlay_rect)
+        draw_multiline_text(screen, font, self.overlay_lines, (255, 255, 255), *self.overlay_rect.topleft, False, 16)
+        return self.overlay_rect
+
+    def dump_csv(self, path: str) -> None:
+        names = list(self.samples)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["index"] + names)
+            writer.writeheader()
+            for frame in self.frames:
+                writer.writerow(frame)
+
+    def dump_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"percentiles": self.get_report(), "frames": list(self.frames)}, f)
+
+    # Writes the recorded frames to a .csv or .json file depending on the extension.
+    def dump(self, path: str) -> None:
+        if path.endswith(".csv"):
+            self.dump_csv(path)
+        else:
+            self.dump_json(path)
+        logger.info("Wrote %d profiled frames to %s", len(self.frames), path)
@@ -0,0 +1,80 @@
+import json
+
+from src.rules import Attack, Blitz, EndPhase, GameState, Move, Place
+
+# Messages between the game server and its clients: one JSON object per line. The board and the
+# full state are only sent once, when a match starts; after that the server sends one delta per
+# tick with just the territories that changed, as [territory id, owner, units], and the turn info.
+#
+# client -> server
+#   {"type": "join", "match": name, "players": n, "name": player name}
+#   {"type": "action", "action": ["place", 3]}
+# server -> client
+#   {"type": "welcome", "match": name, "player": seat, "players": n}
+#   {"type": "start", "board": {...}, "owners": [...], "units": [...], **turn info}
+#   {"type": "delta", "tick": n, "territories": [[id, owner, units], ...], **turn info}
+#   {"type": "error", "message": text}
+
+ACTION_TYPES = {"place": Place, "move": Move, "attack": Attack, "blitz": Blitz, "end_phase": EndPhase}
+ACTION_NAMES = {action_type: name for name, action_type in ACTION_TYPES.items()}
+TURN_FIELDS = ("phase", "current_player", "turn", "reinforcements", "moves_left")  # Sent with every delta.
+
+
+def encode_message(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def decode_message(line: bytes) -> dict:
+    message = json.loads(line)
+    if not isinstance(message, dict) or "type" not in message:
+        raise ValueError("messages must be objects with a type")
+    return message
+
+
+def encode_action(action) -> list:
+    return [ACTION_NAMES[type(action)], *action]
+
+
+# Turns a received action back into a rules action, territory ids must be below num_territories.
+def decode_action(data: list, num_territories: int):
+    if not isinstance(data, list) or not data or data[0] not in ACTION_TYPES:
+        raise ValueError(f"unknown action {data!r}")
+    action_type = ACTION_TYPES[data[0]]
+    if len(data) - 1 != len(action_type._fields) or not all(type(value) is int for value in data[1:]):
+        raise ValueError(f"malformed action {data!r}")
+    for field, value in zip(action_type._fields, data[1:]):
+        if value < 0 or (field != "units" and value >= num_territories):
+            raise ValueError(f"{field} {value} out of range in {data!r}")
+    return action_type(*data[1:])
+
+
+# Helper returning the turn info of a state plus its winner and last dice.
+def get_turn_info(state: GameState) -> dict:
+    info = {field: getattr(state, field) for field in TURN_FIELDS}
+    info["winner"] = state.get_winner()
+    info["dice"] = state.last_dice
+    return info
+
+
+# Builds the client's copy of the state from a start message.
+def create_state(board, message: dict) -> GameState:
+    state = GameState(board, message["players"], message["owners"], message["units"])
+    set_turn_info(state, message)
+    return state
+
+
+# Applies a delta message to the client's copy of the state.
+def apply_delta(state: GameState, message: dict) -> list:
+    changed = []
+    for territory, owner, units in message["territories"]:
+        state.set_owner(territory, owner)
+        state.set_units(territory, units)
+        changed.append(territory)
+    set_turn_info(state, message)
+    return changed
+
+
+def set_turn_info(state: GameState, message: dict) -> None:
+    for field in TURN_FIELDS:
+        setattr(state, field, message[field])
+    state.last_dice = message.get("dice")
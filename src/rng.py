@@ -0,0 +1,64 @@
+import random
+
+import numpy as np
+
+# Reproducible randomness. Every game owns one GameRandom derived from a master seed through numpy's
+# SeedSequence, which hands out independent streams for the board setup, the dice and each computer
+# player. Parallel games and workers get their own spawned sequences, so they never share or collide
+# on generator state, and the same seed always plays out bit for bit the same.
+
+DICE_BLOCK = 4096  # Dice drawn from numpy per call.
+
+
+class DiceStream:
+    # Six-sided dice drawn from a numpy Generator in blocks, so a roll is a list slice instead of a
+    # generator call. The dice only depend on the seed and on how many were rolled before, not on
+    # how they were grouped into rolls. Not thread-safe, every game and search has its own stream.
+    __slots__ = ("generator", "block_size", "block", "position")
+
+    def __init__(self, seed=None, block_size: int = DICE_BLOCK) -> None:
+        self.generator = np.random.default_rng(seed)  # Accepts an int, a SeedSequence or a Generator.
+        self.block_size = block_size
+        self.block = []  # Pre-drawn dice as Python ints.
+        self.position = 0  # Next unused die in block.
+
+    def roll(self, count: int) -> list:
+        position = self.position
+        if position + count > len(self.block):
+            # Dice left over from the last block are used first, so nothing is skipped. They are drawn as
+            # int64: for small dtypes numpy buffers random bits between calls and the block size would matter
+            self.block = self.block[position:] + self.generator.integers(1, 7, size=self.block_size).tolist()
+            position = 0
+        self.position = position + count
+        return self.block[position:position + count]
+
+
+class GameRandom:
+    # The random streams of one game. `seed` may be an int, a SeedSequence or None for fresh entropy.
+    def __init__(self, seed=None) -> None:
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        setup, dice, players = self.seed_sequence.spawn(3)
+        self.setup = np.random.default_rng(setup)  # Starting units, starting territories and seats.
+        self.dice = DiceStream(dice)  # Every battle of the game.
+        self.players = players  # Spawns one seed per computer player, see get_player_random.
+
+    # The streams of game number `game` of a series started from `seed`, e.g. one tournament game.
+    @classmethod
+    def for_game(cls, seed: int, game: int) -> "GameRandom":
+        return cls(np.random.SeedSequence(seed, spawn_key=(game,)))
+
+    # Independent GameRandoms for `count` parallel games or workers.
+    def spawn(self, count: int) -> list:
+        return [GameRandom(sequence) for sequence in self.seed_sequence.spawn(count)]
+
+    # A random.Random of its own for the next computer player, strategies use the stdlib API.
+    def get_player_random(self) -> random.Random:
+        return random.Random(int(self.players.spawn(1)[0].generate_state(1, np.uint64)[0]))
+
+    # Helper method returning 1-3 starting units for `count` territories.
+    def roll_starting_units(self, count: int) -> list:
+        return self.setup.integers(1, 4, size=count).tolist()
+
+    # Picks `count` different items of `population`.
+    def sample(self, population: list, count: int) -> list:
+        return [population[index] for index in self.setup.choice(len(population), size=count, replace=False)]
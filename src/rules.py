@@ -0,0 +1,335 @@
+from array import array
+import random
+from collections import namedtuple
+
+from src.adjacency import read_adjacency
+from src.dice import Dice
+from src.rng import DiceStream, GameRandom
+
+# The rules of the game without any pygame: territories, owners, unit counts, phases and the
+# moves that are legal in them. The pygame Game is one front end that feeds it actions, batch
+# jobs and AIs can drive it directly.
+
+PHASES = ("place_units", "move_units", "attack_country")  # Same order as Game.phases.
+PLACE, MOVE, ATTACK = range(len(PHASES))
+NEUTRAL = -1  # Owner of territories that no player controls.
+MAX_PLAYERS = 8  # Most players a state can hash, owners are stored as signed bytes.
+HASHED_UNITS = 256  # Unit counts up to this have a precomputed Zobrist key, larger ones are mixed on the fly.
+ZOBRIST_SEED = 0x5EED  # Fixed so hashes are the same in every process, e.g. for shared transposition tables.
+
+# Actions a player can take. Territories are referred to by their index on the Board.
+Place = namedtuple("Place", ["territory"])  # Put one reinforcement on an owned territory.
+Move = namedtuple("Move", ["source", "target", "units"])  # Move units between two adjacent owned territories.
+Attack = namedtuple("Attack", ["source", "target"])  # Roll one round of dice against an adjacent enemy territory.
+Blitz = namedtuple("Blitz", ["source", "target"])  # Keep attacking until the target falls or one attacker is left.
+EndPhase = namedtuple("EndPhase", [])  # Finish the current phase, the attack phase also ends the turn.
+
+
+# Helper mixing a number into a well spread 64 bit key (splitmix64), for unit counts without a table entry.
+def mix64(value: int) -> int:
+    value = (value + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return value ^ (value >> 31)
+
+
+class Board:
+    # The fixed part of the game: territory names, which territories are adjacent and the random
+    # Zobrist keys GameState hashes owners, units and turn info with.
+    __slots__ = (
+        "names", "index", "neighbours", "neighbour_sets",
+        "owner_keys", "unit_keys", "phase_keys", "player_keys", "reinforcement_keys", "moves_keys",
+    )
+
+    def __init__(self, names: list, neighbours: dict) -> None:
+        self.names = list(names)  # Territory names, the position in this list is the territory id.
+        self.index = {name: i for i, name in enumerate(self.names)}  # Territory id for a name.
+        # Neighbour ids of every territory, as tuples for iteration and frozensets for membership tests.
+        self.neighbours = tuple(
+            tuple(sorted(self.index[other] for other in neighbours[name] if other in self.index))
+            for name in self.names
+        )
+        self.neighbour_sets = tuple(frozenset(linked) for linked in self.neighbours)
+
+        # Zobrist keys: the hash of a state is the xor of one key per (territory, owner), per
+        # (territory, units) and per turn detail, so changing one value costs two xors
+        rng = random.Random(ZOBRIST_SEED)
+        key = lambda: rng.getrandbits(64)
+        self.owner_keys = tuple(tuple(key() for _ in range(MAX_PLAYERS + 1)) for _ in self.names)  # [territory][owner + 1]
+        self.unit_keys = tuple(tuple(key() for _ in range(HASHED_UNITS)) for _ in self.names)  # [territory][units]
+        self.phase_keys = tuple(key() for _ in PHASES)
+        self.player_keys = tuple(key() for _ in range(MAX_PLAYERS))
+        self.reinforcement_keys = tuple(key() for _ in range(HASHED_UNITS))
+        self.moves_keys = tuple(key() for _ in range(2))
+
+    # Builds a board straight from the cached adjacency graph, no map geometry or display needed.
+    @classmethod
+    def from_adjacency_file(cls, cache_path: str) -> "Board":
+        neighbours = read_adjacency(cache_path)
+        return cls(sorted(neighbours), neighbours)
+
+    # Plain names and neighbour ids, e.g. for the game log header or to send the board to clients.
+    def to_dict(self) -> dict:
+        return {"names": self.names, "neighbours": [list(linked) for linked in self.neighbours]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Board":
+        names = data["names"]
+        return cls(names, {name: [names[other] for other in linked] for name, linked in zip(names, data["neighbours"])})
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    # Returns the key of a unit count on a territory, counts beyond the table are mixed on the fly.
+    def get_unit_key(self, territory: int, units: int) -> int:
+        if 0 <= units < HASHED_UNITS:
+            return self.unit_keys[territory][units]
+        return mix64(self.unit_keys[territory][0] ^ units)
+
+
+class GameState:
+    # Everything that changes during a game, kept compact so searches can copy and hash millions of
+    # states: owners and units are flat arrays indexed by territory id, and every write goes through
+    # set_owner/set_units so the Zobrist hash of the territories is updated incrementally.
+    __slots__ = (
+        "board", "num_players", "owners", "units", "phase", "current_player", "turn",
+        "reinforcements", "moves_left", "last_dice", "territory_hash", "journal", "undo_stack", "dice",
+    )
+
+    def __init__(self, board: Board, num_players: int, owners: list, units: list, dice: DiceStream = None) -> None:
+        if num_players > MAX_PLAYERS:
+            raise ValueError(f"at most {MAX_PLAYERS} players are supported, got {num_players}")
+        self.board = board  # Shared, never modified.
+        self.num_players = num_players  # Players are numbered 0 .. num_players - 1.
+        self.owners = array("b", owners)  # Player owning each territory, or NEUTRAL.
+        self.units = array("l", units)  # Units on each territory.
+        self.phase = PLACE  # Index into PHASES.
+        self.current_player = 0  # Player whose turn it is.
+        self.turn = 0  # Number of turns that have been started.
+        self.reinforcements = self.get_reinforcement_count(0)  # Units left to place this turn.
+        self.moves_left = 1  # Moves still allowed in the move phase.
+        self.last_dice = None  # (attacker dice, defender dice) of the last attack, for display.
+        self.territory_hash = self.compute_territory_hash()  # Xor of the owner and unit keys of every territory.
+        self.journal = None  # Territory values overwritten by the action being pushed, None when not recording.
+        self.undo_stack = []  # One entry per pushed action, popped by undo.
+        self.dice = dice if dice is not None else DiceStream()  # Dice every attack rolls, shared by copies.
+
+    # Starts a game with 1-3 units on every territory and one starting territory per player,
+    # the units and every later battle come from `game_random`.
+    @classmethod
+    def new(cls, board: Board, starting_territories: list, game_random: GameRandom = None) -> "GameState":
+        game_random = game_random if game_random is not None else GameRandom()
+        owners = [NEUTRAL] * len(board)
+        for player, territory in enumerate(starting_territories):
+            owners[territory] = player
+        units = game_random.roll_starting_units(len(board))
+        return cls(board, len(starting_territories), owners, units, game_random.dice)
+
+    # Copies the state for a search or a worker, the copy starts with an empty undo stack. It rolls
+    # the same dice stream, searches that must not use up the game's dice give it their own.
+    def copy(self) -> "GameState":
+        state = GameState.__new__(GameState)
+        state.board = self.board
+        state.num_players = self.num_players
+        state.owners = self.owners[:]
+        state.units = self.units[:]
+        state.phase = self.phase
+        state.current_player = self.current_player
+        state.turn = self.turn
+        state.reinforcements = self.reinforcements
+        state.moves_left = self.moves_left
+        state.last_dice = self.last_dice
+        state.territory_hash = self.territory_hash
+        state.journal = None
+        state.undo_stack = []
+        state.dice = self.dice
+        return state
+
+    def compute_territory_hash(self) -> int:
+        board = self.board
+        value = 0
+        for territory, (owner, units) in enumerate(zip(self.owners, self.units)):
+            value ^= board.owner_keys[territory][owner + 1] ^ board.get_unit_key(territory, units)
+        return value
+
+    # Zobrist hash of the whole position: territories plus whose turn and phase it is and what is
+    # left to do in it. Equal positions reached by different actions hash the same.
+    def get_hash(self) -> int:
+        board = self.board
+        return (
+            self.territory_hash
+            ^ board.phase_keys[self.phase]
+            ^ board.player_keys[self.current_player]
+            ^ board.reinforcement_keys[min(self.reinforcements, HASHED_UNITS - 1)]
+            ^ board.moves_keys[min(self.moves_left, 1)]
+        )
+
+    def set_owner(self, territory: int, owner: int) -> None:
+        previous = self.owners[territory]
+        if self.journal is not None:
+            self.journal.append((territory, previous, self.units[territory]))
+        keys = self.board.owner_keys[territory]
+        self.territory_hash ^= keys[previous + 1] ^ keys[owner + 1]
+        self.owners[territory] = owner
+
+    def set_units(self, territory: int, units: int) -> None:
+        previous = self.units[territory]
+        if self.journal is not None:
+            self.journal.append((territory, self.owners[territory], previous))
+        board = self.board
+        self.territory_hash ^= board.get_unit_key(territory, previous) ^ board.get_unit_key(territory, units)
+        self.units[territory] = units
+
+    # Applies an action and remembers how to take it back with undo, for searches that walk a
+    # single state up and down instead of copying it.
+    def push(self, action) -> list:
+        scalars = (self.phase, self.current_player, self.turn, self.reinforcements, self.moves_left, self.last_dice)
+        self.journal = []
+        try:
+            changed = self.apply(action)
+        finally:
+            journal, self.journal = self.journal, None
+        self.undo_stack.append((journal, scalars))
+        return changed
+
+    # Restores the state from before the last pushed action.
+    def undo(self) -> None:
+        journal, scalars = self.undo_stack.pop()
+        for territory, owner, units in reversed(journal):
+            self.set_owner(territory, owner)
+            self.set_units(territory, units)
+        self.phase, self.current_player, self.turn, self.reinforcements, self.moves_left, self.last_dice = scalars
+
+    # Reinforcements a player gets at the start of a turn: one per three territories, at least three.
+    def get_reinforcement_count(self, player: int) -> int:
+        return max(3, self.owners.count(player) // 3)
+
+    def get_territories(self, player: int) -> list:
+        return [territory for territory, owner in enumerate(self.owners) if owner == player]
+
+    # Returns the only player left with territories, or None while the game is still going.
+    def get_winner(self):
+        alive = {owner for owner in self.owners if owner != NEUTRAL}
+        if len(alive) == 1 and self.num_players > 1:
+            return alive.pop()
+        return None
+
+    def is_legal(self, action) -> bool:
+        player = self.current_player
+        if isinstance(action, EndPhase):
+            # All reinforcements have to be placed before the place phase can end
+            return self.phase != PLACE or self.reinforcements == 0
+        if isinstance(action, Place):
+            return self.phase == PLACE and self.reinforcements > 0 and self.owners[action.territory] == player
+        if isinstance(action, Move):
+            return (
+                self.phase == MOVE
+                and self.moves_left > 0
+                and self.owners[action.source] == player
+                and self.owners[action.target] == player
+                and action.target in self.board.neighbour_sets[action.source]
+                and 1 <= action.units < self.units[action.source]
+            )
+        if isinstance(action, (Attack, Blitz)):
+            return (
+                self.phase == ATTACK
+                and self.owners[action.source] == player
+                and self.owners[action.target] != player
+                and action.target in self.board.neighbour_sets[action.source]
+                and self.units[action.source] > 1
+            )
+        return False
+
+    # Lists the legal actions. To keep the list short, moves are only offered with a single unit
+    # or with every unit but one; is_legal and apply accept any other amount as well.
+    def get_legal_actions(self) -> list:
+        player = self.current_player
+        actions = []
+        if self.phase == PLACE:
+            if self.reinforcements > 0:
+                actions.extend(Place(territory) for territory in self.get_territories(player))
+        elif self.phase == MOVE:
+            if self.moves_left > 0:
+                for source in self.get_territories(player):
+                    if self.units[source] < 2:
+                        continue
+                    for target in self.board.neighbours[source]:
+                        if self.owners[target] == player:
+                            actions.append(Move(source, target, 1))
+                            if self.units[source] > 2:
+                                actions.append(Move(source, target, self.units[source] - 1))
+        else:
+            for source in self.get_territories(player):
+                if self.units[source] < 2:
+                    continue
+                for target in self.board.neighbours[source]:
+                    if self.owners[target] != player:
+                        actions.append(Attack(source, target))
+                        actions.append(Blitz(source, target))
+        if self.is_legal(EndPhase()):
+            actions.append(EndPhase())
+        return actions
+
+    # Applies a legal action and returns the ids of the territories whose owner or units changed.
+    def apply(self, action) -> list:
+        if not self.is_legal(action):
+            raise ValueError(f"{action} is not legal in phase {PHASES[self.phase]} for player {self.current_player}")
+        if isinstance(action, Place):
+            self.set_units(action.territory, self.units[action.territory] + 1)
+            self.reinforcements -= 1
+            return [action.territory]
+        if isinstance(action, Move):
+            self.set_units(action.source, self.units[action.source] - action.units)
+            self.set_units(action.target, self.units[action.target] + action.units)
+            self.moves_left -= 1
+            return [action.source, action.target]
+        if isinstance(action, Attack):
+            return self.resolve_attack(action.source, action.target)
+        if isinstance(action, Blitz):
+            return self.resolve_blitz(action.source, action.target)
+        self.end_phase()
+        return []
+
+    # Rolls one round of dice. The loser of each compared pair loses a unit, ties go to the defender.
+    # A conquered territory changes owner and receives every attacking unit but one.
+    def resolve_attack(self, source: int, target: int) -> list:
+        attacker_dice, defender_dice, attacker_losses, defender_losses = Dice.fight_round(
+            self.units[source], self.units[target], self.dice
+        )
+        self.last_dice = (attacker_dice, defender_dice)
+        self.set_units(source, self.units[source] - attacker_losses)
+        self.set_units(target, self.units[target] - defender_losses)
+        if self.units[target] <= 0:
+            self.conquer(source, target)
+        return [source, target]
+
+    # Fights the whole battle in one call instead of one round per action.
+    def resolve_blitz(self, source: int, target: int) -> list:
+        attackers, defenders = Dice.battle(self.units[source], self.units[target], self.dice)
+        self.set_units(source, attackers)
+        self.set_units(target, defenders)
+        self.last_dice = None
+        if self.units[target] <= 0:
+            self.conquer(source, target)
+        return [source, target]
+
+    def conquer(self, source: int, target: int) -> None:
+        self.set_owner(target, self.current_player)
+        self.set_units(target, self.units[source] - 1)
+        self.set_units(source, 1)
+
+    # Moves on to the next phase, or to the next player still in the game after the attack phase.
+    def end_phase(self) -> None:
+        if self.phase != ATTACK:
+            self.phase += 1
+            return
+        self.phase = PLACE
+        self.turn += 1
+        alive = {owner for owner in self.owners if owner != NEUTRAL}
+        for step in range(1, self.num_players + 1):
+            player = (self.current_player + step) % self.num_players
+            if player in alive:
+                self.current_player = player
+                break
+        self.reinforcements = self.get_reinforcement_count(self.current_player)
+        self.moves_left = 1
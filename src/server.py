@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+import time
+
+from src.gamelog import GameLogWriter
+from src.protocol import decode_action, decode_message, encode_message, get_turn_info
+from src.rng import GameRandom
+from src.rules import MAX_PLAYERS, Board, GameState
+
+# Authoritative game server. One asyncio process hosts any number of matches: clients join a match
+# by name, send actions, and the server checks them against the rules, applies them and once per
+# tick sends every client of the match only the territories that changed since the last tick.
+
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = 0.05  # How often the changes of every match are sent out.
+MAX_LINE_BYTES = 64 * 1024  # Longest message a client may send.
+MAX_PENDING_BYTES = 1024 * 1024  # Clients that fall this far behind on reading are disconnected.
+MATCH_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")  # Names clients may give a match, they end up in log file names.
+
+
+class Connection:
+    # One connected client and the seat it plays, if it joined a match.
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.match = None  # Match the client joined.
+        self.seat = None  # Player id of the client in its match.
+        self.name = writer.get_extra_info("peername")
+
+    # Queues a message without waiting, the transport sends it as fast as the client reads.
+    def send(self, message: dict) -> None:
+        if self.writer.is_closing():
+            return
+        self.writer.write(encode_message(message))
+        if self.writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+            logger.warning("%s isn't reading its messages, disconnecting it", self.name)
+            self.writer.close()
+
+
+class Match:
+    # A game hosted by the server. It starts once every seat is taken; until then it only collects
+    # players. Changed territories are gathered between ticks and sent out together.
+    def __init__(self, name: str, board: Board, num_players: int, seed: int = None, log_path: str = None) -> None:
+        self.name = name
+        self.board = board
+        self.num_players = num_players
+        self.seed = seed
+        self.log_path = log_path  # File the game is recorded to, None to not record it.
+        self.log = None
+        self.connections = []  # Connection of every seat, in seat order.
+        self.state = None  # Game state, created when the match starts.
+        self.changed = set()  # Territories changed since the last delta.
+        self.turn_changed = False  # Whether an action was applied since the last delta.
+        self.tick = 0  # Number of deltas sent.
+
+    # Seats of players that left before the start don't count, the next player to join takes them.
+    # A started match takes nobody new.
+    def is_full(self) -> bool:
+        if self.state is not None:
+            return True
+        return sum(not connection.writer.is_closing() for connection in self.connections) >= self.num_players
+
+    def is_abandoned(self) -> bool:
+        return all(connection.writer.is_closing() for connection in self.connections)
+
+    def join(self, connection: Connection) -> None:
+        connection.match = self
+        closed = [seat for seat, other in enumerate(self.connections) if other.writer.is_closing()]
+        if closed:
+            connection.seat = closed[0]
+            self.connections[closed[0]] = connection
+        else:
+            connection.seat = len(self.connections)
+            self.connections.append(connection)
+        connection.send({"type": "welcome", "match": self.name, "player": connection.seat, "players": self.num_players})
+        if self.is_full():
+            try:
+                self.start()
+            except (ValueError, OSError) as error:
+                # Nobody can play it, tell every seat and drop them so no one waits for the start
+                logger.warning("match %s could not start: %s", self.name, error)
+                self.broadcast({"type": "error", "message": f"match {self.name} could not start: {error}"})
+                for seat in self.connections:
+                    seat.writer.close()
+                self.close()
+
+    def start(self) -> None:
+        game_random = GameRandom(self.seed)
+        self.state = GameState.new(self.board, game_random.sample(range(len(self.board)), self.num_players), game_random)
+        if self.log_path:
+            self.log = GameLogWriter(self.log_path, self.state)
+        message = {
+            "type": "start", "board": self.board.to_dict(), "players": self.num_players,
+            "owners": list(self.state.owners), "units": list(self.state.units), **get_turn_info(self.state),
+        }
+        self.broadcast(message)
+        logger.info("match %s started with %d players", self.name, self.num_players)
+
+    # Checks and applies an action of a seat. Returns an error text when it is refused.
+    def apply(self, seat: int, action):
+        if self.state is None:
+            return "the match hasn't started, waiting for more players"
+        if self.state.get_winner() is not None:
+            return "the match is over"
+        if seat != self.state.current_player:
+            return "it is not your turn"
+        if not self.state.is_legal(action):
+            return f"{action} isn't allowed now"
+        self.changed.update(self.state.apply(action))
+        self.turn_changed = True
+        if self.log is not None:
+            self.log.write_action(action)
+        return None
+
+    # Returns the changes since the last call as a delta message, or None if nothing happened.
+    def take_delta(self):
+        if not self.turn_changed:
+            return None
+        state = self.state
+        territories = [[territory, state.owners[territory], state.units[territory]] for territory in sorted(self.changed)]
+        self.changed.clear()
+        self.turn_changed = False
+        self.tick += 1
+        return {"type": "delta", "tick": self.tick, "territories": territories, **get_turn_info(state)}
+
+    def broadcast(self, message: dict) -> None:
+        for connection in self.connections:
+            connection.send(message)
+
+    def close(self) -> None:
+        if self.log is not None:
+            self.log.close()
+
+
+class GameServer:
+    def __init__(self, board: Board, tick_seconds: float = TICK_SECONDS, seed: int = None, log_dir: str = None) -> None:
+        self.board = board
+        self.tick_seconds = tick_seconds
+        self.seed = seed  # Seed of every match, None for a fresh one each time.
+        self.log_dir = log_dir
+        self.log_prefix = time.strftime("%Y%m%d-%H%M%S")  # Start of every log file name, so restarts don't overwrite logs.
+        self.matches_created = 0  # Number of matches hosted so far, numbers the log files.
+        self.matches = {}  # Matches by name, dropped once every player has left.
+        self.server = None
+        self.tick_task = None
+
+    async def start(self, host: str, port: int) -> None:
+        self.server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_LINE_BYTES)
+        self.tick_task = asyncio.get_running_loop().create_task(self.tick_loop())
+
+    def get_port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, host: str, port: int) -> None:
+        await self.start(host, port)
+        logger.info("serving on %s:%d", host, self.get_port())
+        async with self.server:
+            await self.server.serve_forever()
+
+    # Sends the batched changes of every match once per tick.
+    async def tick_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            for name, match in list(self.matches.items()):
+                if match.state is not None:
+                    delta = match.take_delta()
+                    if delta is not None:
+                        match.broadcast(delta)
+                if match.connections and match.is_abandoned():
+                    match.close()
+                    del self.matches[name]
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = Connection(reader, writer)
+        try:
+            while not writer.is_closing():
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    self.handle_message(connection, decode_message(line))
+                except (ValueError, KeyError, TypeError) as error:
+                    connection.send({"type": "error", "message": str(error)})
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError) as error:
+            logger.info("%s disconnected: %s", connection.name, error)
+        finally:
+            writer.close()
+
+    # Log file of a new match. The name is checked against MATCH_NAME, and the server's start time and
+    # a match number keep matches reusing a name from overwriting each other's logs.
+    def get_log_path(self, name: str):
+        if not self.log_dir:
+            return None
+        self.matches_created += 1
+        return os.path.join(self.log_dir, f"{self.log_prefix}-{self.matches_created:05d}-{name}.rlog")
+
+    def handle_message(self, connection: Connection, message: dict) -> None:
+        if message["type"] == "join":
+            if connection.match is not None:
+                raise ValueError("already in a match")
+            name = message["match"]
+            if not isinstance(name, str) or not MATCH_NAME.fullmatch(name):
+                raise ValueError("match names are 1 to 64 letters, digits, '_' or '-'")
+            match = self.matches.get(name)
+            if match is None:
+                num_players = message.get("players", 2)
+                most_players = min(len(self.board), MAX_PLAYERS)
+                if type(num_players) is not int or not 2 <= num_players <= most_players:
+                    raise ValueError(f"a match needs 2 to {most_players} players")
+                match = self.matches[name] = Match(name, self.board, num_players, self.seed, self.get_log_path(name))
+            elif match.is_full():
+                raise ValueError(f"match {name} is full")
+            match.join(connection)
+            if match.is_abandoned():
+                # It failed to start, the name is free again
+                del self.matches[name]
+        elif message["type"] == "action":
+            if connection.match is None:
+                raise ValueError("join a match first")
+            error = connection.match.apply(connection.seat, decode_action(message["action"], len(self.board)))
+            if error is not None:
+                connection.send({"type": "error", "message": error})
+        else:
+            raise ValueError(f"unknown message type {message['type']}")
+
+
+# Serves matches until interrupted.
+def run_server(host: str, port: int, adjacency_path: str, tick_seconds: float = TICK_SECONDS, seed: int = None, log_dir: str = None) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    server = GameServer(Board.from_adjacency_file(adjacency_path), tick_seconds, seed, log_dir)
+    try:
+        asyncio.run(server.serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    from src.geo import World
+
+    parser = argparse.ArgumentParser(description="Host multiplayer matches.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=7777, help="port to listen on")
+    parser.add_argument("--tick", type=float, default=TICK_SECONDS, help="seconds between state updates")
+    parser.add_argument("--seed", type=int, default=None, help="seed of every match, for reproducible matches")
+    parser.add_argument("--log-dir", default=None, help="record every match to a replayable log in this directory")
+    parser.add_argument("--adjacency", default=World.ADJACENCY_PATH, help="cached adjacency graph the board is built from")
+    args = parser.parse_args()
+    run_server(args.host, args.port, args.adjacency, args.tick, args.seed, args.log_dir)
@@ -0,0 +1,156 @@
+import logging
+import queue
+import threading
+from collections import OrderedDict
+
+import pygame
+
+logger = logging.getLogger(__name__)
+
+
+class TileCache:
+    # Least recently used cache of pre-rendered map tiles keyed by (zoom step, column, row), bounded by
+    # the pixel memory the tiles hold. The zoom of a step is zoom_step ** step, whole steps keep
+    # zooms that should be equal from ending up as different float keys.
+    # Tiles are rendered on demand by `render_tile(key)` and tiles near the camera can be
+    # prefetched on a background thread.
+    # `lock` must be held by anyone reading the state the tiles are drawn from while it can change,
+    # the prefetch thread holds it for the whole time it renders a tile.
+    def __init__(self, render_tile, tile_size: int = 512, max_bytes: int = 96 * 1024 * 1024, zoom_step: float = 1.25) -> None:
+        self.render_tile = render_tile  # Called with a key, returns a tile_size x tile_size surface.
+        self.tile_size = tile_size  # Width and height of a tile in zoomed pixels.
+        self.max_bytes = max_bytes  # Most pixel memory kept at once.
+        self.zoom_step = zoom_step  # Zoom factor between two zoom steps.
+        self.tiles = OrderedDict()  # Rendered tiles, least recently used first.
+        self.bytes = 0  # Pixel memory used by the cached tiles.
+        self.hits = 0  # Number of tiles answered from the cache.
+        self.misses = 0  # Number of tiles rendered on the main thread because they weren't ready.
+        self.prefetched = 0  # Number of tiles rendered by the prefetch thread.
+        self.lock = threading.RLock()
+        self.requests = queue.Queue()  # Lists of keys the prefetch thread should render, newest wins.
+        self.thread = None
+
+    # Returns the (first_col, first_row, last_col, last_row) tiles covering a rect in zoomed pixels.
+    def get_tile_range(self, rect: pygame.Rect) -> tuple:
+        return (
+            rect.left // self.tile_size, rect.top // self.tile_size,
+            (rect.right - 1) // self.tile_size, (rect.bottom - 1) // self.tile_size,
+        )
+
+    # Returns the keys of the tiles covering a rect in zoomed pixels, `margin` extra tiles around it.
+    def get_keys(self, step: int, rect: pygame.Rect, margin: int = 0) -> list:
+        first_col, first_row, last_col, last_row = self.get_tile_range(rect)
+        return [
+            (step, col, row)
+            for row in range(first_row - margin, last_row + margin + 1)
+            for col in range(first_col - margin, last_col + margin + 1)
+        ]
+
+    # Returns the zoom a tile is rendered at.
+    def get_zoom(self, key: tuple) -> float:
+        return self.zoom_step ** key[0]
+
+    # Returns the zoomed pixel rect a tile covers.
+    def get_tile_rect(self, key: tuple) -> pygame.Rect:
+        _, col, row = key
+        return pygame.Rect(col * self.tile_size, row * self.tile_size, self.tile_size, self.tile_size)
+
+    # Returns a tile, rendering it now if it isn't cached yet.
+    def get(self, key: tuple) -> pygame.Surface:
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.hits += 1
+                self.tiles.move_to_end(key)
+                return tile
+            self.misses += 1
+            return self.add(key, self.render_tile(key))
+
+    # Returns a tile if it is cached, without rendering it or counting as a use.
+    def peek(self, key: tuple):
+        return self.tiles.get(key)
+
+    # Helper method to store a rendered tile and evict the least recently used ones over the memory cap.
+    def add(self, key: tuple, tile: pygame.Surface) -> pygame.Surface:
+        self.tiles[key] = tile
+        self.bytes += self.get_size_in_bytes(tile)
+        while self.bytes > self.max_bytes and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.bytes -= self.get_size_in_bytes(evicted)
+        return tile
+
+    # Helper method to estimate how much memory a tile's pixels take.
+    def get_size_in_bytes(self, tile: pygame.Surface) -> int:
+        return tile.get_width() * tile.get_height() * tile.get_bytesize()
+
+    # Drops a tile so it is rendered again the next time it is needed.
+    def invalidate(self, key: tuple) -> None:
+        with self.lock:
+            tile = self.tiles.pop(key, None)
+            if tile is not None:
+                self.bytes -= self.get_size_in_bytes(tile)
+
+    # Returns the keys of every cached tile at any zoom overlapping a box in map units.
+    def get_cached_keys(self, bbox: tuple) -> list:
+        min_x, min_y, max_x, max_y = bbox
+        keys = []
+        for key in list(self.tiles):
+            _, col, row = key
+            zoom = self.get_zoom(key)
+            if (
+                col * self.tile_size <= max_x * zoom and (col + 1) * self.tile_size >= min_x * zoom
+                and row * self.tile_size <= max_y * zoom and (row + 1) * self.tile_size >= min_y * zoom
+            ):
+                keys.append(key)
+        return keys
+
+    def clear(self) -> None:
+        with self.lock:
+            self.tiles.clear()
+            self.bytes = 0
+
+    # Asks the prefetch thread to render these tiles, replacing any request it hasn't started on.
+    def prefetch(self, keys: list) -> None:
+        missing = [key for key in keys if key not in self.tiles]
+        if not missing or self.thread is None:
+            return
+        while True:
+            try:
+                self.requests.get_nowait()
+            except queue.Empty:
+                break
+        self.requests.put(missing)
+
+    def start(self) -> None:
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.prefetch_loop, name="tile-prefetch", daemon=True)
+            self.thread.start()
+
+    # Stops the prefetch thread, e.g. before pygame is shut down.
+    def stop(self) -> None:
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def prefetch_loop(self) -> None:
+        while True:
+            keys = self.requests.get()
+            if keys is None:
+                return
+            for key in keys:
+                # A newer request replaces this one, the camera has moved on
+                if not self.requests.empty():
+                    break
+                with self.lock:
+                    if key in self.tiles:
+                        continue
+                    self.add(key, self.render_tile(key))
+                    self.prefetched += 1
+
+    # Returns the cache counters and memory use, e.g. for a debug overlay.
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.hits, "misses": self.misses, "prefetched": self.prefetched,
+            "tiles": len(self.tiles), "bytes": self.bytes,
+        }
@@ -0,0 +1,133 @@
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from src.ai import STRATEGIES, create_strategy
+from src.gamelog import GameLogWriter
+from src.odds import get_odds_table
+from src.rng import GameRandom
+from src.rules import Board, GameState
+
+# Plays many complete headless games between computer strategies on every core and streams
+# one JSON line per finished game. Every worker process loads the board once, games only
+# exchange small tuples and dicts with the parent.
+
+NEVER_CANCELLED = threading.Event()  # Tournament games always let strategies use their whole budget.
+
+_board = None  # Board of the worker process, loaded once by init_worker.
+
+
+def init_worker(adjacency_path: str) -> None:
+    global _board
+    _board = Board.from_adjacency_file(adjacency_path)
+    get_odds_table()  # Loaded up front so the first game doesn't pay for it.
+
+
+# Plays one game to the end (or max_turns) and returns its result. Runs inside a worker process.
+# All randomness comes from the game's own streams spawned from the master seed, so a game plays out
+# the same whichever worker runs it and whatever else runs alongside.
+# With `log_dir` every action is also recorded to game_<id>.rlog there.
+def play_game(game_id: int, strategy_names: tuple, seed: int, max_turns: int, think_seconds: float, log_dir: str = None) -> dict:
+    start = time.perf_counter()
+    game_random = GameRandom.for_game(seed, game_id)
+    strategies = [create_strategy(name, game_random.get_player_random()) for name in strategy_names]
+    state = GameState.new(_board, game_random.sample(range(len(_board)), len(strategies)), game_random)
+    log = GameLogWriter(os.path.join(log_dir, f"game_{game_id}.rlog"), state) if log_dir else None
+    territory_curve = [[state.owners.count(player) for player in range(len(strategies))]]
+    actions = 0
+    while state.get_winner() is None and state.turn < max_turns:
+        turn = state.turn
+        strategy = strategies[state.current_player]
+        action = strategy.choose_action(state, time.perf_counter() + think_seconds, NEVER_CANCELLED)
+        if not state.is_legal(action):
+            raise ValueError(f"{strategy.name} chose illegal action {action} in game {game_id}")
+        state.apply(action)
+        if log is not None:
+            log.write_action(action)
+        actions += 1
+        if state.turn != turn:
+            territory_curve.append([state.owners.count(player) for player in range(len(strategies))])
+    if log is not None:
+        log.close()
+    winner = state.get_winner()
+    return {
+        "game": game_id,
+        "seed": seed,
+        "players": list(strategy_names),
+        "winner": winner,
+        "winner_strategy": strategy_names[winner] if winner is not None else None,
+        "turns": state.turn,
+        "actions": actions,
+        "territory_curve": territory_curve,
+        "wall_time": time.perf_counter() - start,
+    }
+
+
+# Yields the (game id, seating) of every game. Seats rotate so no strategy always moves first.
+def get_schedule(num_games: int, strategy_names: list):
+    for game_id in range(num_games):
+        shift = game_id % len(strategy_names)
+        yield game_id, tuple(strategy_names[shift:] + strategy_names[:shift])
+
+
+# Runs the games on `workers` processes, writing each result to `out_path` as soon as it is done.
+# At most a few games per worker are queued at once, so huge tournaments don't pile up futures.
+def run_tournament(
+    num_games: int, strategy_names: list, out_path: str, adjacency_path: str,
+    workers: int = None, seed: int = 0, max_turns: int = 500, think_seconds: float = 0.05, log_dir: str = None,
+) -> Counter:
+    workers = workers or os.cpu_count() or 1
+    wins = Counter()
+    schedule = get_schedule(num_games, strategy_names)
+    with open(out_path, "w") as out, ProcessPoolExecutor(workers, initializer=init_worker, initargs=(adjacency_path,)) as pool:
+        pending = set()
+        while True:
+            for game_id, seating in itertools.islice(schedule, workers * 4 - len(pending)):
+                pending.add(pool.submit(play_game, game_id, seating, seed, max_turns, think_seconds, log_dir))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                wins[result["winner_strategy"]] += 1
+                out.write(json.dumps(result, separators=(",", ":")) + "\n")
+            out.flush()
+    return wins
+
+
+if __name__ == "__main__":
+    from src.geo import World
+
+    parser = argparse.ArgumentParser(description="Play computer strategies against each other on every core.")
+    parser.add_argument("strategies", nargs="+", choices=sorted(STRATEGIES), help="one strategy per seat")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument("--out", default="tournament.jsonl", help="file the per-game results are streamed to")
+    parser.add_argument("--seed", type=int, default=0, help="master seed, a game replays bit for bit from it and its game id (searches bounded by time aside)")
+    parser.add_argument("--max-turns", type=int, default=500, help="games still going after this many turns are draws")
+    parser.add_argument("--think-seconds", type=float, default=0.05, help="time budget per decision")
+    parser.add_argument("--log-dir", default=None, help="record every game to a replayable log in this directory")
+    parser.add_argument("--adjacency", default=World.ADJACENCY_PATH, help="cached adjacency graph the board is built from")
+    args = parser.parse_args()
+
+    if len(args.strategies) < 2:
+        parser.error("at least two strategies are needed")
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+    if not os.path.exists(args.adjacency):
+        parser.error(f"{args.adjacency} is missing, start the game once to build it from the map data")
+
+    start = time.perf_counter()
+    wins = run_tournament(
+        args.games, args.strategies, args.out, args.adjacency,
+        args.workers, args.seed, args.max_turns, args.think_seconds, args.log_dir,
+    )
+    elapsed = time.perf_counter() - start
+    print(f"{args.games} games in {elapsed:.1f}s ({args.games / elapsed:.1f} games/s), results in {args.out}")
+    for name, count in wins.most_common():
+        print(f"  {name or 'draw'}: {count} wins")
@@ -1,8 +1,80 @@
+import threading
+
 import pygame as pygame
+from collections import OrderedDict
+
+
+# Fonts shared by the whole game, keyed by (name, size), so identical fonts are only created once.
+_fonts = {}
+
+
+def get_font(name=None, size=24) -> pygame.font.Font:
+    font = _fonts.get((name, size))
+    if font is None:
+        font = pygame.font.SysFont(name, size)
+        _fonts[(name, size)] = font
+    return font
+
+
+class TextCache:
+    # Least recently used cache of rendered text surfaces keyed by (font, text, color, antialias).
+    # Memory is bounded by both the number of entries and the total pixel bytes they hold.
+    # Map tiles are rendered on a background thread too, so every render holds a lock.
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 8 * 1024 * 1024) -> None:
+        self.max_entries = max_entries  # Most surfaces kept at once.
+        self.max_bytes = max_bytes  # Most pixel memory kept at once.
+        self.surfaces = OrderedDict()  # Cached surfaces, least recently used first.
+        self.bytes = 0  # Pixel memory used by the cached surfaces.
+        self.hits = 0  # Number of renders answered from the cache.
+        self.misses = 0  # Number of renders that had to call font.render.
+        self.lock = threading.Lock()  # Guards the cache and the fonts, which aren't thread-safe.
+
+    # Returns the rendered text, only calling font.render the first time a label is seen.
+    # The surface is shared between callers so it must not be drawn on.
+    def render(self, font: pygame.font.Font, text: str, color, antialias: bool = True) -> pygame.Surface:
+        with self.lock:
+            return self.render_locked(font, text, color, antialias)
+
+    def render_locked(self, font: pygame.font.Font, text: str, color, antialias: bool) -> pygame.Surface:
+        key = (font, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        self.bytes += self.get_size_in_bytes(surface)
+        while len(self.surfaces) > self.max_entries or (self.bytes > self.max_bytes and len(self.surfaces) > 1):
+            _, evicted = self.surfaces.popitem(last=False)
+            self.bytes -= self.get_size_in_bytes(evicted)
+        return surface
+
+    # Helper method to estimate how much memory a surface's pixels take.
+    def get_size_in_bytes(self, surface: pygame.Surface) -> int:
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.surfaces.clear()
+            self.bytes = 0
+
+    # Returns the hit/miss counters and memory use, e.g. for a debug overlay.
+    def get_stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.surfaces), "bytes": self.bytes}
+
+
+text_cache = TextCache()
+
+
+def render_text(font, text, color, antialias=True) -> pygame.Surface:
+    return text_cache.render(font, text, color, antialias)
 
 
 def draw_text(screen, font, text, color, x, y, center=False, size=20):
-    text_surface = font.render(text, True, color)
+    text_surface = render_text(font, text, color)
     text_rect = text_surface.get_rect()
     if center:
         text_rect.center = (x, y)
@@ -15,7 +87,7 @@ def draw_multiline_text(
     screen, font, multitext: list, color, x, y, center=False, size=20
 ):
     for text in multitext:
-        text_surface = font.render(text, True, color)
+        text_surface = render_text(font, text, color)
         text_rect = text_surface.get_rect()
         if center:
             text_rect.center = (x, y)
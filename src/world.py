@@ -1,11 +1,3 @@
-import pygame as pygame
-
-class World:
-    # ... other methods and initializations ...
-
-    def get_country_at_pos(self, pos):
-        # Loop through all countries and check if the position is within any country's boundaries
-        for country_name, country in self.countries.items():
-            if country.contains(pos):
-                return country
-        return None
+# The World class lives in src/geo.py next to Country and the SpatialIndex it uses for
+# hit-testing. It is re-exported here so `from src.world import World` keeps working.
+from src.geo import World  # noqa: F401
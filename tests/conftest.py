@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from src.ai import create_strategy
+from src.rules import Board
+from src.tournament import NEVER_CANCELLED
+
+GRID_SIZE = 4  # The test board is a GRID_SIZE x GRID_SIZE grid of territories.
+
+
+# A small board that needs no map data: a grid where every territory borders the ones beside it.
+@pytest.fixture
+def board() -> Board:
+    names = [f"t{row}{col}" for row in range(GRID_SIZE) for col in range(GRID_SIZE)]
+    neighbours = {
+        f"t{row}{col}": [
+            f"t{row + d_row}{col + d_col}"
+            for d_row, d_col in ((-1, 0), (1, 0), (0, -1), (0, 1))
+            if 0 <= row + d_row < GRID_SIZE and 0 <= col + d_col < GRID_SIZE
+        ]
+        for row in range(GRID_SIZE) for col in range(GRID_SIZE)
+    }
+    return Board(names, neighbours)
+
+
+# Yields the actions of a game between computer strategies, applying each to `state` first.
+def play(state, strategy_name: str = "greedy", seed: int = 0, max_actions: int = 2000):
+    rng = random.Random(seed)
+    strategies = [create_strategy(strategy_name, rng) for _ in range(state.num_players)]
+    for _ in range(max_actions):
+        if state.get_winner() is not None:
+            return
+        action = strategies[state.current_player].choose_action(state, 0.0, NEVER_CANCELLED)
+        state.apply(action)
+        yield action
+
+
+# Helper returning everything the rules look at, to compare two states.
+def get_snapshot(state) -> tuple:
+    return (
+        list(state.owners), list(state.units), state.phase, state.current_player,
+        state.turn, state.reinforcements, state.moves_left, state.get_hash(),
+    )
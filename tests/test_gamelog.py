@@ -0,0 +1,56 @@
+import math
+
+import pytest
+
+from conftest import get_snapshot, play
+from src.gamelog import RECORD_SNAPSHOT, GameLog, GameLogWriter
+from src.rng import GameRandom
+from src.rules import PLACE, GameState
+
+
+# Plays a logged game, returns the log path, the live snapshot after every action and at the start
+# of every turn.
+def play_logged_game(board, path, snapshot_turns: int = 3):
+    game_random = GameRandom(5)
+    state = GameState.new(board, game_random.sample(range(len(board)), 3), game_random)
+    writer = GameLogWriter(str(path), state, snapshot_turns)
+    after_action = [get_snapshot(state)]
+    turn_starts = {state.turn: get_snapshot(state)}
+    for action in play(state, "random", seed=5):
+        writer.write_action(action)
+        after_action.append(get_snapshot(state))
+        if state.phase == PLACE and state.turn not in turn_starts:
+            turn_starts[state.turn] = get_snapshot(state)
+    writer.close()
+    return after_action, turn_starts
+
+
+def test_state_at_matches_live_game(board, tmp_path):
+    path = tmp_path / "game.rlog"
+    after_action, turn_starts = play_logged_game(board, path)
+    log = GameLog(str(path))
+    assert log.actions == len(after_action) - 1
+    assert len(log.snapshot_turns) > 2
+    for turn, snapshot in turn_starts.items():
+        state = log.state_at(turn)
+        assert get_snapshot(state) == snapshot
+        assert state.territory_hash == state.compute_territory_hash()
+    assert get_snapshot(log.state_at(math.inf)) == after_action[-1]
+
+
+# A log cut anywhere, e.g. by a crash while it was written, replays up to its last whole record.
+def test_truncated_log_replays_whole_records(board, tmp_path):
+    path = tmp_path / "game.rlog"
+    after_action, _ = play_logged_game(board, path)
+    data = path.read_bytes()
+    cut_path = tmp_path / "cut.rlog"
+    log = GameLog(str(path))
+    for length in range(log.records_offset + 1, len(data), max(1, len(data) // 97)):
+        cut_path.write_bytes(data[:length])
+        if length < log.snapshot_offsets[0] + 1 + RECORD_SNAPSHOT.size + len(board) * 5:
+            with pytest.raises(ValueError):
+                GameLog(str(cut_path))
+            continue
+        cut = GameLog(str(cut_path))
+        assert cut.end <= length
+        assert get_snapshot(cut.state_at(math.inf)) == after_action[cut.actions]
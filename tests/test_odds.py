@@ -0,0 +1,75 @@
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+import src.odds
+from src.dice import Dice
+from src.odds import OddsTable, build_tables, compute_odds, get_odds_table, get_round_outcomes
+from src.rng import DiceStream
+
+
+def test_round_outcomes_are_exact():
+    assert get_round_outcomes(1, 1) == ((0, 1, 15 / 36), (1, 0, 21 / 36))
+    assert get_round_outcomes(2, 1) == ((0, 1, 125 / 216), (1, 0, 91 / 216))
+    assert get_round_outcomes(1, 2) == ((0, 1, 55 / 216), (1, 0, 161 / 216))
+    assert get_round_outcomes(3, 2) == ((0, 2, 2890 / 7776), (1, 1, 2611 / 7776), (2, 0, 2275 / 7776))
+    for num_attacker_dice in (1, 2, 3):
+        for num_defender_dice in (1, 2):
+            assert sum(outcome[2] for outcome in get_round_outcomes(num_attacker_dice, num_defender_dice)) == pytest.approx(1.0)
+
+
+def test_tables_hold_exact_odds():
+    win, attacker_losses, defender_losses = build_tables(6, 6)
+    # Two units attack one: a single die each, and the attacker has to win that one roll
+    assert win[2, 1] == pytest.approx(15 / 36)
+    assert attacker_losses[2, 1] == pytest.approx(21 / 36)
+    assert defender_losses[2, 1] == pytest.approx(15 / 36)
+    # Three units attack one: two tries of two dice against one
+    assert win[3, 1] == pytest.approx(float(Fraction(125, 216) + Fraction(91, 216) * Fraction(15, 36)))
+    assert (win[:, 0] == 1.0).all() and (win[1, 1:] == 0.0).all()
+    # A battle ends with the defender wiped out or the attacker down to one unit
+    assert 6 * win[6, 6] <= defender_losses[6, 6] <= 6
+    assert 5 * (1 - win[6, 6]) <= attacker_losses[6, 6] <= 5
+    assert (np.diff(win[2:, 1:], axis=0) > 0).all() and (np.diff(win[2:, 1:], axis=1) < 0).all()
+
+
+# Simulated battles must win and lose as often as the exact tables say.
+@pytest.mark.parametrize("attackers, defenders", [(2, 1), (4, 2), (6, 6), (12, 9)])
+def test_simulated_battles_match_tables(attackers, defenders):
+    win, attacker_losses, defender_losses = build_tables(attackers, defenders)
+    count = 40000
+    survivors, remaining = Dice.battles([attackers] * count, [defenders] * count, np.random.default_rng(attackers * 100 + defenders))
+    assert (remaining == 0).mean() == pytest.approx(win[attackers, defenders], abs=0.01)
+    assert (attackers - survivors).mean() == pytest.approx(attacker_losses[attackers, defenders], rel=0.02, abs=0.01)
+    assert (defenders - remaining).mean() == pytest.approx(defender_losses[attackers, defenders], rel=0.02, abs=0.01)
+    assert ((survivors == 1) | (remaining == 0)).all()
+
+    stream = DiceStream(attackers)
+    results = [Dice.battle(attackers, defenders, stream) for _ in range(4000)]
+    assert np.mean([result[1] == 0 for result in results]) == pytest.approx(win[attackers, defenders], abs=0.03)
+
+
+def test_odds_table_round_trip(tmp_path):
+    table = OddsTable(8)
+    path = str(tmp_path / "odds.npz")
+    table.save(path)
+    loaded = OddsTable.load(path)
+    assert loaded.cap == 8
+    for name in ("win", "attacker_losses", "defender_losses"):
+        assert np.array_equal(getattr(loaded, name), getattr(table, name))
+    assert loaded.get(5, 3) == table.get(5, 3)
+    # Battles beyond the table are computed exactly on demand
+    assert loaded.get(12, 3) == compute_odds(12, 3) == OddsTable(12).get(12, 3)
+
+
+def test_odds_table_is_saved_and_reused(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.odds, "_odds_table", None)
+    path = str(tmp_path / "odds.npz")
+    table = get_odds_table(6, path)
+    assert table.cap == 6 and (tmp_path / "odds.npz").exists()
+    monkeypatch.setattr(src.odds, "_odds_table", None)
+    assert np.array_equal(get_odds_table(6, path).win, table.win)
+    # A table that is too small is rebuilt
+    assert get_odds_table(9, path).cap == 9
+    assert OddsTable.load(path).cap == 9
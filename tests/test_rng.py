@@ -0,0 +1,23 @@
+import src.tournament
+from src.rng import GameRandom
+from src.tournament import play_game
+
+
+def test_same_seed_rolls_same_streams():
+    first, second = GameRandom(11), GameRandom(11)
+    assert first.roll_starting_units(50) == second.roll_starting_units(50)
+    assert first.sample(list(range(50)), 4) == second.sample(list(range(50)), 4)
+    assert first.dice.roll(300) == second.dice.roll(300)
+    assert first.get_player_random().random() == second.get_player_random().random()
+    assert GameRandom(12).dice.roll(300) != GameRandom(11).dice.roll(300)
+
+
+# Whole games replay from their seed, whichever strategies play them.
+def test_same_seed_plays_same_game(board, monkeypatch):
+    monkeypatch.setattr(src.tournament, "_board", board)
+    for strategy_names in (("greedy", "random"), ("random", "random", "greedy")):
+        first = play_game(3, strategy_names, 42, 50, 0.0)
+        second = play_game(3, strategy_names, 42, 50, 0.0)
+        for result in (first, second):
+            del result["wall_time"]
+        assert first == second
@@ -0,0 +1,50 @@
+import random
+
+from conftest import get_snapshot, play
+from src.rng import GameRandom
+from src.rules import GameState
+
+
+def new_state(board, seed: int = 1, players: int = 2) -> GameState:
+    game_random = GameRandom(seed)
+    return GameState.new(board, game_random.sample(range(len(board)), players), game_random)
+
+
+# Random walks up and down the game tree: the incremental hash must match a full recount after
+# every push and undo, and undoing everything must give back the starting position.
+def test_push_undo_keeps_hash(board):
+    rng = random.Random(7)
+    for seed in range(5):
+        state = new_state(board, seed)
+        start = get_snapshot(state)
+        depth = 0
+        for _ in range(400):
+            actions = state.get_legal_actions()
+            if depth and (not actions or state.get_winner() is not None or rng.random() < 0.3):
+                state.undo()
+                depth -= 1
+            elif actions:
+                state.push(rng.choice(actions))
+                depth += 1
+            assert state.territory_hash == state.compute_territory_hash()
+        while depth:
+            state.undo()
+            depth -= 1
+        assert get_snapshot(state) == start
+
+
+def test_apply_keeps_hash(board):
+    state = new_state(board)
+    for _ in play(state, "random"):
+        assert state.territory_hash == state.compute_territory_hash()
+
+
+def test_copy_hashes_the_same(board):
+    state = new_state(board)
+    for _ in zip(range(30), play(state, "random")):
+        pass
+    copy = state.copy()
+    assert get_snapshot(copy) == get_snapshot(state)
+    copy.push(copy.get_legal_actions()[0])
+    copy.undo()
+    assert get_snapshot(copy) == get_snapshot(state)
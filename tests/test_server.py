@@ -0,0 +1,112 @@
+import asyncio
+import random
+
+import pytest
+
+from conftest import get_snapshot
+from src.ai import create_strategy
+from src.client import GameClient, run_bot
+from src.protocol import apply_delta, create_state, decode_message, encode_message
+from src.rules import Board
+from src.server import GameServer, Match
+from src.tournament import NEVER_CANCELLED
+
+
+class FakeWriter:
+    def __init__(self) -> None:
+        self.closed = False
+
+    def is_closing(self) -> bool:
+        return self.closed
+
+
+class FakeConnection:
+    # Stands in for a client connection, keeps what the match sends it.
+    def __init__(self) -> None:
+        self.match = None
+        self.seat = None
+        self.writer = FakeWriter()
+        self.messages = []
+
+    def send(self, message: dict) -> None:
+        self.messages.append(decode_message(encode_message(message)))
+
+
+# The client's copy, built from the start message and patched by deltas batched over a few
+# actions each, must stay equal to the server's state until the match is won.
+@pytest.mark.parametrize("seed", [0, 1, 2, 3, 4, 5])
+def test_deltas_keep_client_in_sync(board, seed):
+    match = Match("sync", board, 2, seed=seed)
+    connections = [FakeConnection(), FakeConnection()]
+    for connection in connections:
+        match.join(connection)
+    start = connections[0].messages[-1]
+    client = create_state(Board.from_dict(start["board"]), start)
+    assert get_snapshot(client) == get_snapshot(match.state)
+
+    strategy = create_strategy("random", random.Random(seed))
+    for count in range(5000):
+        if match.state.get_winner() is not None:
+            break
+        action = strategy.choose_action(match.state, 0.0, NEVER_CANCELLED)
+        assert match.apply(match.state.current_player, action) is None
+        if count % 3 == 0:
+            apply_delta(client, decode_message(encode_message(match.take_delta())))
+            assert get_snapshot(client) == get_snapshot(match.state)
+    assert match.state.get_winner() is not None
+    delta = match.take_delta()
+    if delta is not None:
+        apply_delta(client, decode_message(encode_message(delta)))
+    assert get_snapshot(client) == get_snapshot(match.state)
+    assert client.get_winner() == match.state.get_winner()
+    assert match.take_delta() is None
+
+
+# A player that leaves before the start gives its seat to the next one, the match only starts
+# once every seat has a live player.
+def test_left_seat_is_reused(board):
+    match = Match("seats", board, 3, seed=1)
+    waiting, leaver, late, last = (FakeConnection() for _ in range(4))
+    match.join(waiting)
+    match.join(leaver)
+    leaver.writer.closed = True
+    match.join(late)
+    assert late.seat == leaver.seat and match.state is None
+    match.join(last)
+    assert match.state is not None
+    assert [connection.seat for connection in match.connections] == [0, 1, 2]
+    assert match.connections == [waiting, late, last]
+    assert all(connection.messages[-1]["type"] == "start" for connection in match.connections)
+    last.writer.closed = True
+    assert match.is_full()
+
+
+async def play_bots(board, log_dir) -> list:
+    server = GameServer(board, tick_seconds=0.005, seed=8, log_dir=str(log_dir))
+    await server.start("127.0.0.1", 0)
+    port = server.get_port()
+    try:
+        client = GameClient()
+        await client.connect("127.0.0.1", port)
+        for match, players in (("../escaped", 2), ("ok", 9), ("ok", 1), ("ok", "3"), ("ok", True)):
+            client.send({"type": "join", "match": match, "players": players, "name": "intruder"})
+            assert (await client.receive())["type"] == "error"
+        client.writer.write(b'{"type":"join","match":"ok","players":1e400}\n')
+        assert (await client.receive())["type"] == "error"
+        bots = [
+            run_bot("127.0.0.1", port, f"match-{match}", 2, "greedy", f"bot {match}.{seat}")
+            for match in range(2) for seat in range(2)
+        ]
+        return await asyncio.wait_for(asyncio.gather(*bots), timeout=60)
+    finally:
+        server.tick_task.cancel()
+        server.server.close()
+        await server.server.wait_closed()
+
+
+def test_bots_finish_matches_on_localhost(board, tmp_path):
+    winners = asyncio.run(play_bots(board, tmp_path))
+    assert winners[0] is not None and winners[0] == winners[1]
+    assert winners[2] is not None and winners[2] == winners[3]
+    assert len(list(tmp_path.glob("*-match-*.rlog"))) == 2
+    assert not list(tmp_path.parent.glob("escaped*"))